@@ -4,10 +4,11 @@ from __future__ import print_function
 
 import httplib
 
-from d43_aws_tools import SESHandler
+from d43_aws_tools import SESHandler, S3Handler
 from libraries.tools.url_utils import get_url
 from libraries.lambda_handlers.acceptance_handler import AcceptanceHandler
 from libraries.tools.lambda_utils import wipe_temp
+from libraries.tools.s3_index import S3Index
 
 
 class URLHandler(object):
@@ -31,7 +32,12 @@ def handle(event, context):
         key = record['s3']['object']['key']
         url = 'https://{0}/{1}'.format(bucket_name, key)
 
-        acceptance = AcceptanceHandler(event, context, url, URLHandler, httplib.HTTPConnection, SESHandler)
+        # TRICKY: the catalog is on the api bucket but the files it lists are on the matching cdn bucket
+        cdn_bucket = bucket_name.replace('api.', 'cdn.', 1)
+        s3_index = S3Index(S3Handler(cdn_bucket), [cdn_bucket])
+
+        acceptance = AcceptanceHandler(event, context, url, URLHandler, httplib.HTTPConnection, SESHandler,
+                                       s3_index=s3_index)
         acceptance.run()
         print(acceptance.errors)
         return acceptance.errors
@@ -23,6 +23,11 @@ class AcceptanceHandler(Handler):
         else:
             self.from_email = ''
 
+        if 's3_index' in kwargs:
+            self.s3_index = kwargs['s3_index']
+        else:
+            self.s3_index = None
+
         self.errors = []
         self.ses_handler = SESHandler()
         self.http_connection = HTTPConnection
@@ -33,6 +38,11 @@ class AcceptanceHandler(Handler):
         self.errors.append(message)
 
     def url_exists(self, url):
+        if self.s3_index:
+            # urls in our bucket are answered from the index
+            exists = self.s3_index.url_exists(url)
+            if exists is not None:
+                return exists
         p = urlparse(url)
         conn = self.http_connection(p.netloc)
         conn.request('HEAD', p.path)
@@ -10,8 +10,10 @@ import hashlib
 
 from libraries.lambda_handlers.instance_handler import InstanceHandler
 from d43_aws_tools import S3Handler, SESHandler, DynamoDBHandler
+from libraries.tools.catalog_fragments import CatalogFragments
 from libraries.tools.consistency_checker import ConsistencyChecker
-from libraries.tools.file_utils import write_file
+from libraries.tools.file_utils import write_json_file
+from libraries.tools.s3_index import S3Index
 from libraries.tools.url_utils import get_url, url_exists
 
 
@@ -42,6 +44,8 @@ class CatalogHandler(InstanceHandler):
         self.catalog = {
             "languages": []
         }
+        # TRICKY: maps language identifiers to their node in self.catalog['languages'] for fast lookups
+        self._language_index = {}
         if 's3_handler' in kwargs:
             self.api_handler = kwargs['s3_handler'](self.api_bucket)
         else:
@@ -53,7 +57,10 @@ class CatalogHandler(InstanceHandler):
         if 'consistency_checker' in kwargs:
             self.checker = kwargs['consistency_checker']()
         else:
-            self.checker = ConsistencyChecker(self.cdn_bucket, self.api_bucket) # pragma: no cover
+            s3_index = None
+            if 's3_index_path' in env_vars:
+                s3_index = S3Index(S3Handler(self.cdn_bucket), [self.cdn_bucket], env_vars['s3_index_path'])  # pragma: no cover
+            self.checker = ConsistencyChecker(self.cdn_bucket, self.api_bucket, s3_index=s3_index) # pragma: no cover
         if 'get_url_handler' in kwargs:
             self.get_url = kwargs['get_url_handler']
         else:
@@ -62,6 +69,11 @@ class CatalogHandler(InstanceHandler):
             self.url_exists = kwargs['url_exists_handler']
         else:
             self.url_exists = url_exists # pragma: no cover
+        if 'catalog_fragments_key' in env_vars:
+            # TRICKY: incremental mode only builds the rows that have changed since the last run
+            self.fragments = CatalogFragments(self.api_handler, env_vars['catalog_fragments_key'])
+        else:
+            self.fragments = None
 
     def get_language(self, language):
         """
@@ -69,13 +81,10 @@ class CatalogHandler(InstanceHandler):
         :param language:
         :return:
         """
-        found_lang = None
-        for lang in self.catalog['languages']:
-            if lang['identifier'] == language['identifier']:
-                found_lang = lang
-                break
+        found_lang = self._language_index.get(language['identifier'])
         if not found_lang:
             self.catalog['languages'].append(language)
+            self._language_index[language['identifier']] = language
         else:
             language = found_lang
         if 'resources' not in language:
@@ -85,10 +94,17 @@ class CatalogHandler(InstanceHandler):
     def _run(self):
         completed_items = 0
         items = self.progress_table.query_items()
+        if self.fragments:
+            self.fragments.load()
 
         for item in items:
             repo_name = item['repo_name']
             self.logger.info('Processing {}'.format(repo_name))
+            is_rc = repo_name not in ['catalogs', 'localization', 'versification']
+            # unchanged rows are re-used without decoding their package
+            if is_rc and self.fragments and self._reuse_fragment(item, self.checker, self.fragments):
+                completed_items += 1
+                continue
             try:
                 package = json.loads(item['package'])
             except Exception as e:
@@ -102,7 +118,7 @@ class CatalogHandler(InstanceHandler):
                 # TODO: we have not yet determined what to do with versification
                 pass
             else:
-                if self._build_rc(item, package, self.checker):
+                if self._build_rc(item, package, self.checker, self.fragments):
                     completed_items += 1
 
         # remove empty languages
@@ -111,6 +127,7 @@ class CatalogHandler(InstanceHandler):
             if 'resources' in lang and len(lang['resources']) > 0:
                 condensed_languages.append(lang)
         self.catalog['languages'] = condensed_languages
+        self._language_index = dict((lang['identifier'], lang) for lang in condensed_languages)
 
         response = {
             'success': False,
@@ -119,25 +136,36 @@ class CatalogHandler(InstanceHandler):
             'catalog': self.catalog
         }
 
+        if self.fragments:
+            self.logger.info('Re-used {} unchanged rows'.format(self.fragments.hits))
+            try:
+                self.fragments.save()
+            except Exception as e:
+                self.logger.warning('Unable to save catalog fragments: {0}'.format(e))
+
+        if getattr(self.checker, 's3_index', None):
+            try:
+                self.checker.s3_index.save()
+            except Exception as e:
+                self.logger.warning('Unable to save s3 index: {0}'.format(e))
+
         if completed_items > 0:
             status = self._read_status()
-            if status and status['state'] == 'complete' and not self._catalog_has_changed(self.catalog):
+            catalog_path = os.path.join(tempfile.gettempdir(), 'catalog.json')
+            cat_hash, cat_size = write_json_file(catalog_path, self.catalog, separators=(',', ':'))
+            if status and status['state'] == 'complete' and not self._catalog_has_changed(self.catalog, status, cat_hash):
                 response['success'] = True
                 response['message'] = 'No changes detected. Catalog not deployed'
             else:
-                cat_str = json.dumps(self.catalog, sort_keys=True, separators=(',',':'))
                 try:
-                    catalog_path = os.path.join(tempfile.gettempdir(), 'catalog.json')
-                    write_file(catalog_path, cat_str)
-                    c_stats = os.stat(catalog_path)
-                    self.logger.info('New catalog built: {} Kilobytes'.format(c_stats.st_size * 0.001))
+                    self.logger.info('New catalog built: {} Kilobytes'.format(cat_size * 0.001))
 
                     self.api_handler.upload_file(catalog_path, 'v{0}/catalog.json'.format(self.api_version), cache_time=0)
                     # TRICKY: only mark as complete when there are no errors
                     if len(self.checker.all_errors):
-                        self._publish_status('incomplete')
+                        self._publish_status('incomplete', cat_hash)
                     else:
-                        self._publish_status()
+                        self._publish_status(catalog_hash=cat_hash)
 
                     response['success'] = True
                     response['message'] = 'Uploaded new catalog to {0}/v{1}/catalog.json'.format(self.api_url, self.api_version)
@@ -172,35 +200,62 @@ class CatalogHandler(InstanceHandler):
         else:
             return results[0]
 
-    def _publish_status(self, state='complete'):
+    def _publish_status(self, state='complete', catalog_hash=None):
         """
         Updates the catalog status
         :param state: the state of completion the catalog is in
+        :param catalog_hash: the md5 hash of the published catalog
         :return:
         """
         self.logger.debug('Recording catalog status: "{}"'.format(state))
-        self.status_table.update_item(
-            {'api_version': self.api_version},
-            {
-                'state': state,
-                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ"),
-                'catalog_url': '{0}/v{1}/catalog.json'.format(self.api_url, self.api_version)
-            }
-        )
-
-    def _build_rc(self, item, manifest, checker):
+        status = {
+            'state': state,
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'catalog_url': '{0}/v{1}/catalog.json'.format(self.api_url, self.api_version)
+        }
+        if catalog_hash:
+            status['catalog_hash'] = catalog_hash
+        self.status_table.update_item({'api_version': self.api_version}, status)
+
+    def _reuse_fragment(self, item, checker, fragments):
+        """
+        Adds the saved entry of an unchanged row to the catalog.
+        The row itself passed the consistency checks when the fragment was saved
+        but the urls of the resource are checked again because files may have been removed since.
+        :param item:
+        :param checker:
+        :param CatalogFragments fragments:
+        :return: True if the entry was re-used otherwise the row must be built
+        """
+        fragment = fragments.get(item, lambda resource: all(checker.prefetch(resource).values()))
+        if not fragment:
+            return False
+        language = self.get_language(copy.deepcopy(fragment[0]))
+        language['resources'].append(fragment[1])
+        return True
+
+    def _build_rc(self, item, manifest, checker, fragments=None):
         """
         Builds a RC entry in the catalog.
         :param item:
         :param manifest:
         :param checker:
+        :param CatalogFragments fragments: when given, error free rows are recorded for the next run.
         :return: True if the entry was successfully added otherwise False
         """
+        if fragments:
+            # TRICKY: rows with errors are always built again
+            fragments.discard(item)
+            errors_before = len(checker.all_errors)
+
         errors = checker.check(item)
         if errors:
             return False
+        checker.prefetch(manifest)
         dc = manifest['dublin_core']
         language = dc['language']
+        if fragments:
+            fragment_language = copy.deepcopy(language)
         language = self.get_language(language)  # gets the existing language container or creates a new one
 
         formats = []
@@ -247,6 +302,8 @@ class CatalogHandler(InstanceHandler):
             if 'comment' not in resource: resource['comment'] = ''
 
             language['resources'].append(resource)
+            if fragments and len(checker.all_errors) == errors_before:
+                fragments.put(item, fragment_language, resource)
             return True
 
         return False
@@ -325,20 +382,30 @@ class CatalogHandler(InstanceHandler):
             language = self.get_language(language)  # gets the existing language container or creates a new one
             language.update(localization)
 
-    def _catalog_has_changed(self, catalog):
+    def _catalog_has_changed(self, catalog, status=None, catalog_hash=None):
         """
-        Checks if the catalog has changed compared to the given catalog
+        Checks if the catalog has changed compared to the given catalog.
+        If the status records the hash of the published catalog it is compared
+        instead of downloading the published catalog.
         :param catalog:
+        :param status: the recorded catalog status
+        :param catalog_hash: the md5 hash of the serialized catalog
         :return:
         """
+        if status and catalog_hash and status.get('catalog_hash'):
+            self.logger.debug('Old catalog hash: {}'.format(status['catalog_hash']))
+            self.logger.debug('New catalog hash: {}'.format(catalog_hash))
+            return status['catalog_hash'] != catalog_hash
         try:
             catalog_url = '{0}/v{1}/catalog.json'.format(self.api_url, self.api_version)
             self.logger.debug('Comparing new catalog against old ({})'.format(catalog_url))
             old_catalog_str = self.get_url(catalog_url, True)
-            new_catalog_str = json.dumps(catalog, sort_keys=True, separators=(',',':'))
-
             old_hash = hashlib.md5(old_catalog_str.encode('utf-8')).hexdigest()
-            new_hash = hashlib.md5(new_catalog_str.encode('utf-8')).hexdigest()
+            if catalog_hash:
+                new_hash = catalog_hash
+            else:
+                new_catalog_str = json.dumps(catalog, sort_keys=True, separators=(',',':'))
+                new_hash = hashlib.md5(new_catalog_str.encode('utf-8')).hexdigest()
             self.logger.debug('Old catalog hash: {}'.format(old_hash))
             self.logger.debug('New catalog hash: {}'.format(new_hash))
             return old_hash != new_hash
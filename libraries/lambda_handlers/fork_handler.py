@@ -1,15 +1,19 @@
 import gitea_client as GiteaClient
 import boto3
-import time
-import json
 
 from libraries.lambda_handlers.instance_handler import InstanceHandler
+from libraries.tools.thread_utils import map_concurrent
+from libraries.tools.webhook_dispatcher import WebhookDispatcher
 from d43_aws_tools import DynamoDBHandler
 
 class ForkHandler(InstanceHandler):
     """
     Triggers the webhook lambda if new repositories are found.
     """
+    # the number of branches requested at once
+    max_workers = 8
+    # the number of webhooks triggered each second
+    webhook_rate = 10
 
     def __init__(self, event, context, **kwargs):
         super(ForkHandler, self).__init__(event, context)
@@ -34,6 +38,15 @@ class ForkHandler(InstanceHandler):
             self.boto = boto3  # pragma: no cover
         if 'logger' in kwargs:
             self.logger = kwargs['logger']
+        if 'max_workers' in kwargs:
+            self.max_workers = kwargs['max_workers']
+        elif 'max_workers' in self.stage_vars:
+            self.max_workers = int(self.stage_vars['max_workers'])
+        if 'webhook_rate' in kwargs:
+            self.webhook_rate = kwargs['webhook_rate']
+        elif 'webhook_rate' in self.stage_vars:
+            self.webhook_rate = float(self.stage_vars['webhook_rate'])
+        self.dispatcher_options = kwargs.get('dispatcher_options', {})
 
         self.gogs_api = self.gitea_client.GiteaApi(self.gogs_url)
         self.gogs_auth = self.gitea_client.Token(gogs_token)
@@ -53,28 +66,30 @@ class ForkHandler(InstanceHandler):
         Triggers the webhook in each repo in the list
         :param client boto3.client('lambda'): the lambda client
         :param repos list: an array of repos
-        :return:
+        :return: a dictionary of the dispatched, failed and throttled counts
         """
         if not repos or not len(repos):
             self.logger.info('No new repositories found')
-            return
+            return None
+        jobs = []
         for repo in repos:
             try:
                 payload = self.make_hook_payload(repo)
             except Exception as e:
                 self.logger.error('Failed to retrieve master branch for {0}: {1}'.format(repo.full_name, e))
                 continue
-            try:
-                self.logger.info('Simulating Webhook for {}'.format(repo.full_name))
-                client.invoke(
-                    FunctionName='{}d43-catalog_webhook'.format(self.stage_prefix()),
-                    InvocationType='Event',
-                    Payload=json.dumps(payload)
-                )
-                time.sleep(.5)
-            except Exception as e:
-                self.logger.error('Failed to trigger webhook {0}: {1}'.format(repo.full_name, e))
-                continue
+            self.logger.info('Simulating Webhook for {}'.format(repo.full_name))
+            jobs.append((repo.full_name, payload))
+
+        dispatcher = WebhookDispatcher(client,
+                                       '{}d43-catalog_webhook'.format(self.stage_prefix()),
+                                       rate=self.webhook_rate,
+                                       max_workers=self.max_workers,
+                                       logger=self.logger,
+                                       **self.dispatcher_options)
+        dispatcher.dispatch(jobs)
+        self.logger.info('Webhooks dispatched: {dispatched}, failed: {failed}, throttled: {throttled}'.format(**dispatcher.stats))
+        return dispatcher.stats
 
     def make_hook_payload(self, repo):
         """
@@ -107,37 +122,45 @@ class ForkHandler(InstanceHandler):
         org_repos = self.gogs_api.get_user_repos(None, self.gogs_org)
         items = self.progress_table.query_items()
 
-        new_repos = []
+        # index the progress rows by repo name
+        items_by_name = {}
+        for item in items:
+            items_by_name.setdefault(item['repo_name'], item)
+
+        is_new = {}
+        known_repos = []
         for repo in org_repos:
             repo_name = repo.full_name.split("/")[-1]
-            matching_item = self.__get_obj_in_array('repo_name', repo_name, items)
+            matching_item = items_by_name.get(repo_name)
             if not matching_item or ('dirty' in matching_item and matching_item['dirty']):
-                new_repos.append(repo)
+                is_new[repo.full_name] = True
             else:
-                # check if changed
-                # TODO: the branch API is currently broken so this code won't run
-                try:
-                    branch = self.gogs_api.get_branch(None, self.gogs_org, repo_name, 'master')
-                    if branch:
-                        commit_id = branch.commit.id[:10]
-                        for item in items:
-                            if item['repo_name'] == repo_name and item['commit_id'] != commit_id:
-                                new_repos.append(repo)
-                except Exception as e:
-                    # TRICKY: with the api broken this would create a lot of noise
-                    # print('WARNING: failed to detect changes: {}'.format(e))
-                    pass # pragma: no cover
+                known_repos.append((repo, matching_item))
 
-        return new_repos
+        # check if changed
+        changed = map_concurrent(self._is_changed, known_repos, self.max_workers)
+        for (repo, matching_item), repo_changed in zip(known_repos, changed):
+            is_new[repo.full_name] = repo_changed
 
-    def __get_obj_in_array(self, key, value, array):
+        return [repo for repo in org_repos if is_new[repo.full_name]]
+
+    def _is_changed(self, known_repo):
         """
-        Retrieves the first item in an array if the key matches the value
-        :param key:
-        :param value:
-        :param array:
-        :return:
+        Checks if the master branch of a repo has moved on from the commit that is in progress.
+        This is called for many repos at once.
+        :param tuple known_repo: the repo and its progress row
+        :return: bool
         """
-        for item in array:
-            if item[key] == value: return item
-        return None
\ No newline at end of file
+        repo, item = known_repo
+        repo_name = repo.full_name.split("/")[-1]
+        # TODO: the branch API is currently broken so this code won't run
+        try:
+            branch = self.gogs_api.get_branch(None, self.gogs_org, repo_name, 'master')
+            if branch:
+                commit_id = branch.commit.id[:10]
+                return item['commit_id'] != commit_id
+        except Exception as e:
+            # TRICKY: with the api broken this would create a lot of noise
+            # print('WARNING: failed to detect changes: {}'.format(e))
+            pass # pragma: no cover
+        return False
@@ -16,12 +16,25 @@ from mutagen.mp3 import MP3
 from mutagen.mp4 import MP4
 from libraries.tools.build_utils import get_build_rules
 from libraries.tools.date_utils import unix_to_timestamp, str_to_timestamp
-from libraries.tools.file_utils import ext_to_mime, read_file, write_file, get_mime_from_url, get_remote_file_size
-from libraries.tools.url_utils import url_exists, download_file, url_headers
+from libraries.tools.file_digest import FileDigest
+from libraries.tools.disk_budget import DiskBudget
+from libraries.tools.file_utils import ext_to_mime, read_file, write_file, get_mime_from_url, remove
+from libraries.tools.media_prober import MediaProber
+from libraries.tools.s3_index import S3Index
+from libraries.tools.thread_utils import map_concurrent
+from libraries.tools.url_utils import url_exists, download_file, url_headers, get_client
 
 
 class SigningHandler(InstanceHandler):
     max_file_size = 400000000  # 400mb
+    # larger files are uploaded in parts so their ETag is not the md5 of the file
+    multipart_threshold = 8 * 1024 * 1024
+    # the number of chapters signed at once
+    max_workers = 4
+    # TRICKY: lambda only provides 512MB in /tmp
+    max_disk_bytes = 256 * 1024 * 1024
+    # the disk space reserved for files whose size is unknown
+    default_size_estimate = 32 * 1024 * 1024
 
     def __init__(self, event, context, logger, signer, **kwargs):
         super(SigningHandler, self).__init__(event, context)
@@ -58,6 +71,25 @@ class SigningHandler(InstanceHandler):
             self.url_headers = kwargs['url_headers_handler']
         else:
             self.url_headers = url_headers  # pragma: no cover
+        if 'media_prober' in kwargs:
+            self.media_prober = kwargs['media_prober']
+        else:
+            self.media_prober = MediaProber(get_client())  # pragma: no cover
+        if 'max_workers' in kwargs:
+            self.max_workers = kwargs['max_workers']
+        elif 'max_workers' in env_vars:
+            self.max_workers = int(env_vars['max_workers'])
+        if 'max_disk_bytes' in kwargs:
+            self.max_disk_bytes = kwargs['max_disk_bytes']
+        elif 'max_disk_bytes' in env_vars:
+            self.max_disk_bytes = int(env_vars['max_disk_bytes'])
+        self.disk_budget = DiskBudget(self.max_disk_bytes)
+        if 's3_index' in kwargs:
+            self.s3_index = kwargs['s3_index']
+        elif 's3_index_path' in env_vars:
+            self.s3_index = S3Index(self.cdn_handler, [self.cdn_bucket], env_vars['s3_index_path'])  # pragma: no cover
+        else:
+            self.s3_index = None
 
     def __del__(self):
         shutil.rmtree(self.temp_dir, ignore_errors=True)
@@ -65,15 +97,38 @@ class SigningHandler(InstanceHandler):
     def _safe_url_exists(self, url):
         """
         Safely checks if a url exists.
+        Urls on the cdn are answered from the s3 index when available.
         :param url:
         :return:
         """
         try:
+            if self.s3_index:
+                exists = self.s3_index.url_exists(url)
+                if exists is not None:
+                    return exists
             return self.url_exists(url)
         except Exception as e:
             self.report_error('Failed to read url "{}": {}'.format(url, e.message))
             return False
 
+    def _upload_file(self, path, key, digest=None):
+        """
+        Uploads a file to the cdn and records it in the s3 index
+        :param path:
+        :param key:
+        :param FileDigest digest: the digest of the file if it is already known
+        :return:
+        """
+        self.cdn_handler.upload_file(path, key)
+        if self.s3_index:
+            if digest:
+                etag = None
+                if digest.size < SigningHandler.multipart_threshold:
+                    etag = digest.md5
+                self.s3_index.add(key, digest.size, etag)
+            else:
+                self.s3_index.add(key, os.path.getsize(path))
+
     def _run(self):
         items = self.db_handler.query_items({
             'signed': False
@@ -98,6 +153,8 @@ class SigningHandler(InstanceHandler):
             self.report_error('Failed processing an item: {}'.format(e.message))
             raise Exception, Exception(e), sys.exc_info()[2]
         finally:
+            if self.s3_index:
+                self.s3_index.save()
             if os.path.isdir(self.temp_dir):
                 shutil.rmtree(self.temp_dir, ignore_errors=True)
 
@@ -127,17 +184,14 @@ class SigningHandler(InstanceHandler):
                     # process format chapters
                     if 'chapters' in format:
                         sanitized_chapters = []
-                        for chapter in format['chapters']:
-                            # TRICKY: only process/keep chapters that actually have a valid url
-                            if 'url' not in chapter or not self._safe_url_exists(chapter['url']):
-                                if 'url' not in chapter:
-                                    missing_url = 'empty url'
-                                else:
-                                    missing_url = chapter['url']
-                                self.logger.warning('Skipping chapter {}:{} missing url {}'.format(project['identifier'], chapter['identifier'], missing_url))
+                        results = map_concurrent(
+                            lambda chapter: self._process_chapter(item, package['dublin_core'], project, chapter),
+                            format['chapters'], self.max_workers)
+                        for chapter, result in zip(format['chapters'], results):
+                            if result is None:
                                 continue
 
-                            (already_signed, newly_signed) = self.process_format(item, package['dublin_core'], project, chapter)
+                            (already_signed, newly_signed) = result
                             sanitized_chapters.append(chapter)
                             if newly_signed:
                                 was_signed = True
@@ -160,6 +214,27 @@ class SigningHandler(InstanceHandler):
                 'signed': fully_signed
             })
 
+    def _process_chapter(self, item, dublin_core, project, chapter):
+        """
+        Signs a chapter of a project format.
+        This is called for many chapters at once.
+        :param item:
+        :param dublin_core:
+        :param project:
+        :param chapter:
+        :return: (already_signed, newly_signed) or None if the chapter should be skipped
+        """
+        # TRICKY: only process/keep chapters that actually have a valid url
+        if 'url' not in chapter or not self._safe_url_exists(chapter['url']):
+            if 'url' not in chapter:
+                missing_url = 'empty url'
+            else:
+                missing_url = chapter['url']
+            self.logger.warning('Skipping chapter {}:{} missing url {}'.format(project['identifier'], chapter['identifier'], missing_url))
+            return None
+
+        return self.process_format(item, dublin_core, project, chapter)
+
     def process_format(self, item, dublin_core, project, format):
         """
         Performs the signing on the format object.
@@ -171,6 +246,10 @@ class SigningHandler(InstanceHandler):
         :return: (already_signed, newly_signed)
         """
         if 'signature' in format and format['signature']:
+            # TRICKY: formats signed before their size was recorded are completed without downloading them.
+            # Once the size is known they are not probed again, even if the length could not be read.
+            if not format.get('size'):
+                self._probe_media(format)
             return (True, False)
         else:
             self.logger.debug('Signing {}'.format(format['url']))
@@ -209,12 +288,12 @@ class SigningHandler(InstanceHandler):
                 quality = format['quality']
             format['format'] = get_mime_from_url(format['url'], quality)
 
-        # make sure all formats with a media mime type have a size
-        if ('size' not in format or not format['size']) and 'url' in format and 'format' in format and format['format']:
-            format['size'] = get_remote_file_size(format['url'])
-
         # verify url is on the cdn
         if not url_info.hostname in valid_hosts:
+            # make sure all formats with a media mime type have a size
+            if 'url' in format and 'format' in format and format['format']:
+                self._probe_media(format)
+
             # TODO: external media should be imported if it's not too big
             # This allows media to be hosted on third party servers
             format['signature'] = '' #'{}.sig'.format(format['url'])
@@ -238,7 +317,7 @@ class SigningHandler(InstanceHandler):
                 sig_file = '{}.sig'.format(file_to_sign)
                 write_file(sig_file, [{'si': 'uW', 'sig': ''}])
                 format['signature'] = sig_url
-                self.cdn_handler.upload_file(sig_file, sig_key)
+                self._upload_file(sig_file, sig_key)
 
                 if not format['modified']:
                     format['modified'] = str_to_timestamp(datetime.datetime.now().isoformat())
@@ -257,95 +336,142 @@ class SigningHandler(InstanceHandler):
 
             # finish with manually uploaded signature
             format['size'] = size
+            self._probe_media(format)
             if not format['modified']:
                 format['modified'] = str_to_timestamp(datetime.datetime.now().isoformat())
             format['signature'] = sig_url
             return (False, True)
 
-        # download file
-        try:
-            if 'sign_given_url' in build_rules or 'html_format' in build_rules:
-                # report error if response is 400+
-                if headers.status >= 400:
-                    self.logger.warning('Resource not available at {}'.format(format['url']))
+        # TRICKY: chapters are signed concurrently so their downloads must fit in the temp directory together
+        estimate = size if headers.status < 400 else 0
+        with self.disk_budget.reserve(estimate or SigningHandler.default_size_estimate):
+            try:
+                # download file
+                digest = None
+                try:
+                    if 'sign_given_url' in build_rules or 'html_format' in build_rules:
+                        # report error if response is 400+
+                        if headers.status >= 400:
+                            self.logger.warning('Resource not available at {}'.format(format['url']))
+                            return (False, False)
+
+                        digest = self.download_file(format['url'], file_to_sign)
+                    else:
+                        # TRICKY: most files to be signed are stored in a temp directory
+                        src_temp_key = 'temp/{}/{}/{}'.format(item['repo_name'], item['commit_id'], src_key)
+                        self.cdn_handler.download_file(src_temp_key, file_to_sign)
+                except Exception as e:
+                    self.report_error('The file "{}" could not be downloaded: {}'.format(base_name, e))
                     return (False, False)
 
-                self.download_file(format['url'], file_to_sign)
-            else:
-                # TRICKY: most files to be signed are stored in a temp directory
-                src_temp_key = 'temp/{}/{}/{}'.format(item['repo_name'], item['commit_id'], src_key)
-                self.cdn_handler.download_file(src_temp_key, file_to_sign)
-        except Exception as e:
-            self.report_error('The file "{}" could not be downloaded: {}'.format(base_name, e))
-            return (False, False)
+                # strip print script from html
+                if 'html_format' in build_rules:
+                    self.logger.debug('Removing print script from {} html'.format(item['repo_name']))
+                    self._strip_print_script(file_to_sign)
+                    digest = None
 
-        # strip print script from html
-        if 'html_format' in build_rules:
-            self.logger.debug('Removing print script from {} html'.format(item['repo_name']))
-            self._strip_print_script(file_to_sign)
+                # TRICKY: files downloaded from s3 have not been hashed yet so they are read once here
+                if not isinstance(digest, FileDigest):
+                    digest = FileDigest.from_file(file_to_sign)
 
-        # sign file
-        sig_file = self.signer.sign_file(file_to_sign)
+                # sign file
+                sig_file = self.signer.sign_file(file_to_sign, digest=digest.sha384)
+                try:
+                    self.signer.verify_signature(file_to_sign, sig_file, digest=digest.sha384)
+                except RuntimeError:
+                    if self.logger:
+                        self.logger.warning('The signature was not successfully verified.')
+                    return (False, False)
+
+                # TRICKY: re-format html urls
+                if 'html_format' in build_rules:
+                    html_name = dublin_core['identifier']
+                    if project:
+                        html_name = project['identifier']
+                    src_key = '{}/{}/v{}/media/html/{}.html'.format(dublin_core['language']['identifier'], dublin_core['identifier'], self.api_version, html_name)
+                    sig_key = '{}.sig'.format(src_key)
+                    format['url'] = '{}/{}'.format(self.cdn_url, src_key)
+
+                # upload files
+                if 'sign_given_url' not in build_rules or 'html_format' in build_rules:
+                    # TRICKY: upload temp files to production
+                    self._upload_file(file_to_sign, src_key, digest)
+                self._upload_file(sig_file, sig_key)
+
+                # add the url of the sig file to the format
+                format['signature'] = '{}.sig'.format(format['url'])
+
+                # read modified date from file
+                if not format['modified']:
+                    modified = headers.get('last-modified')
+                    if modified:
+                        # TRICKY: http header gives an odd date format
+                        date = datetime.datetime.strptime(modified, '%a, %d %b %Y %H:%M:%S %Z')
+                        modified = str_to_timestamp(date.isoformat())
+                    else:
+                        modified = unix_to_timestamp(os.path.getmtime(file_to_sign))
+                    format['modified'] = modified
+                format['size'] = digest.size
+
+                # retrieve playback time from multimedia files
+                _, ext = os.path.splitext(file_to_sign)
+                if ext == '.mp3':
+                    audio = MP3(file_to_sign)
+                    format['length'] = audio.info.length
+                elif ext == '.mp4':
+                    video = MP4(file_to_sign)
+                    format['length'] = video.info.length
+
+                # add file format if missing
+                if not 'format' in format or not format['format']:
+                    try:
+                        mime = ext_to_mime(ext)
+                        format['format'] = mime
+                    except Exception as e:
+                        if self.logger:
+                            self.logger.error(e.message)
+
+                return (False, True)
+            finally:
+                # clean up disk space
+                remove(file_to_sign)
+
+    def _probe_media(self, format):
+        """
+        Fills in the missing size and playback length of a format from the remote file
+        without downloading all of it.
+        Hosts that do not support range requests only provide the size from the Content-Length header.
+        If the file cannot be read the format is left as it is.
+        :param format:
+        :return:
+        """
+        if 'url' not in format or not format['url']:
+            return
+        _, ext = os.path.splitext(urlparse.urlparse(format['url']).path)
+        needs_length = ext in ('.mp3', '.mp4') and not format.get('length')
+        needs_size = not format.get('size')
+        if not needs_length and not needs_size:
+            return
         try:
-            self.signer.verify_signature(file_to_sign, sig_file)
-        except RuntimeError:
-            if self.logger:
-                self.logger.warning('The signature was not successfully verified.')
-            return (False, False)
+            info = self.media_prober.probe(format['url'], length=needs_length)
+        except Exception as e:
+            self.logger.warning('Could not read the media info of {}: {}'.format(format['url'], e))
+            info = {}
 
-        # TRICKY: re-format html urls
-        if 'html_format' in build_rules:
-            html_name = dublin_core['identifier']
-            if project:
-                html_name = project['identifier']
-            src_key = '{}/{}/v{}/media/html/{}.html'.format(dublin_core['language']['identifier'], dublin_core['identifier'], self.api_version, html_name)
-            sig_key = '{}.sig'.format(src_key)
-            format['url'] = '{}/{}'.format(self.cdn_url, src_key)
-
-        # upload files
-        if 'sign_given_url' not in build_rules or 'html_format' in build_rules:
-            # TRICKY: upload temp files to production
-            self.cdn_handler.upload_file(file_to_sign, src_key)
-        self.cdn_handler.upload_file(sig_file, sig_key)
-
-        # add the url of the sig file to the format
-        format['signature'] = '{}.sig'.format(format['url'])
-
-        # read modified date from file
-        stats = os.stat(file_to_sign)
-        if not format['modified']:
-            modified = headers.get('last-modified')
-            if modified:
-                # TRICKY: http header gives an odd date format
-                date = datetime.datetime.strptime(modified, '%a, %d %b %Y %H:%M:%S %Z')
-                modified = str_to_timestamp(date.isoformat())
-            else:
-                modified = unix_to_timestamp(stats.st_mtime)
-            format['modified'] = modified
-        format['size'] = stats.st_size
-
-        # retrieve playback time from multimedia files
-        _, ext = os.path.splitext(file_to_sign)
-        if ext == '.mp3':
-            audio = MP3(file_to_sign)
-            format['length'] = audio.info.length
-        elif ext == '.mp4':
-            video = MP4(file_to_sign)
-            format['length'] = video.info.length
-
-        # add file format if missing
-        if not 'format' in format or not format['format']:
+        if needs_size and not info.get('size'):
             try:
-                mime = ext_to_mime(ext)
-                format['format'] = mime
+                headers = self.url_headers(format['url'])
+                if headers.status < 400:
+                    info['size'] = int(headers.get('content-length', 0))
             except Exception as e:
-                if self.logger:
-                    self.logger.error(e.message)
-
-        # clean up disk space
-        os.remove(file_to_sign)
-
-        return (False, True)
+                self.logger.warning('Could not read the size of {}: {}'.format(format['url'], e))
+
+        if needs_size and info.get('size'):
+            format['size'] = info['size']
+        if 'length' in info:
+            format['length'] = info['length']
+        if not format.get('format'):
+            format['format'] = get_mime_from_url(format['url'], format.get('quality', ''))
 
     @staticmethod
     def _strip_print_script(file_to_sign):
@@ -22,6 +22,9 @@ class StatusHandler(Handler):
 
         # load catalog status
         for api in api_status:
+            # skip the records that only hold extra data for a catalog such as processed shards and timings
+            if 'state' not in api:
+                continue
             status = self.make_function_status(api['api_version'], errors)
             # catalogs have their own status and timestamp
             status['status'] = api['state']
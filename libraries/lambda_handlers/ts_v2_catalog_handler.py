@@ -11,6 +11,7 @@ import os
 import re
 import shutil
 import tempfile
+import threading
 import time
 import sys
 import urlparse
@@ -21,12 +22,20 @@ import csv
 
 from libraries.lambda_handlers.handler import Handler
 from d43_aws_tools import S3Handler, DynamoDBHandler
-from libraries.tools.file_utils import read_file, download_rc, remove, get_subdirs, remove_tree
+from libraries.tools.file_utils import read_file, download_rc, get_subdirs, remove_tree
+from libraries.tools.lambda_utils import context_sec_remaining
 from libraries.tools.legacy_utils import index_obs
+from libraries.tools.process_utils import imap_processes
+from libraries.tools.processed_set import load_processed
+from libraries.tools.rc_cache import RCCache
+from libraries.tools.status_checkpoint import StatusCheckpoint
+from libraries.tools.thread_utils import map_concurrent
+from libraries.tools.upload_queue import UploadQueue, list_s3_etags
 from libraries.tools.url_utils import download_file, get_url, url_exists
-from libraries.tools.ts_v2_utils import convert_rc_links, build_json_source_from_usx, make_legacy_date, \
-    max_modified_date, get_rc_type, build_usx, prep_data_upload, date_is_older, max_long_modified_date, \
-    get_project_from_manifest, index_chunks, tn_tsv_to_json
+from libraries.tools.work_planner import WorkPlanner, TimeBudgetExceeded
+from libraries.tools.ts_v2_utils import convert_rc_links, build_book_source, make_legacy_date, \
+    max_modified_date, get_rc_type, prep_data_upload, date_is_older, max_long_modified_date, \
+    get_project_from_manifest, tn_tsv_to_json, pad_to_match, chunk_registry
 
 from libraries.lambda_handlers.instance_handler import InstanceHandler
 
@@ -34,6 +43,11 @@ from libraries.lambda_handlers.instance_handler import InstanceHandler
 class TsV2CatalogHandler(InstanceHandler):
     cdn_root_path = 'v2/ts'
     api_version = 'ts.2'
+    max_workers = 4
+    # the number of books that are converted to usx at once
+    usx_workers = 2
+    # the number of seconds a single book may take to convert
+    usx_timeout = 300
 
     def __init__(self, event, context, logger, **kwargs):
         super(TsV2CatalogHandler, self).__init__(event, context)
@@ -67,8 +81,44 @@ class TsV2CatalogHandler(InstanceHandler):
             self.url_exists = kwargs['url_exists_handler']
         else:
             self.url_exists = url_exists  # pragma: no cover
+        if 'max_workers' in kwargs:
+            self.max_workers = kwargs['max_workers']
+        elif 'max_workers' in env_vars:
+            self.max_workers = int(env_vars['max_workers'])
+        if 'usx_workers' in kwargs:
+            self.usx_workers = kwargs['usx_workers']
+        elif 'usx_workers' in env_vars:
+            self.usx_workers = int(env_vars['usx_workers'])
+        if 'usx_timeout' in kwargs:
+            self.usx_timeout = kwargs['usx_timeout']
+        elif 'usx_timeout' in env_vars:
+            self.usx_timeout = int(env_vars['usx_timeout'])
+
+        if 'upload_etags' in kwargs:
+            upload_etags = kwargs['upload_etags']
+        elif env_vars.get('skip_unchanged_uploads'):
+            upload_etags = list_s3_etags(self.cdn_handler, TsV2CatalogHandler.cdn_root_path)  # pragma: no cover
+        else:
+            upload_etags = None
+        self.upload_queue = UploadQueue(self.cdn_handler, self.max_workers, upload_etags, self.logger)
+        self.checkpoint = None
+        self.planner = None
+        # TRICKY: records if the language being processed in each thread finished any processes
+        self._language_state = threading.local()
 
         self.temp_dir = tempfile.mkdtemp('', 'tsv2', None)
+        # TRICKY: the same RC is read by several processes so we keep the extracted files around
+        if 'chunk_registry' in kwargs:
+            self.chunk_registry = kwargs['chunk_registry']
+        else:
+            self.chunk_registry = chunk_registry
+        if 'chunks_dir' in env_vars:
+            # TRICKY: pre-load chunks bundled with the lambda so they are not downloaded
+            self.chunk_registry.load_snapshot(env_vars['chunks_dir'])
+        if 'rc_cache' in kwargs:
+            self.rc_cache = kwargs['rc_cache']
+        else:
+            self.rc_cache = RCCache(os.path.join(self.temp_dir, 'rc_cache'))
 
     def __del__(self):
         try:
@@ -84,7 +134,12 @@ class TsV2CatalogHandler(InstanceHandler):
         try:
             self.logger.debug('Temp directory {} contents {}'.format('/tmp', get_subdirs('/tmp/')))
             return self.__execute()
+        except TimeBudgetExceeded as e:
+            self.logger.info('{}. The catalog will be finished by the next run'.format(e))
+            self._save_progress()
+            return False
         except Exception as e:
+            self._save_progress()
             self.report_error(e.message)
             raise Exception, Exception(e), sys.exc_info()[2]
 
@@ -98,6 +153,13 @@ class TsV2CatalogHandler(InstanceHandler):
             return False
         else:
             (self.status, source_status) = result
+        # TRICKY: the status is only written every so often because it grows with every finished process
+        self.checkpoint = StatusCheckpoint(self.db_handler, {'api_version': TsV2CatalogHandler.api_version},
+                                           self.status, check_abort=True, before_write=self.upload_queue.wait_all,
+                                           sec_remaining=lambda: context_sec_remaining(self.context))
+        self.planner = WorkPlanner(self.db_handler, {'api_version': TsV2CatalogHandler.api_version},
+                                   sec_remaining=lambda: context_sec_remaining(self.context))
+        self.planner.load()
 
         # check if build is complete
         if self.status['state'] == 'complete':
@@ -120,156 +182,27 @@ class TsV2CatalogHandler(InstanceHandler):
             return False
 
         # walk v3 catalog
-        for lang in self.latest_catalog['languages']:
-            lid = TsV2CatalogHandler.sanitize_identifier(lang['identifier'], lower=False)
-            # DEBUG
-            # if lid != 'hi':
-            #     continue
-            self.logger.info('Inspecting {}'.format(lid))
-            for res in lang['resources']:
-                rid = TsV2CatalogHandler.sanitize_identifier(res['identifier'])
-                self.logger.info('Inspecting {}_{}'.format(lid, rid))
-
-                rc_format = None
-
-                self.logger.debug('Temp directory {} contents {}'.format(self.temp_dir, get_subdirs(self.temp_dir)))
-                res_temp_dir = os.path.join(self.temp_dir, lid, rid)
-                os.makedirs(res_temp_dir)
-
-                if 'formats' in res:
-                    for format in res['formats']:
-                        finished_processes = {}
-                        if not rc_format and get_rc_type(format):
-                            # locate rc_format (for multi-project RCs)
-                            rc_format = format
-
-                        self._process_usfm(lid, rid, res, format, res_temp_dir)
-
-                        # TRICKY: bible notes and questions are in the resource
-                        if rid != 'obs':
-                            process_id = '_'.join([lid, rid, 'notes'])
-                            if process_id not in self.status['processed']:
-                                tn = self._index_note_files(lid, rid, res, format, process_id, res_temp_dir)
-                                if tn:
-                                    self._upload_all(tn)
-                                    finished_processes[process_id] = tn.keys()
-                                    cat_keys = cat_keys + tn.keys()
-                            else:
-                                cat_keys = cat_keys + self.status['processed'][process_id]
-
-                            process_id = '_'.join([lid, rid, 'questions'])
-                            if process_id not in self.status['processed']:
-                                tq = self._index_question_files(lid, rid, res, format, process_id, res_temp_dir)
-                                if tq:
-                                    self._upload_all(tq)
-                                    finished_processes[process_id] = tq.keys()
-                                    cat_keys = cat_keys + tq.keys()
-                            else:
-                                cat_keys = cat_keys + self.status['processed'][process_id]
-
-                        # TRICKY: update the finished processes once per format to limit db hits
-                        if finished_processes:
-                            self.status['processed'].update(finished_processes)
-                            self._set_status()
-
-                for project in res['projects']:
-                    pid = TsV2CatalogHandler.sanitize_identifier(project['identifier'])
-                    # DEBUG
-                    # if pid != 'tit' and rid != 'tw':
-                    #     continue
-                    if 'formats' in project:
-                        for format in project['formats']:
-                            finished_processes = {}
-                            if not rc_format and get_rc_type(format):
-                                # locate rc_format (for single-project RCs)
-                                rc_format = format
-
-                            # TRICKY: there should only be a single tW for each language
-                            process_id = '_'.join([lid, 'words'])
-                            if process_id not in self.status['processed']:
-                                tw = self._index_words_files(lid, rid, res, format, process_id, res_temp_dir)
-                                if tw:
-                                    self._upload_all(tw)
-                                    finished_processes[process_id] = tw.keys()
-                                    cat_keys = cat_keys + tw.keys()
-                            else:
-                                cat_keys = cat_keys + self.status['processed'][process_id]
-
-                            if rid == 'obs':
-                                process_id = '_'.join([lid, rid, pid])
-                                if process_id not in self.status['processed']:
-                                    if self._has_resource_changed('obs', lid, rid, format['modified']):
-                                        self.logger.info('Processing {}'.format(process_id))
-                                        obs_json = index_obs(lid, rid, format, res_temp_dir, self.download_file)
-                                        upload = prep_data_upload(
-                                            '{}/{}/{}/v{}/source.json'.format(pid, lid, rid, res['version']),
-                                            obs_json, res_temp_dir)
-                                        self._upload(upload)
-                                    else:
-                                        self.logger.debug(
-                                            'Skipping OBS {0}-{1} because it hasn\'t changed'.format(lid, rid))
-                                    finished_processes[process_id] = []
-                                else:
-                                    cat_keys = cat_keys + self.status['processed'][process_id]
-
-                            # TRICKY: obs notes and questions are in the project
-                            process_id = '_'.join([lid, rid, pid, 'notes'])
-                            if process_id not in self.status['processed']:
-                                tn = self._index_note_files(lid, rid, res, format, process_id, res_temp_dir)
-                                if tn:
-                                    self._upload_all(tn)
-                                    finished_processes[process_id] = tn.keys()
-                                    cat_keys = cat_keys + tn.keys()
-                            else:
-                                cat_keys = cat_keys + self.status['processed'][process_id]
-
-                            process_id = '_'.join([lid, rid, pid, 'questions'])
-                            if process_id not in self.status['processed']:
-                                tq = self._index_question_files(lid, rid, res, format, process_id, res_temp_dir)
-                                if tq:
-                                    self._upload_all(tq)
-                                    finished_processes[process_id] = tq.keys()
-                                    cat_keys = cat_keys + tq.keys()
-                            else:
-                                cat_keys = cat_keys + self.status['processed'][process_id]
-
-                            # TRICKY: update the finished processes once per format to limit db hits
-                            if finished_processes:
-                                self.status['processed'].update(finished_processes)
-                                self._set_status()
-
-                    if not rc_format:
-                        raise Exception('Could not find a format for {}_{}_{}'.format(lid, rid, pid))
-
-                    modified = make_legacy_date(rc_format['modified'])
-                    long_modified = rc_format['modified']
-                    rc_type = get_rc_type(rc_format)
-
-                    if modified is None:
-                        modified = time.strftime('%Y%m%d')
-                        self.logger.warning('Could not find date modified for {}_{}_{} from "{}"'.format(lid, rid, pid,
-                                                                                                         rc_format[
-                                                                                                             'modified']))
-                    if long_modified is None:
-                        long_modified = modified
-
-                    if rc_type == 'book' or rc_type == 'bundle':
-                        self._build_catalog_node(cat_dict, lang, res, project, modified, long_modified)
-                    else:
-                        # store supplementary resources for processing after catalog nodes have been fully built
-                        supplemental_resources.append({
-                            'language': lang,
-                            'resource': res,
-                            'project': project,
-                            'modified': modified,
-                            'long_modified': long_modified,
-                            'rc_type': rc_type
-                        })
-
-                # cleanup resource directory
-                remove_tree(res_temp_dir)
-            # cleanup language directory
-            remove_tree(os.path.join(self.temp_dir, lid))
+        # TRICKY: languages are processed concurrently but merged in catalog order so the output is deterministic
+        # TRICKY: the longest languages are started first and languages that will not finish in time are left
+        # for the next run. The results are put back in catalog order.
+        languages = self.latest_catalog['languages']
+        finished = [lang['identifier'] for lang in languages
+                    if self._is_processed(self._language_process_id(lang['identifier']))]
+        planned = self.planner.plan([lang['identifier'] for lang in languages], self.max_workers, finished)
+        order = dict((identifier, index) for index, identifier in enumerate(planned))
+        planned_languages = sorted([lang for lang in languages if lang['identifier'] in order],
+                                   key=lambda lang: order[lang['identifier']])
+        results = map_concurrent(self._process_planned_language, planned_languages, self.max_workers)
+        if self.planner.deferred:
+            raise TimeBudgetExceeded('Not enough time left to process {} languages'.format(len(self.planner.deferred)))
+        catalog_order = dict((lang['identifier'], index) for index, lang in enumerate(languages))
+        results = [r for lang, r in sorted(zip(planned_languages, results),
+                                           key=lambda pair: catalog_order[pair[0]['identifier']])]
+        for lang_keys, catalog_nodes, lang_supplements in results:
+            cat_keys = cat_keys + lang_keys
+            for node in catalog_nodes:
+                self._build_catalog_node(cat_dict, *node)
+            supplemental_resources = supplemental_resources + lang_supplements
         # inject supplementary resources
         for s in supplemental_resources:
             self._add_supplement(cat_dict, s['language'], s['resource'], s['project'], s['modified'], s['rc_type'])
@@ -330,10 +263,248 @@ class TsV2CatalogHandler(InstanceHandler):
                 key = '{}/{}'.format(TsV2CatalogHandler.cdn_root_path, upload['key'])
             else:
                 key = upload['key'].lstrip('/')
-            self.cdn_handler.upload_file(upload['path'], key)
+            self.upload_queue.put(upload['path'], key)
+        self.upload_queue.flush()
 
         self.status['state'] = 'complete'
         self._set_status()
+        self.planner.save()
+
+    def _process_planned_language(self, lang):
+        """
+        Processes a language and records how long it took if any of its processes were run
+        :param lang: the v3 language catalog object
+        :return: see _process_language
+        """
+        self.planner.begin(lang['identifier'])
+        self._language_state.worked = False
+        result = self._process_language(lang)
+        if self._language_state.worked:
+            self.planner.end(lang['identifier'])
+        else:
+            self.planner.cancel(lang['identifier'])
+        # TRICKY: later runs only need to collect the results of this language so the planner treats it as free
+        process_id = self._language_process_id(lang['identifier'])
+        if not self._is_processed(process_id):
+            self.checkpoint.mark_processed({process_id: []})
+        return result
+
+    @staticmethod
+    def _language_process_id(identifier):
+        """
+        Returns the process id that records that every process in a language has finished
+        :param identifier: the language identifier
+        :return:
+        """
+        lid = TsV2CatalogHandler.sanitize_identifier(identifier, lower=False)
+        return '_'.join([lid, '*', 'language'])
+
+    def _process_language(self, lang):
+        """
+        Processes all of the resources in a language.
+        This is safe to run concurrently with other languages because all of the
+        process ids and temp directories are namespaced by the language id.
+        :param lang: the v3 language catalog object
+        :return: a tuple containing the catalog keys, the arguments for building the catalog nodes,
+        and the supplementary resources found in this language
+        """
+        cat_keys = []
+        catalog_nodes = []
+        supplemental_resources = []
+
+        lid = TsV2CatalogHandler.sanitize_identifier(lang['identifier'], lower=False)
+        # DEBUG
+        # if lid != 'hi':
+        #     return cat_keys, catalog_nodes, supplemental_resources
+        self.logger.info('Inspecting {}'.format(lid))
+        for res in lang['resources']:
+            rid = TsV2CatalogHandler.sanitize_identifier(res['identifier'])
+            self.logger.info('Inspecting {}_{}'.format(lid, rid))
+
+            rc_format = None
+
+            self.logger.debug('Temp directory {} contents {}'.format(self.temp_dir, get_subdirs(self.temp_dir)))
+            res_temp_dir = os.path.join(self.temp_dir, lid, rid)
+            os.makedirs(res_temp_dir)
+
+            if 'formats' in res:
+                for format in res['formats']:
+                    finished_processes = {}
+                    if not rc_format and get_rc_type(format):
+                        # locate rc_format (for multi-project RCs)
+                        rc_format = format
+
+                    self._process_usfm(lid, rid, res, format, res_temp_dir)
+
+                    # TRICKY: bible notes and questions are in the resource
+                    if rid != 'obs':
+                        process_id = '_'.join([lid, rid, 'notes'])
+                        if not self._is_processed(process_id):
+                            tn = self._index_note_files(lid, rid, res, format, process_id, res_temp_dir)
+                            if tn:
+                                self._upload_all(tn)
+                                finished_processes[process_id] = tn.keys()
+                                cat_keys = cat_keys + tn.keys()
+                        else:
+                            cat_keys = cat_keys + self._get_processed(process_id)
+
+                        process_id = '_'.join([lid, rid, 'questions'])
+                        if not self._is_processed(process_id):
+                            tq = self._index_question_files(lid, rid, res, format, process_id, res_temp_dir)
+                            if tq:
+                                self._upload_all(tq)
+                                finished_processes[process_id] = tq.keys()
+                                cat_keys = cat_keys + tq.keys()
+                        else:
+                            cat_keys = cat_keys + self._get_processed(process_id)
+
+                    # TRICKY: update the finished processes once per format to limit db hits
+                    if finished_processes:
+                        self._mark_processed(finished_processes)
+
+            for project in res['projects']:
+                pid = TsV2CatalogHandler.sanitize_identifier(project['identifier'])
+                # DEBUG
+                # if pid != 'tit' and rid != 'tw':
+                #     continue
+                if 'formats' in project:
+                    for format in project['formats']:
+                        finished_processes = {}
+                        if not rc_format and get_rc_type(format):
+                            # locate rc_format (for single-project RCs)
+                            rc_format = format
+
+                        # TRICKY: there should only be a single tW for each language
+                        process_id = '_'.join([lid, 'words'])
+                        if not self._is_processed(process_id):
+                            tw = self._index_words_files(lid, rid, res, format, process_id, res_temp_dir)
+                            if tw:
+                                self._upload_all(tw)
+                                finished_processes[process_id] = tw.keys()
+                                cat_keys = cat_keys + tw.keys()
+                        else:
+                            cat_keys = cat_keys + self._get_processed(process_id)
+
+                        if rid == 'obs':
+                            process_id = '_'.join([lid, rid, pid])
+                            if not self._is_processed(process_id):
+                                if self._has_resource_changed('obs', lid, rid, format['modified']):
+                                    self.logger.info('Processing {}'.format(process_id))
+                                    obs_json = index_obs(lid, rid, format, res_temp_dir, self.download_file,
+                                                         self.rc_cache)
+                                    upload = prep_data_upload(
+                                        '{}/{}/{}/v{}/source.json'.format(pid, lid, rid, res['version']),
+                                        obs_json, res_temp_dir)
+                                    self._upload(upload)
+                                else:
+                                    self.logger.debug(
+                                        'Skipping OBS {0}-{1} because it hasn\'t changed'.format(lid, rid))
+                                finished_processes[process_id] = []
+                            else:
+                                cat_keys = cat_keys + self._get_processed(process_id)
+
+                        # TRICKY: obs notes and questions are in the project
+                        process_id = '_'.join([lid, rid, pid, 'notes'])
+                        if not self._is_processed(process_id):
+                            tn = self._index_note_files(lid, rid, res, format, process_id, res_temp_dir)
+                            if tn:
+                                self._upload_all(tn)
+                                finished_processes[process_id] = tn.keys()
+                                cat_keys = cat_keys + tn.keys()
+                        else:
+                            cat_keys = cat_keys + self._get_processed(process_id)
+
+                        process_id = '_'.join([lid, rid, pid, 'questions'])
+                        if not self._is_processed(process_id):
+                            tq = self._index_question_files(lid, rid, res, format, process_id, res_temp_dir)
+                            if tq:
+                                self._upload_all(tq)
+                                finished_processes[process_id] = tq.keys()
+                                cat_keys = cat_keys + tq.keys()
+                        else:
+                            cat_keys = cat_keys + self._get_processed(process_id)
+
+                        # TRICKY: update the finished processes once per format to limit db hits
+                        if finished_processes:
+                            self._mark_processed(finished_processes)
+
+                if not rc_format:
+                    raise Exception('Could not find a format for {}_{}_{}'.format(lid, rid, pid))
+
+                modified = make_legacy_date(rc_format['modified'])
+                long_modified = rc_format['modified']
+                rc_type = get_rc_type(rc_format)
+
+                if modified is None:
+                    modified = time.strftime('%Y%m%d')
+                    self.logger.warning('Could not find date modified for {}_{}_{} from "{}"'.format(lid, rid, pid,
+                                                                                                     rc_format[
+                                                                                                         'modified']))
+                if long_modified is None:
+                    long_modified = modified
+
+                if rc_type == 'book' or rc_type == 'bundle':
+                    # TRICKY: catalog nodes are built after all languages finish so the merge order is stable
+                    catalog_nodes.append((lang, res, project, modified, long_modified))
+                else:
+                    # store supplementary resources for processing after catalog nodes have been fully built
+                    supplemental_resources.append({
+                        'language': lang,
+                        'resource': res,
+                        'project': project,
+                        'modified': modified,
+                        'long_modified': long_modified,
+                        'rc_type': rc_type
+                    })
+
+            # cleanup resource directory
+            self.upload_queue.flush()
+            remove_tree(res_temp_dir)
+        # cleanup language directory
+        remove_tree(os.path.join(self.temp_dir, lid))
+
+        return cat_keys, catalog_nodes, supplemental_resources
+
+    def _is_processed(self, process_id):
+        """
+        Checks if a process has already been recorded as finished
+        :param process_id:
+        :return:
+        """
+        return self.checkpoint.is_processed(process_id)
+
+    def _get_processed(self, process_id):
+        """
+        Returns the catalog keys recorded for a finished process
+        :param process_id:
+        :return:
+        """
+        return self.checkpoint.get_processed(process_id)
+
+    def _mark_processed(self, finished_processes):
+        """
+        Records some finished processes.
+        The status is persisted in batches and pending uploads are flushed first
+        so a process is never persisted before its files exist.
+        :param dict finished_processes: a dictionary of process ids and their catalog keys
+        :return:
+        """
+        self._language_state.worked = True
+        self.checkpoint.mark_processed(finished_processes)
+
+    def _save_progress(self):
+        """
+        Persists the finished processes that have not been written yet
+        so they are not repeated by the next run along with the timings of the work
+        :return:
+        """
+        try:
+            if self.checkpoint:
+                self.checkpoint.flush()
+            if self.planner:
+                self.planner.save()
+        except Exception as e:
+            self.logger.warning('Failed to save the progress: {}'.format(e))
 
     def _set_status(self):
         """
@@ -342,13 +513,7 @@ class TsV2CatalogHandler(InstanceHandler):
         If the status is "aborted" this will raise an exception
         :return:
         """
-        result = self._get_status()
-        if result and result[0]['state'] == 'aborted':
-            raise Exception("Aborted because the status flag is set to 'aborted' in dynamodb")
-
-        # record the status
-        self.status['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ")
-        self.db_handler.update_item({'api_version': TsV2CatalogHandler.api_version}, self.status)
+        self.checkpoint.save()
 
     def _has_resource_changed(self, pid, lid, rid, modified_at):
         """
@@ -532,6 +697,10 @@ class TsV2CatalogHandler(InstanceHandler):
                 'state': 'in-progress',
                 'processed': {}
             }
+        else:
+            # TRICKY: the finished processes are stored packed
+            status = dict(status)
+            status['processed'] = load_processed(self.db_handler, {'api_version': TsV2CatalogHandler.api_version}, status)
 
         return (status, source_status)
 
@@ -587,7 +756,8 @@ class TsV2CatalogHandler(InstanceHandler):
 
             # download RC if not already
             if rc_dir is None:
-                rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file)
+                rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file,
+                                     format['modified'], self.rc_cache)
             if not rc_dir:
                 break
 
@@ -605,8 +775,7 @@ class TsV2CatalogHandler(InstanceHandler):
             # collect chunk data
             if pid != 'obs':
                 try:
-                    data = get_url('https://cdn.door43.org/bible/txt/1/{}/chunks.json'.format(pid))
-                    chunks = index_chunks(json.loads(data))
+                    chunks = self.chunk_registry.get(pid)
                 except:
                     self.report_error('Failed to retrieve chunk information for {}-{}'.format(lid, pid))
                     continue
@@ -663,7 +832,8 @@ class TsV2CatalogHandler(InstanceHandler):
 
             # download RC if not already
             if rc_dir is None:
-                rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file)
+                rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file,
+                                     format['modified'], self.rc_cache)
             if not rc_dir:
                 break
 
@@ -674,8 +844,7 @@ class TsV2CatalogHandler(InstanceHandler):
             chunk_json = []
             if pid != 'obs':
                 try:
-                    data = get_url('https://cdn.door43.org/bible/txt/1/{}/chunks.json'.format(pid))
-                    chunk_json = index_chunks(json.loads(data))
+                    chunk_json = self.chunk_registry.get(pid)
                 except:
                     self.report_error('Failed to retrieve chunk information for {}-{}'.format(lid, pid))
                     continue
@@ -712,12 +881,7 @@ class TsV2CatalogHandler(InstanceHandler):
                     general_notes = note_general_re.search(verse_body)
 
                     # zero pad chapter to match chunking scheme
-                    padded_chapter = chapter
-                    while len(padded_chapter) < 3 and padded_chapter not in chunk_json:
-                        padded_chapter = padded_chapter.zfill(len(padded_chapter) + 1)
-                        # keep padding if match is found
-                        if padded_chapter in chunk_json:
-                            chapter = padded_chapter
+                    chapter = pad_to_match(chapter, chunk_json)
 
                     # validate chapters
                     if pid != 'obs' and chapter not in chunk_json:
@@ -727,12 +891,8 @@ class TsV2CatalogHandler(InstanceHandler):
                                                                                                                 rc_dir))
 
                     # zero pad verse to match chunking scheme
-                    padded_verse = verse
-                    while len(padded_verse) < 3 and chapter in chunk_json and padded_verse not in chunk_json[chapter]:
-                        padded_verse = padded_verse.zfill(len(padded_verse) + 1)
-                        # keep padding if match is found
-                        if padded_verse in chunk_json[chapter]:
-                            verse = padded_verse
+                    if chapter in chunk_json:
+                        verse = pad_to_match(verse, chunk_json[chapter])
 
                     # close chunk
                     chapter_key = chapter
@@ -815,7 +975,8 @@ class TsV2CatalogHandler(InstanceHandler):
 
                 # download RC if not already
                 if rc_dir is None:
-                    rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file)
+                    rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file,
+                                         format['modified'], self.rc_cache)
                 if not rc_dir:
                     break
 
@@ -915,7 +1076,8 @@ class TsV2CatalogHandler(InstanceHandler):
 
                 # download RC if not already
                 if rc_dir is None:
-                    rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file)
+                    rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file,
+                                         format['modified'], self.rc_cache)
                 if not rc_dir:
                     break
 
@@ -1020,7 +1182,7 @@ class TsV2CatalogHandler(InstanceHandler):
     def _process_usfm(self, lid, rid, resource, format, temp_dir):
         """
         Converts a USFM bundle into usx, loads the data into json and uploads it.
-        Returns an array of usx file paths.
+        The books are converted in parallel processes and each one is uploaded as soon as it is ready.
         :param lid:
         :param rid:
         :param format:
@@ -1035,6 +1197,7 @@ class TsV2CatalogHandler(InstanceHandler):
 
             # manifest = yaml.load(read_file(os.path.join(rc_dir, 'manifest.yaml')))
             # usx_dir = os.path.join(rc_dir, 'usx')
+            books = []
             for project in resource['projects']:
                 pid = TsV2CatalogHandler.sanitize_identifier(project['identifier'])
                 # DEBUG
@@ -1042,11 +1205,10 @@ class TsV2CatalogHandler(InstanceHandler):
                 #     continue
                 process_id = '_'.join([lid, rid, pid])
 
-                if process_id not in self.status['processed']:
+                if not self._is_processed(process_id):
                     # skip re-processing projects that have not changed
                     if not self._has_resource_changed(pid, lid, rid, format['modified']):
-                        self.status['processed'][process_id] = []
-                        self._set_status()
+                        self._mark_processed({process_id: []})
                         self.logger.debug('Skipping {0}-{1}-{2} because it hasn\'t changed'.format(lid, rid, pid))
                         continue
 
@@ -1054,47 +1216,52 @@ class TsV2CatalogHandler(InstanceHandler):
 
                     # download RC if not already
                     if rc_dir is None:
-                        rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file)
+                        rc_dir = download_rc(lid, rid, format['url'], temp_dir, self.download_file,
+                                             format['modified'], self.rc_cache)
                     if not rc_dir:
                         break
 
                     manifest = yaml.load(read_file(os.path.join(rc_dir, 'manifest.yaml')))
-                    usx_dir = os.path.join(rc_dir, 'usx')
                     project_path = get_project_from_manifest(manifest, project['identifier'])['path']
+                    try:
+                        chunks = self.chunk_registry.get(pid)
+                    except:
+                        raise Exception('Failed to retrieve chunk information for {}'.format(process_id))
+
+                    books.append({
+                        'process_id': process_id,
+                        'lid': lid,
+                        'pid': pid,
+                        'modified': format['modified'],
+                        'usfm_file': os.path.normpath(os.path.join(rc_dir, project_path)),
+                        'usx_dir': os.path.join(rc_dir, 'usx'),
+                        'chunks': chunks
+                    })
 
-                    # copy usfm project file
-                    usfm_dir = os.path.join(temp_dir, '{}_usfm'.format(process_id))
-                    if not os.path.exists(usfm_dir):
-                        os.makedirs(usfm_dir)
-                    usfm_dest_file = os.path.normpath(os.path.join(usfm_dir, project_path))
-                    usfm_src_file = os.path.normpath(os.path.join(rc_dir, project_path))
-                    shutil.copyfile(usfm_src_file, usfm_dest_file)
+            try:
+                if books:
+                    usx_dir = os.path.join(rc_dir, 'usx')
+                    if not os.path.exists(usx_dir):
+                        os.makedirs(usx_dir)
 
-                    # transform usfm to usx
+                    # books are converted in separate processes and uploaded as soon as each one is finished
                     try:
-                        build_usx(usfm_dir, usx_dir)
+                        for book, source in imap_processes(build_book_source, books, self.usx_workers,
+                                                           self.usx_timeout):
+                            upload = prep_data_upload('{}/{}/{}/v{}/source.json'.format(book['pid'], lid, rid,
+                                                                                         resource['version']),
+                                                      source['source'], temp_dir)
+                            self._upload(upload)
+                            self._mark_processed({book['process_id']: []})
                     except Exception as e:
-                        self.report_error('Failed to generate usx for {}'.format(process_id))
+                        self.report_error('{}'.format(e))
                         raise e
-
-                    # clean up converted usfm file
-                    remove(usfm_dest_file, True)
-
-                    # convert USX to JSON
-                    path = os.path.normpath(os.path.join(usx_dir, '{}.usx'.format(pid.upper())))
-                    source = build_json_source_from_usx(path, lid, pid, format['modified'], self)
-                    upload = prep_data_upload('{}/{}/{}/v{}/source.json'.format(pid, lid, rid, resource['version']),
-                                              source['source'], temp_dir)
-                    self.cdn_handler.upload_file(upload['path'],
-                                                 '{}/{}'.format(TsV2CatalogHandler.cdn_root_path, upload['key']))
-
-                    self.status['processed'][process_id] = []
-                    self._set_status()
-            # clean up download
-            try:
-                remove_tree(rc_dir, True)
-            except:
-                pass
+            finally:
+                # clean up download
+                try:
+                    remove_tree(rc_dir, True)
+                except:
+                    pass
 
     def _upload_all(self, uploads):
         """
@@ -1112,13 +1279,14 @@ class TsV2CatalogHandler(InstanceHandler):
 
     def _upload(self, upload):
         """
-        Uploads an upload
+        Queues an upload.
+        The upload queue must be flushed before the file is removed
         :param upload:
         :return:
         """
-        self.cdn_handler.upload_file(upload['path'],
-                                     '{}/{}'.format(TsV2CatalogHandler.cdn_root_path,
-                                                    upload['key']))
+        self.upload_queue.put(upload['path'],
+                              '{}/{}'.format(TsV2CatalogHandler.cdn_root_path,
+                                             upload['key']))
 
     def _add_supplement(self, catalog, language, resource, project, modified, rc_type):
         """
@@ -10,17 +10,22 @@ import math
 import os
 import shutil
 import tempfile
-import time
 import sys
 
 from hashlib import md5
 from d43_aws_tools import S3Handler, DynamoDBHandler
 from libraries.tools.date_utils import str_to_unix_time
 from libraries.tools.dict_utils import merge_dict
-from libraries.tools.file_utils import write_file, read_file
+from libraries.tools.file_utils import write_file, write_json_file, read_file
 from libraries.tools.legacy_utils import index_obs
+from libraries.tools.lambda_utils import context_sec_remaining
+from libraries.tools.processed_set import load_processed
+from libraries.tools.rc_cache import RCCache
+from libraries.tools.status_checkpoint import StatusCheckpoint
+from libraries.tools.upload_queue import UploadQueue
 from libraries.tools.url_utils import download_file, get_url
 from libraries.tools.usfm_utils import strip_word_data, convert_chunk_markers
+from libraries.tools.work_planner import WorkPlanner, TimeBudgetExceeded
 
 from libraries.tools.signer import Signer, ENC_PRIV_PEM_PATH
 from libraries.lambda_handlers.instance_handler import InstanceHandler
@@ -66,6 +71,15 @@ class UwV2CatalogHandler(InstanceHandler):
         else:
             self.signer = Signer(ENC_PRIV_PEM_PATH) # pragma: no cover
 
+        if 'rc_cache' in kwargs:
+            self.rc_cache = kwargs['rc_cache']
+        else:
+            self.rc_cache = RCCache(os.path.join(self.temp_dir, 'rc_cache'))
+
+        self.upload_queue = UploadQueue(self.cdn_handler, logger=self.logger)
+        self.checkpoint = None
+        self.planner = None
+
     def __del__(self):
         try:
             shutil.rmtree(self.temp_dir)
@@ -79,7 +93,13 @@ class UwV2CatalogHandler(InstanceHandler):
         """
         try:
             return self.__execute()
+        except TimeBudgetExceeded as e:
+            if self.logger:
+                self.logger.info('{}. The catalog will be finished by the next run'.format(e))
+            self._save_progress()
+            return False
         except Exception as e:
+            self._save_progress()
             self.report_error(e.message)
             raise Exception, Exception(e), sys.exc_info()[2]
 
@@ -131,13 +151,27 @@ class UwV2CatalogHandler(InstanceHandler):
                 key = '{}/{}'.format(UwV2CatalogHandler.cdn_root_path, upload['key'])
             else:
                 key = upload['key'].lstrip('/')
-            self.cdn_handler.upload_file(upload['path'], key)
+            self.upload_queue.put(upload['path'], key)
+        self.upload_queue.flush()
 
-        status['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ")
         status['state'] = 'complete'
-        self.db_handler.update_item(
-            {'api_version': UwV2CatalogHandler.api_version},
-            status)
+        self.checkpoint.save()
+        self.planner.save()
+
+    def _save_progress(self):
+        """
+        Persists the finished processes that have not been written yet
+        so they are not repeated by the next run along with the timings of the work
+        :return:
+        """
+        try:
+            if self.checkpoint:
+                self.checkpoint.flush()
+            if self.planner:
+                self.planner.save()
+        except Exception as e:
+            if self.logger:
+                self.logger.warning('Failed to save the progress: {}'.format(e))
 
     def convert_v3_to_v2(self, v3_catalog, status):
         """
@@ -147,6 +181,15 @@ class UwV2CatalogHandler(InstanceHandler):
         :param status: the build status retrieved from AWS.
         :return: the complete v2 catalog
         """
+        # TRICKY: the status is only written every so often because it grows with every finished process.
+        # The uploads are flushed first so a process is never recorded before its files exist.
+        self.checkpoint = StatusCheckpoint(self.db_handler, {'api_version': UwV2CatalogHandler.api_version}, status,
+                                           before_write=self.upload_queue.wait_all,
+                                           sec_remaining=lambda: context_sec_remaining(self.context))
+        # TRICKY: processes that will not finish before the lambda times out are left for the next run
+        self.planner = WorkPlanner(self.db_handler, {'api_version': UwV2CatalogHandler.api_version},
+                                   sec_remaining=lambda: context_sec_remaining(self.context))
+        self.planner.load()
         cat_keys = []
         v2_catalog = {
             'obs': {},
@@ -206,23 +249,23 @@ class UwV2CatalogHandler(InstanceHandler):
                                 obs_key = '{}/{}/{}/{}/v{}/source.json'.format(self.cdn_root_path, pid, lid, rid,
                                                                                res['version'])
                                 if process_id not in status['processed']:
-                                    obs_json = index_obs(lid, rid, format, self.temp_dir, self.download_file)
+                                    self.planner.begin(process_id)
+                                    obs_json = index_obs(lid, rid, format, self.temp_dir, self.download_file, self.rc_cache)
                                     upload = self._prep_json_upload(obs_key, obs_json)
-                                    self.cdn_handler.upload_file(upload['path'], upload['key'])
+                                    self.upload_queue.put(upload['path'], upload['key'])
 
                                     # sign obs file.
                                     # TRICKY: we only need to sign obs so we do so now.
                                     sig_file = self.signer.sign_file(upload['path'])
                                     try:
                                         self.signer.verify_signature(upload['path'], sig_file)
-                                        self.cdn_handler.upload_file(sig_file, '{}.sig'.format(upload['key']))
+                                        self.upload_queue.put(sig_file, '{}.sig'.format(upload['key']))
                                     except RuntimeError:
                                         if self.logger:
                                             self.logger.warning('Could not verify signature {}'.format(sig_file))
 
-                                    status['processed'].update({process_id: []})
-                                    status['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ")
-                                    self.db_handler.update_item({'api_version': UwV2CatalogHandler.api_version}, status)
+                                    self.checkpoint.mark_processed({process_id: []})
+                                    self.planner.end(process_id)
                                 else:
                                     cat_keys = cat_keys + status['processed'][process_id]
 
@@ -236,22 +279,22 @@ class UwV2CatalogHandler(InstanceHandler):
                                 bible_key = '{0}/{1}/{2}/{3}/v{4}/{1}.usfm'.format(self.cdn_root_path, pid, lid, rid,
                                                                                    res['version'])
                                 if process_id not in status['processed']:
+                                    self.planner.begin(process_id)
                                     usfm = self._process_usfm(format)
                                     upload = self._prep_text_upload(bible_key, usfm)
-                                    self.cdn_handler.upload_file(upload['path'], upload['key'])
+                                    self.upload_queue.put(upload['path'], upload['key'])
 
                                     # sign file
                                     sig_file = self.signer.sign_file(upload['path'])
                                     try:
                                         self.signer.verify_signature(upload['path'], sig_file)
-                                        self.cdn_handler.upload_file(sig_file, '{}.sig'.format(upload['key']))
+                                        self.upload_queue.put(sig_file, '{}.sig'.format(upload['key']))
                                     except RuntimeError:
                                         if self.logger:
                                             self.logger.warning('Could not verify signature {}'.format(sig_file))
 
-                                    status['processed'].update({process_id: []})
-                                    status['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ")
-                                    self.db_handler.update_item({'api_version': UwV2CatalogHandler.api_version}, status)
+                                    self.checkpoint.mark_processed({process_id: []})
+                                    self.planner.end(process_id)
                                 else:
                                     cat_keys = cat_keys + status['processed'][process_id]
                                 source = {
@@ -440,6 +483,10 @@ class UwV2CatalogHandler(InstanceHandler):
                 'state': 'in-progress',
                 'processed': {}
             }
+        else:
+            # TRICKY: the finished processes are stored packed
+            status = dict(status)
+            status['processed'] = load_processed(self.db_handler, {'api_version': UwV2CatalogHandler.api_version}, status)
 
         return (status, source_status)
 
@@ -451,7 +498,7 @@ class UwV2CatalogHandler(InstanceHandler):
         :return:
         """
         temp_file = os.path.join(self.temp_dir, key)
-        write_file(temp_file, json.dumps(data, sort_keys=True))
+        write_json_file(temp_file, data)
         return {
             'key': key,
             'path': temp_file
@@ -26,11 +26,18 @@ from libraries.tools.date_utils import str_to_timestamp
 from libraries.tools.file_utils import unzip, read_file, write_file
 from libraries.tools.url_utils import get_url, download_file, url_exists
 from libraries.tools.media_utils import parse_media
+from libraries.tools.upload_queue import UploadQueue
+from libraries.tools.zip_index import ZipIndex
+from libraries.tools.file_digest import FileDigest
+from libraries.tools.thread_utils import map_concurrent
 
 from libraries.lambda_handlers.handler import Handler
 
 
 class WebhookHandler(Handler):
+    # the number of project files extracted and uploaded at once
+    max_workers = 4
+
     def __init__(self, event, context, logger, **kwargs):
         super(WebhookHandler, self).__init__(event, context)
 
@@ -60,6 +67,8 @@ class WebhookHandler(Handler):
             raise Exception('Unsupported webhook request received ' + self.repo_commit['repository']['name'] + ' ' + json.dumps(self.repo_commit))
 
         self.resource_id = None # set in self._build
+        self.repo_index = None # set in self._build
+        self.archive_digest = None # set in self.download_repo
         self.logger = logger # type: logging._loggerClass
 
         if 'dynamodb_handler' in kwargs:
@@ -77,6 +86,13 @@ class WebhookHandler(Handler):
         else:
             self.download_file = download_file # pragma: no cover
 
+        if 'max_workers' in kwargs:
+            self.max_workers = kwargs['max_workers']
+        elif 'max_workers' in env_vars:
+            self.max_workers = int(env_vars['max_workers'])
+
+        self.upload_queue = UploadQueue(self.s3_handler, max_workers=self.max_workers, logger=self.logger)
+
     def __parse_pull_request(self, payload):
         """
         Parses a  pull request
@@ -173,15 +189,28 @@ class WebhookHandler(Handler):
                 raise Exception('Skipping un-merged pull request ' + self.repo_name)
 
         try:
+            # skip redelivered webhooks
+            existing_row = self._find_redundant_build()
+            if existing_row:
+                skipped_builds = existing_row.get('skipped_builds', 0) + 1
+                self.db_handler.update_item({'repo_name': self.repo_name}, {'skipped_builds': skipped_builds})
+                self.logger.info('Skipping {0} ({1}) because it has already been built. {2} redundant builds skipped'.format(self.repo_name, self.commit_id, skipped_builds))
+                return {
+                    "success": True,
+                    "message": "Skipped {0} ({1}) because it is already in the catalog".format(self.repo_name, self.commit_id)
+                }
+
             # build catalog entry
             data = self._build()
             if data:
+                data['archive_md5'] = self.archive_digest.md5
                 # upload data
                 if 'uploads' in data:
                     self.logger.debug('Uploading files for "{}"'.format(self.repo_name))
                     for upload in data['uploads']:
                         self.logger.debug('^...{}'.format(upload['key']))
-                        self.s3_handler.upload_file(upload['path'], upload['key'])
+                        self.upload_queue.put(upload['path'], upload['key'])
+                    self.upload_queue.flush()
                     del data['uploads']
                 else:
                     self.logger.debug('No upload-able content found in "{}"'.format(self.repo_name))
@@ -193,6 +222,8 @@ class WebhookHandler(Handler):
             raise Exception, Exception(e), sys.exc_info()[2]
         finally:
             # clean
+            if self.repo_index:
+                self.repo_index.close()
             if self.temp_dir and os.path.isdir(self.temp_dir):
                 shutil.rmtree(self.temp_dir, ignore_errors=True)
 
@@ -201,6 +232,21 @@ class WebhookHandler(Handler):
             "message": "Successfully added {0} ({1}) to the catalog".format(self.repo_name, self.commit_id)
         }
 
+    def _find_redundant_build(self):
+        """
+        Checks if this commit has already been built from an identical archive.
+        Gogs redelivers webhooks and the fork lambda re-triggers repos so the same commit can arrive more than once.
+        Dirty rows are always rebuilt.
+        :return: the existing row if the build can be skipped
+        """
+        row = self.db_handler.get_item({'repo_name': self.repo_name})
+        if not row or row.get('dirty') or row.get('commit_id') != self.commit_id or 'archive_md5' not in row:
+            return None
+        self.download_repo(self.commit_url, self.repo_file)
+        if row['archive_md5'] != self.archive_digest.md5:
+            return None
+        return row
+
     def _build(self):
         """
         Constructs a new catalog entry from the repository
@@ -208,9 +254,10 @@ class WebhookHandler(Handler):
         """
 
         self.download_repo(self.commit_url, self.repo_file)
-        self.unzip_repo_file(self.repo_file, self.temp_dir)
+        # TRICKY: files are read from the archive and only extracted when they must be uploaded
+        self.repo_index = ZipIndex(self.repo_file, self.repo_name.lower(), self.repo_dir)
 
-        if not os.path.isdir(self.repo_dir):
+        if not self.repo_index.isdir('.'):
             raise Exception('Was not able to find {0}'.format(self.repo_dir)) # pragma: no cover
 
         self.logger.info('Processing repository "{}"'.format(self.repo_name))
@@ -232,11 +279,10 @@ class WebhookHandler(Handler):
         Builds a Resource Container following the RC0.2 spec
         :return:
         """
-        manifest_path = os.path.join(self.repo_dir, 'manifest.yaml')
-        if not os.path.isfile(manifest_path):
+        if not self.repo_index.isfile('manifest.yaml'):
             raise Exception('Repository {0} does not have a manifest.yaml file'.format(self.repo_name))
         try:
-            manifest = WebhookHandler.load_yaml_file(manifest_path)
+            manifest = self.load_yaml_member('manifest.yaml')
         except Exception as e:
             raise Exception('Bad Manifest: {0}'.format(e))
 
@@ -251,15 +297,14 @@ class WebhookHandler(Handler):
         manifest['dublin_core']['version'] = '{}'.format(manifest['dublin_core']['version'])
 
         # build media formats
-        media_path = os.path.join(self.repo_dir, 'media.yaml')
         resource_formats = []
         project_formats = {}
-        if os.path.isfile(media_path):
+        if self.repo_index.isfile('media.yaml'):
             try:
-                media = WebhookHandler.load_yaml_file(media_path)
+                media = self.load_yaml_member('media.yaml')
             except Exception as e:
                 raise Exception('Bad Media: {0}'.format(e))
-            project_chapters = self._listChapters(self.repo_dir, manifest)
+            project_chapters = self._listChapters(self.repo_index, manifest)
             try:
                 resource_formats, project_formats = parse_media(media=media,
                             content_version=manifest['dublin_core']['version'],
@@ -312,6 +357,7 @@ class WebhookHandler(Handler):
 
         # split usfm bundles
         if manifest['dublin_core']['type'] == 'bundle' and manifest['dublin_core']['format'] == 'text/usfm':
+            project_files = []
             for project in manifest['projects']:
                 pid = self.sanitize_identifier(project['identifier'])
                 if 'formats' not in project:
@@ -323,8 +369,7 @@ class WebhookHandler(Handler):
                                                         manifest['dublin_core']['version'],
                                                         pid)
                 project_url = '{}/{}'.format(self.cdn_url, project_key)
-                p_file_path = os.path.join(self.repo_dir, project['path'].lstrip('\.\/'))
-                p_stats = os.stat(p_file_path)
+                p_path = project['path'].lstrip('\.\/')
                 try:
                     resource_mtime = str_to_timestamp(manifest['dublin_core']['modified'])
                 except Exception as e:
@@ -334,12 +379,17 @@ class WebhookHandler(Handler):
                     'format': 'text/usfm',
                     'modified': resource_mtime,
                     'signature': '',
-                    'size': p_stats.st_size,
+                    'size': self.repo_index.getsize(p_path),
                     'url': project_url
                 })
+                project_files.append((project_key, p_path))
+
+            # TRICKY: the books are streamed out of the archive on several threads
+            paths = map_concurrent(self.repo_index.extract, [p_path for _, p_path in project_files], self.max_workers)
+            for (project_key, _), path in zip(project_files, paths):
                 uploads.append({
                     'key': self.make_upload_key(project_key),
-                    'path': p_file_path
+                    'path': path
                 })
 
         # add media to projects
@@ -398,10 +448,10 @@ class WebhookHandler(Handler):
         }
 
 
-    def _listChapters(self, rc_dir, manifest):
+    def _listChapters(self, repo_index, manifest):
         """
         Builds a dictionary of chapter ids for each project
-        :param rc_dir:
+        :param ZipIndex repo_index: the files in the repository
         :param manifest:
         :return:
         """
@@ -409,9 +459,8 @@ class WebhookHandler(Handler):
         if manifest['dublin_core']['type'] == 'book':
             for project in manifest['projects']:
                 pid = self.sanitize_identifier(project['identifier'])
-                project_path = os.path.normpath(os.path.join(rc_dir, project['path']))
-                if os.path.isdir(project_path):
-                    files = os.listdir(project_path)
+                if repo_index.isdir(project['path']):
+                    files = repo_index.listdir(project['path'])
                     for chapter in files:
                         if chapter in ['.', '..', 'toc.yaml', 'config.yaml', 'back', 'front']:
                             continue
@@ -492,13 +541,13 @@ class WebhookHandler(Handler):
         Builds the localization for various components in the catalog
         :return:
         """
-        files = sorted(glob(os.path.join(self.repo_dir, '*.json')))
+        files = [f for f in self.repo_index.listdir('.') if f.endswith('.json') and self.repo_index.isfile(f)]
         localization = {}
         for f in files:
             self.logger.debug("Reading {0}...".format(f))
-            language = os.path.splitext(os.path.basename(f))[0]
+            language = os.path.splitext(f)[0]
             try:
-                localization[language] = json.loads(read_file(f))
+                localization[language] = json.loads(self.read_member(f))
             except Exception as e:
                 raise Exception('Bad JSON: {0}'.format(e))
         return {
@@ -514,8 +563,7 @@ class WebhookHandler(Handler):
         Builds the global catalogs
         :return:
         """
-        catalogs_path = os.path.join(self.repo_dir, 'catalogs.json')
-        package = read_file(catalogs_path)
+        package = self.read_member('catalogs.json')
         return {
             'repo_name': self.repo_name,
             'commit_id': self.commit_id,
@@ -561,15 +609,35 @@ class WebhookHandler(Handler):
         with codecs.open(file_name, 'r', 'utf-8-sig') as stream:
             return yaml.load(stream)
 
+    def read_member(self, path):
+        """
+        Reads a text file in the repository archive the same way read_file reads one from disk
+        :param path: the path relative to the repository
+        :return: unicode
+        """
+        return self.repo_index.read(path).decode('utf-8-sig').replace('\r\n', '\n')
+
+    def load_yaml_member(self, path):
+        """
+        Deserializes a yaml file in the repository archive into a Python object
+        :param path: the path relative to the repository
+        """
+        # use utf-8-sig in case the file has a Byte Order Mark
+        return yaml.load(self.repo_index.read(path).decode('utf-8-sig'))
+
     def get_url(self, url):
         return get_url(url)
 
     def download_repo(self, commit_url, repo_file):
         repo_zip_url = commit_url.replace('commit', 'archive') + '.zip'
         try:
-            self.logger.debug('Downloading {0}...'.format(repo_zip_url))
             if not os.path.isfile(repo_file):
-                self.download_file(repo_zip_url, repo_file)
+                self.logger.debug('Downloading {0}...'.format(repo_zip_url))
+                digest = self.download_file(repo_zip_url, repo_file)
+                if isinstance(digest, FileDigest):
+                    self.archive_digest = digest
+            if not self.archive_digest:
+                self.archive_digest = FileDigest.from_file(repo_file)
         finally:
             pass
 
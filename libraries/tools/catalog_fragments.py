@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for persisting the pieces of the catalog built from each row of the progress table
+#
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from libraries.tools.file_utils import load_json_object, write_file
+
+
+def package_hash(package):
+    """
+    Returns the hash of a row package
+    :param str|unicode package: the json encoded package
+    :return:
+    """
+    if not isinstance(package, bytes):
+        package = package.encode('utf-8')
+    return hashlib.md5(package).hexdigest()
+
+
+class CatalogFragments(object):
+    """
+    Stores the language and resource that each progress table row contributed to the catalog
+    so that unchanged rows do not need to be built again.
+    Fragments are keyed by repo name and are only valid for the same commit and package.
+    """
+
+    def __init__(self, s3_handler, key):
+        """
+        :param s3_handler: the S3Handler (or MockS3Handler) where the fragments are saved
+        :param key: the key of the fragments file
+        """
+        self.s3_handler = s3_handler
+        self.key = key
+        self.hits = 0
+        self._fragments = {}
+        self._used = set()
+
+    def load(self):
+        """
+        Downloads the saved fragments.
+        A missing or corrupt fragments file is treated as empty.
+        :return:
+        """
+        temp_dir = tempfile.mkdtemp(prefix='fragments_')
+        try:
+            path = os.path.join(temp_dir, 'fragments.json')
+            self.s3_handler.download_file(self.key, path)
+            fragments = load_json_object(path, {})
+            if isinstance(fragments, dict):
+                self._fragments = fragments
+        except Exception:
+            self._fragments = {}
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def save(self):
+        """
+        Uploads the fragments of the rows that were seen since the fragments were loaded.
+        Fragments of rows that have been removed from the table are dropped.
+        :return:
+        """
+        fragments = dict((k, v) for k, v in self._fragments.items() if k in self._used)
+        temp_dir = tempfile.mkdtemp(prefix='fragments_')
+        try:
+            path = os.path.join(temp_dir, 'fragments.json')
+            write_file(path, json.dumps(fragments, sort_keys=True, separators=(',', ':')))
+            self.s3_handler.upload_file(path, self.key, cache_time=0)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self._fragments = fragments
+
+    def get(self, item, is_valid=None):
+        """
+        Returns the fragment of a row if it is still valid.
+        The package of the row is compared by its hash so it does not need to be decoded.
+        :param item: the progress table row
+        :param is_valid: optionally checks that the resource of a matching fragment can still be used
+        :return: a tuple of the language and resource or None
+        """
+        repo_name = item['repo_name']
+        self._used.add(repo_name)
+        fragment = self._fragments.get(repo_name)
+        if not fragment or not item.get('package') or fragment['commit_id'] != item.get('commit_id') \
+                or fragment['hash'] != package_hash(item['package']):
+            return None
+        if is_valid is None or is_valid(fragment['resource']):
+            self.hits += 1
+            return fragment['language'], fragment['resource']
+        return None
+
+    def put(self, item, language, resource):
+        """
+        Records the fragment of a row
+        :param item: the progress table row
+        :param language: the language container without resources
+        :param resource: the resource that was added to the language
+        :return:
+        """
+        repo_name = item['repo_name']
+        self._used.add(repo_name)
+        self._fragments[repo_name] = {
+            'commit_id': item['commit_id'],
+            'hash': package_hash(item['package']),
+            'language': language,
+            'resource': resource
+        }
+
+    def discard(self, item):
+        """
+        Removes the fragment of a row so it will be built again next time
+        :param item: the progress table row
+        :return:
+        """
+        self._used.add(item['repo_name'])
+        self._fragments.pop(item['repo_name'], None)
@@ -10,21 +10,28 @@ import json
 import logging
 import urlparse
 
-from libraries.tools.url_utils import url_exists
+from libraries.tools.url_checker import URLChecker
 
 
 class ConsistencyChecker(object):
 
-    def __init__(self, cdn_bucket, api_bucket, quiet=False):
+    def __init__(self, cdn_bucket, api_bucket, quiet=False, url_checker=None, s3_index=None):
         """
 
         :param cdn_bucket:
         :param api_bucket:
         :param quiet: log errors if set to false
+        :param URLChecker url_checker: resolves the existence of urls. Results are cached between checks.
+        :param S3Index s3_index: resolves the existence of urls in our buckets without making requests
         """
         self.cdn_bucket = cdn_bucket
         self.api_bucket = api_bucket
         self.quiet = quiet
+        if url_checker:
+            self.url_checker = url_checker
+        else:
+            self.url_checker = URLChecker()
+        self.s3_index = s3_index
         self.all_errors = []
         self.errors = []
         self.logger = logging.getLogger()
@@ -45,7 +52,28 @@ class ConsistencyChecker(object):
         :param url:
         :return:
         """
-        return url != '' and url_exists(url)
+        return url != '' and self._urls_exist([url])[url]
+
+    def _urls_exist(self, urls):
+        """
+        Checks the existence of many urls in a single batch.
+        Urls in the indexed bucket are answered from the index.
+        :param urls:
+        :return: a dictionary of booleans keyed by url
+        """
+        results = {}
+        remote = []
+        for url in urls:
+            if url == '' or url in results:
+                continue
+            exists = self.s3_index.url_exists(url) if self.s3_index else None
+            if exists is None:
+                remote.append(url)
+            else:
+                results[url] = exists
+        if remote:
+            results.update(self.url_checker.check(remote))
+        return results
 
     def log_error(self, message):
         message = 'Consistency Check Failed: {}'.format(message)
@@ -107,7 +135,7 @@ class ConsistencyChecker(object):
 
         return self.errors
 
-    def _check_attributes(self, obj, keys, obj_name, repo_name):
+    def _check_attributes(self, obj, keys, obj_name, repo_name, checks=None):
         """
         Validates that the object contains the given keys.
         This will additionally validate the existence of url and signature
@@ -115,8 +143,14 @@ class ConsistencyChecker(object):
         :param keys:
         :param obj_name:
         :param repo_name:
+        :param list checks: collects the checks so the urls can be resolved later in a single batch.
+        If left None the checks are resolved immediately.
         :return:
         """
+        resolve = checks is None
+        if resolve:
+            checks = []
+
         if 'url' not in keys:
             keys.append('url')
         if 'signature' not in keys:
@@ -133,14 +167,50 @@ class ConsistencyChecker(object):
                 if key == 'signature' and not has_local_url:
                     # TRICKY: do not require signatures for remote urls
                     continue
-                self.log_error("{0} container for '{1}' doesn't have '{2}'".format(obj_name, repo_name, key))
+                checks.append(("{0} container for '{1}' doesn't have '{2}'".format(obj_name, repo_name, key), None))
 
         # validate local urls exist
-        if has_local_url and not self._url_exists(obj['url']):
-            self.log_error("{0}: url '{1}' does not exist".format(repo_name, obj['url']))
+        if has_local_url:
+            checks.append(("{0}: url '{1}' does not exist".format(repo_name, obj['url']), obj['url']))
+            checks.append(("{0}: url '{1}' has not been signed yet".format(repo_name, obj['url']),
+                           obj.get('signature', '')))
+
+        if resolve:
+            self._resolve_checks(checks)
 
-        if has_local_url and not ('signature' in obj and self._url_exists(obj['signature'])):
-            self.log_error("{0}: url '{1}' has not been signed yet".format(repo_name, obj['url']))
+    def _resolve_checks(self, checks):
+        """
+        Checks all of the collected urls at once and logs the errors in the order they were found
+        :param checks: a list of tuples containing an error message and the url that must exist to avoid the error.
+        Errors without a url are always logged.
+        :return:
+        """
+        urls = [url for message, url in checks if url]
+        found = self._urls_exist(urls) if urls else {}
+        for message, url in checks:
+            if url is None or not found.get(url):
+                self.log_error(message)
+
+    def prefetch(self, manifest):
+        """
+        Resolves all of the local format, chapter and signature urls in a manifest in a single batch
+        so that the following format checks can be answered from the url cache.
+        :param manifest: a manifest or a catalog resource
+        :return: a dictionary of booleans keyed by url
+        """
+        formats = list(manifest.get('formats', []))
+        for project in manifest.get('projects', []):
+            formats.extend(project.get('formats', []))
+
+        urls = []
+        for obj in formats + [c for f in formats for c in f.get('chapters', [])]:
+            if obj.get('url') and self._url_is_local(obj['url']):
+                urls.append(obj['url'])
+                urls.append(obj.get('signature', ''))
+        urls = [url for url in urls if url]
+        if urls:
+            return self._urls_exist(urls)
+        return {}
 
     def check_format(self, format, row):
         """
@@ -151,19 +221,21 @@ class ConsistencyChecker(object):
 
         repo_name = row['repo_name']
 
-        self._check_attributes(format, ["format", "modified", "size", "url", "signature"], 'Format', repo_name)
+        checks = []
+        self._check_attributes(format, ["format", "modified", "size", "url", "signature"], 'Format', repo_name, checks)
 
         if 'chapters' in format and len(format['chapters']):
             # check format chapters
             for chapter in format['chapters']:
-                self._check_format_chapter(chapter, row)
+                self._check_format_chapter(chapter, row, checks)
 
+        self._resolve_checks(checks)
         return self.errors
 
-    def _check_format_chapter(self, chapter, row):
+    def _check_format_chapter(self, chapter, row, checks=None):
         repo_name = row['repo_name']
         keys_to_check = ['size', 'length', 'modified', 'identifier', 'url', 'signature']
-        self._check_attributes(chapter, keys_to_check, 'Format chapter', repo_name)
+        self._check_attributes(chapter, keys_to_check, 'Format chapter', repo_name, checks)
 
     @staticmethod
     def check_manifest(manifest):
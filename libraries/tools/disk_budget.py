@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for limiting how much disk space concurrent workers use
+#
+
+import threading
+from contextlib import contextmanager
+
+
+class DiskBudget(object):
+    """
+    Limits the number of bytes that concurrent workers may have on disk at once.
+    Workers wait until enough of the budget has been released by the others.
+    A reservation larger than the whole budget is allowed once nothing else is reserved
+    so it cannot wait forever.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        :param int max_bytes: the number of bytes that may be reserved at once
+        """
+        self.max_bytes = max_bytes
+        self.reserved = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        """
+        Waits until the bytes can be reserved
+        :param int size:
+        :return:
+        """
+        with self._condition:
+            while self.reserved and self.reserved + size > self.max_bytes:
+                self._condition.wait()
+            self.reserved += size
+            self.peak = max(self.peak, self.reserved)
+
+    def release(self, size):
+        """
+        Returns reserved bytes to the budget
+        :param int size:
+        :return:
+        """
+        with self._condition:
+            self.reserved -= size
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size):
+        """
+        Reserves bytes for the duration of a with block
+        :param int size:
+        :return:
+        """
+        self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
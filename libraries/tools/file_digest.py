@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for hashing a file while it is being written
+#
+
+import hashlib
+
+
+class FileDigest(object):
+    """
+    Calculates the SHA-384 and MD5 digests and the size of a file in a single pass.
+    The SHA-384 digest is what the signer signs and the MD5 digest is the ETag of a single part S3 upload.
+    """
+
+    def __init__(self):
+        self._sha384 = hashlib.sha384()
+        self._md5 = hashlib.md5()
+        self.size = 0
+
+    def update(self, data):
+        """
+        Adds the next block of the file
+        :param data:
+        :return:
+        """
+        self._sha384.update(data)
+        self._md5.update(data)
+        self.size += len(data)
+
+    @property
+    def sha384(self):
+        """
+        The binary SHA-384 digest
+        """
+        return self._sha384.digest()
+
+    @property
+    def md5(self):
+        """
+        The MD5 hex digest
+        """
+        return self._md5.hexdigest()
+
+    @staticmethod
+    def copy(source, out_file, block_size=1024 * 1024):
+        """
+        Copies a stream to a file and hashes it along the way
+        :param source: a file like object to read
+        :param out_file: an open file to write
+        :param int block_size:
+        :return: FileDigest
+        """
+        digest = FileDigest()
+        for block in iter(lambda: source.read(block_size), b''):
+            out_file.write(block)
+            digest.update(block)
+        return digest
+
+    @staticmethod
+    def from_file(path, block_size=1024 * 1024):
+        """
+        Hashes a file that is already on disk
+        :param path:
+        :param int block_size:
+        :return: FileDigest
+        """
+        digest = FileDigest()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        return digest
@@ -3,6 +3,7 @@
 from __future__ import unicode_literals, print_function
 
 import codecs
+import hashlib
 import json
 import os
 import shutil
@@ -11,6 +12,7 @@ import tempfile
 import urllib
 import urlparse
 import zipfile
+from itertools import islice
 from mimetypes import MimeTypes
 
 import yaml
@@ -167,6 +169,37 @@ def write_file(file_name, file_contents, indent=None):
         out_file.write(text_to_write)
 
 
+def write_json_file(file_name, data, separators=None, block_size=4096):
+    """
+    Serializes <data> as sorted-key JSON to <file_name> one block at a time
+    so the whole document is never held in memory.
+    The output is identical to write_file(file_name, json.dumps(data, sort_keys=True, separators=separators)).
+
+    :param str|unicode file_name: The name of the file to write
+    :param object data: The object to serialize
+    :param tuple separators: The JSON item and key separators e.g. (',', ':') for compact output
+    :param int block_size: The number of encoded pieces that are joined into each write
+    :return: a tuple of the md5 hex digest and the size in bytes of the written file
+    """
+    make_dir(os.path.dirname(file_name))
+
+    md5 = hashlib.md5()
+    size = 0
+    # TRICKY: python 2 always uses the pure python encoder when keys are sorted, even in json.dumps,
+    # so this is as fast as json.dumps. Joining blocks of pieces is faster than json.dump, which writes each piece.
+    pieces = json.JSONEncoder(sort_keys=True, separators=separators).iterencode(data)
+    with open(file_name, 'wb') as out_file:
+        while True:
+            block = ''.join(islice(pieces, block_size))
+            if not block:
+                break
+            block = block.encode('utf-8')
+            out_file.write(block)
+            md5.update(block)
+            size += len(block)
+    return md5.hexdigest(), size
+
+
 def get_mime_type(path):
     mime = MimeTypes()
 
@@ -242,7 +275,7 @@ def remove(file_path, ignore_errors=True):
     else:
         os.remove(file_path)
 
-def download_rc(lid, rid, url, temp_dir=None, downloader=None):
+def download_rc(lid, rid, url, temp_dir=None, downloader=None, modified=None, cache=None):
     """
     Downloads a resource container from a url, validates it, and prepares it for reading
     :param lid: the language code of the RC
@@ -250,6 +283,8 @@ def download_rc(lid, rid, url, temp_dir=None, downloader=None):
     :param url: the url from which to download the RC
     :param temp_dir: the tempdir where we can write stuff
     :param downloader: This is exposed to allow mocking the downloader.
+    :param modified: the modified date or ETag of the RC. This is required to use the cache.
+    :param cache: an optional RCCache from which previously extracted RCs will be copied
     :return: the path to the readable RC or None if an error occurred.
     """
     if not temp_dir:
@@ -257,17 +292,21 @@ def download_rc(lid, rid, url, temp_dir=None, downloader=None):
 
     zip_file = os.path.join(temp_dir, url.split('/')[-1])
     zip_dir = os.path.join(temp_dir, lid, rid, 'zip_dir')
-    if not downloader:
-        download_file(url, zip_file)
-    else:
-        downloader(url, zip_file)
+    use_cache = cache is not None and modified is not None
+    if not use_cache or not cache.checkout(url, modified, zip_dir):
+        if not downloader:
+            download_file(url, zip_file)
+        else:
+            downloader(url, zip_file)
 
-    if not os.path.exists(zip_file):
-        print('ERROR: could not download file {}'.format(url))
-        return None
+        if not os.path.exists(zip_file):
+            print('ERROR: could not download file {}'.format(url))
+            return None
 
-    unzip(zip_file, zip_dir)
-    remove(zip_file, True)
+        unzip(zip_file, zip_dir)
+        remove(zip_file, True)
+        if use_cache:
+            cache.store(url, modified, zip_dir)
     rc_dir = os.path.join(zip_dir, os.listdir(zip_dir)[0])
 
     try:
@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for making http requests over pooled keep-alive connections
+#
+
+import httplib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib2
+import zlib
+from hashlib import md5
+from urlparse import urlparse, urljoin
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# responses that may succeed if the request is sent again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _content_range_size(headers):
+    """
+    Reads the size of the whole file from a Content-Range header e.g. "bytes 0-99/1234"
+    :param dict headers:
+    :return: the size or None if it is unknown
+    """
+    size = headers.get('content-range', '').rpartition('/')[2]
+    if size.isdigit():
+        return int(size)
+    return None
+
+
+class HttpResponse(object):
+    """
+    The response to a request.
+    The body is read on demand like the response of urllib2.urlopen so large files can be streamed.
+    Gzip encoded bodies are decoded as they are read.
+    """
+
+    def __init__(self, url, status, reason, headers, source, on_data=None, on_done=None):
+        """
+        :param url: the url of the response after redirects
+        :param int status: the http status code
+        :param reason: the http status message
+        :param dict headers: the response headers keyed by their lower case names
+        :param source: a file like object from which the (possibly encoded) body is read
+        :param on_data: called with each block of the decoded body
+        :param on_done: called once with True if the whole body was read or False if the response was closed early
+        """
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._source = source
+        self._on_data = on_data
+        self._on_done = on_done
+        self._done = False
+        if headers.get('content-encoding') == 'gzip':
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decoder = None
+
+    def getcode(self):
+        return self.status
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        """
+        Reads the decoded body
+        :param int amt: the number of bytes to read. All of the remaining body is read by default
+        :return:
+        """
+        if amt is None or amt < 0:
+            blocks = []
+            while True:
+                block = self.read(65536)
+                if not block:
+                    break
+                blocks.append(block)
+            return b''.join(blocks)
+
+        while not self._done:
+            data = self._source.read(amt)
+            if not data:
+                data = self._decoder.flush() if self._decoder else b''
+                if data and self._on_data:
+                    self._on_data(data)
+                self._finish(True)
+                return data
+            if self._decoder:
+                data = self._decoder.decompress(data)
+                if not data:
+                    continue
+            if self._on_data:
+                self._on_data(data)
+            return data
+        return b''
+
+    def close(self):
+        self._finish(False)
+
+    def _finish(self, complete):
+        if self._done:
+            return
+        self._done = True
+        if self._on_done:
+            self._on_done(complete)
+
+
+class ResponseCache(object):
+    """
+    An on-disk cache of response bodies used to make conditional requests.
+    Each entry is a single file holding a json line of validators followed by the body
+    so replacing an entry is atomic. The oldest entries are removed once the byte budget is exceeded.
+    """
+
+    # TRICKY: lambda only provides 512MB in /tmp and it is shared with the files being processed
+    default_max_bytes = 50 * 1024 * 1024
+
+    def __init__(self, cache_dir, max_bytes=None, max_entry_bytes=2 * 1024 * 1024):
+        """
+        :param cache_dir: the directory where entries are stored. Existing entries will be re-used.
+        :param int max_bytes: the maximum number of bytes to keep on disk
+        :param int max_entry_bytes: larger bodies are not cached
+        """
+        if max_bytes is None:
+            max_bytes = ResponseCache.default_max_bytes
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self._make_dir()
+        self.size = 0
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.startswith('.'):
+                # incomplete entry
+                os.remove(path)
+            else:
+                self.size += os.path.getsize(path)
+
+    def _make_dir(self):
+        """
+        Creates the cache directory if it does not exist.
+        TRICKY: lambda handlers wipe the temp directory at the start of each run
+        so the directory can disappear while the cache is still in use.
+        :return: True if the directory was created
+        """
+        if os.path.isdir(self.cache_dir):
+            return False
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            # another thread created it first
+            if not os.path.isdir(self.cache_dir):
+                raise
+        return True
+
+    @staticmethod
+    def _key(url):
+        return md5(url.encode('utf-8')).hexdigest()
+
+    def lookup(self, url):
+        """
+        Opens a cached entry
+        :param url:
+        :return: a tuple of the validators and a file positioned at the start of the body or None
+        """
+        try:
+            entry = open(os.path.join(self.cache_dir, ResponseCache._key(url)), 'rb')
+        except IOError:
+            return None
+        try:
+            validators = json.loads(entry.readline())
+        except ValueError:
+            entry.close()
+            return None
+        return validators, entry
+
+    def writer(self, url, headers):
+        """
+        Returns a writer for a new entry or None if the response cannot be validated later.
+        None is also returned if the entry cannot be written so the response is simply not cached.
+        :param url:
+        :param dict headers: the response headers
+        :return:
+        """
+        validators = {}
+        if headers.get('etag'):
+            validators['etag'] = headers['etag']
+        if headers.get('last-modified'):
+            validators['last-modified'] = headers['last-modified']
+        length = headers.get('content-length')
+        if not validators or (length and length.isdigit() and int(length) > self.max_entry_bytes):
+            return None
+        try:
+            with self._lock:
+                if self._make_dir():
+                    # the previous entries were deleted with the directory
+                    self.size = 0
+            return _CacheWriter(self, ResponseCache._key(url), validators)
+        except (IOError, OSError):
+            return None
+
+    def _commit(self, key, tmp_path):
+        path = os.path.join(self.cache_dir, key)
+        with self._lock:
+            if self._make_dir():
+                self.size = 0
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.rename(tmp_path, path)
+            self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.startswith('.'):
+                entries.append((os.path.getmtime(path), path))
+        for mtime, path in sorted(entries):
+            if self.size <= self.max_bytes:
+                break
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+
+
+class _CacheWriter(object):
+    """
+    Collects a response body into a temporary file which replaces the cached entry once the body is complete
+    """
+
+    def __init__(self, cache, key, validators):
+        self.cache = cache
+        self.key = key
+        fd, self.path = tempfile.mkstemp('', '.', cache.cache_dir)
+        self.file = os.fdopen(fd, 'wb')
+        self.file.write(json.dumps(validators).encode('utf-8') + b'\n')
+        self.size = 0
+
+    # errors writing the cache must never fail the response so the entry is discarded instead
+
+    def write(self, data):
+        if not self.file:
+            return
+        self.size += len(data)
+        if self.size > self.cache.max_entry_bytes:
+            self.discard()
+            return
+        try:
+            self.file.write(data)
+        except (IOError, OSError):
+            self.discard()
+
+    def commit(self):
+        if not self.file:
+            return
+        try:
+            self.file.close()
+            self.file = None
+            self.cache._commit(self.key, self.path)
+        except (IOError, OSError):
+            self.file = None
+            self._remove()
+
+    def discard(self):
+        if not self.file:
+            return
+        try:
+            self.file.close()
+        except (IOError, OSError):
+            pass
+        self.file = None
+        self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class HttpClient(object):
+    """
+    Makes http requests over pooled keep-alive connections.
+    Compressed responses are requested, failed requests are retried with an exponential backoff
+    and GET responses are revalidated with conditional requests when a cache directory is given.
+    Errors are raised as urllib2.HTTPError and urllib2.URLError so this can replace urllib2.urlopen.
+    """
+
+    def __init__(self, timeout=60, retries=3, backoff=0.5, max_idle=4, max_redirects=5, cache_dir=None,
+                 cache_max_bytes=None, sleep=None):
+        """
+        :param int timeout: the socket timeout of each request
+        :param int retries: the number of times a failed request is sent again
+        :param float backoff: the seconds to wait before the first retry. This doubles with each retry.
+        :param int max_idle: the maximum number of idle connections kept open for each host
+        :param int max_redirects: the maximum number of redirects followed by a request
+        :param cache_dir: the directory where response bodies are cached. Responses are not cached by default.
+        :param int cache_max_bytes: the maximum number of bytes to keep in the cache
+        :param sleep: waits a number of seconds. Defaults to time.sleep
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_idle = max_idle
+        self.max_redirects = max_redirects
+        if cache_dir:
+            self.cache = ResponseCache(cache_dir, cache_max_bytes)
+        else:
+            self.cache = None
+        if sleep:
+            self.sleep = sleep
+        else:
+            self.sleep = time.sleep
+        self.requests = 0
+        self.connects = 0
+        self.cache_hits = 0
+        self._connections = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def urlopen(self, url):
+        """
+        Opens a url with a GET request like urllib2.urlopen
+        :param url:
+        :return: HttpResponse
+        """
+        return self.get(url)
+
+    def get(self, url):
+        """
+        Sends a GET request and follows any redirects.
+        If the body has been cached it is only downloaded again if it has changed.
+        :param url:
+        :raises urllib2.HTTPError: if the response status is an error
+        :return: HttpResponse
+        """
+        headers = {'Accept-Encoding': 'gzip'}
+        cached = None
+        if self.cache:
+            cached = self.cache.lookup(url)
+        if cached:
+            validators, entry = cached
+            if 'etag' in validators:
+                headers['If-None-Match'] = validators['etag']
+            if 'last-modified' in validators:
+                headers['If-Modified-Since'] = validators['last-modified']
+
+        try:
+            response = self.request('GET', url, headers)
+        except Exception:
+            if cached:
+                cached[1].close()
+            raise
+
+        if cached and response.status == 304:
+            response.read()
+            with self._lock:
+                self.cache_hits += 1
+            return HttpResponse(response.url, 200, 'OK', response.headers, entry, on_done=lambda complete: entry.close())
+        if cached:
+            entry.close()
+
+        if response.status >= 400:
+            response.read()
+            raise urllib2.HTTPError(url, response.status, response.reason, response.headers, None)
+
+        if self.cache and response.status == 200:
+            writer = self.cache.writer(url, response.headers)
+            if writer:
+                self._tee(response, writer)
+        return response
+
+    def head(self, url, follow_redirects=False):
+        """
+        Sends a HEAD request
+        :param url:
+        :param bool follow_redirects:
+        :return: HttpResponse
+        """
+        response = self.request('HEAD', url, follow_redirects=follow_redirects)
+        response.read()
+        return response
+
+    def get_range(self, url, start, end):
+        """
+        Reads part of a file with a Range request.
+        Range responses are never cached.
+        :param url:
+        :param int start: the offset of the first byte
+        :param int end: the offset of the last byte
+        :raises urllib2.HTTPError: if the response status is an error
+        :raises urllib2.URLError: if the server does not support range requests
+        :return: a tuple of the bytes and the size of the whole file
+        """
+        response = self.request('GET', url, {'Range': 'bytes={}-{}'.format(start, end)})
+        if response.status == 416:
+            # the range starts after the end of the file
+            response.read()
+            return b'', _content_range_size(response.headers)
+        if response.status >= 400:
+            response.read()
+            raise urllib2.HTTPError(url, response.status, response.reason, response.headers, None)
+        if response.status != 206:
+            # TRICKY: do not download the whole file
+            response.close()
+            raise urllib2.URLError('Range requests are not supported by {}'.format(url))
+        return response.read(), _content_range_size(response.headers)
+
+    def request(self, method, url, headers=None, follow_redirects=True):
+        """
+        Sends a request over a pooled connection.
+        Connection errors and temporary server errors are retried.
+        :param method: the http method. This should be idempotent because failed requests are sent again.
+        :param url:
+        :param dict headers: the request headers
+        :param bool follow_redirects:
+        :raises urllib2.URLError: if the server could not be reached
+        :return: HttpResponse
+        """
+        for redirect in range(self.max_redirects + 1):
+            p = urlparse(url)
+            host = (p.scheme, p.netloc)
+            path = p.path or '/'
+            if p.query:
+                path += '?' + p.query
+            conn, resp = self._send(host, method, path, headers or {})
+            response = self._wrap(url, host, conn, resp)
+            location = response.headers.get('location')
+            if not follow_redirects or resp.status not in REDIRECT_STATUSES or not location:
+                return response
+            response.read()
+            url = urljoin(url, location)
+        raise urllib2.HTTPError(url, resp.status, 'Too many redirects', response.headers, None)
+
+    def close(self):
+        """
+        Closes the idle connections
+        :return:
+        """
+        with self._lock:
+            connections = self._connections
+            self._connections = {}
+        for idle in connections.values():
+            for conn in idle:
+                conn.close()
+
+    def _send(self, host, method, path, headers):
+        attempt = 0
+        while True:
+            conn, reused = self._acquire(host)
+            try:
+                with self._lock:
+                    self.requests += 1
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if reused:
+                    # the server closed the idle connection so the request is sent again on a new connection
+                    continue
+                if isinstance(e, socket.gaierror) and e.errno == socket.EAI_NONAME:
+                    # the host does not exist so there is no point in trying again
+                    raise urllib2.URLError(e)
+                error = e
+            else:
+                if resp.status not in RETRY_STATUSES or attempt >= self.retries:
+                    return conn, resp
+                resp.read()
+                self._release(host, conn, resp)
+                error = None
+
+            if attempt >= self.retries:
+                raise urllib2.URLError(error)
+            self.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def _wrap(self, url, host, conn, resp):
+        headers = dict(resp.getheaders())
+
+        def on_done(complete):
+            if complete:
+                self._release(host, conn, resp)
+            else:
+                conn.close()
+
+        return HttpResponse(url, resp.status, resp.reason, headers, resp, on_done=on_done)
+
+    @staticmethod
+    def _tee(response, writer):
+        release = response._on_done
+
+        def on_done(complete):
+            if complete:
+                writer.commit()
+            else:
+                writer.discard()
+            release(complete)
+
+        response._on_data = writer.write
+        response._on_done = on_done
+
+    def _pool(self):
+        # TRICKY: a forked process must not share the sockets of its parent
+        if os.getpid() != self._pid:
+            self._connections = {}
+            self._pid = os.getpid()
+        return self._connections
+
+    def _acquire(self, host):
+        with self._lock:
+            idle = self._pool().get(host)
+            if idle:
+                return idle.pop(), True
+            self.connects += 1
+        return self._connect(host), False
+
+    def _release(self, host, conn, resp):
+        if not resp.will_close:
+            with self._lock:
+                idle = self._pool().setdefault(host, [])
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def _connect(self, host):
+        scheme, netloc = host
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
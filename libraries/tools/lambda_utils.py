@@ -66,6 +66,18 @@ def lambda_sec_remaining(context, dbname, lambda_suffix=None, dynamodb_handler=N
         return timedelta(seconds=0)
 
 
+def context_sec_remaining(context):
+    """
+    Returns the time remaining in seconds before the lambda times out according to the lambda context.
+    Unlike lambda_sec_remaining this does not read from the database so it is cheap enough to call often.
+    :param context:
+    :return: the seconds remaining or None if there is no context
+    """
+    if not context:
+        return None
+    return context.get_remaining_time_in_millis() / 1000.0
+
+
 def set_lambda_running(context, dbname, lambda_suffix=None, dynamodb_handler=None):
     """
     Sets the process information for this lambda.
@@ -5,7 +5,7 @@ import json
 from file_utils import read_file, download_rc, remove_tree
 
 
-def index_obs(lid, rid, format, temp_dir=None, downloader=None):
+def index_obs(lid, rid, format, temp_dir=None, downloader=None, cache=None):
     """
     Generates a JSON index of an OBS RC.
     The resulting content can be written to a file and uploaded for use in the uW 2.0 and tS 2.0 APIs
@@ -15,12 +15,13 @@ def index_obs(lid, rid, format, temp_dir=None, downloader=None):
     :param format:
     :param temp_dir: The temporary directory where files will be generated
     :param downloader: This is exposed to allow mocking the downloader
+    :param cache: an optional RCCache used to avoid downloading the RC again
     :return: the obs json blob
     """
     obs_sources = {}
     format_str = format['format']
     if rid == 'obs' and 'type=book' in format_str:
-        rc_dir = download_rc(lid, rid, format['url'], temp_dir, downloader)
+        rc_dir = download_rc(lid, rid, format['url'], temp_dir, downloader, format.get('modified'), cache)
         if not rc_dir: return obs_sources
 
         manifest = yaml.load(read_file(os.path.join(rc_dir, 'manifest.yaml')))
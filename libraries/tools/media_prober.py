@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for reading the metadata of remote media files without downloading them
+#
+
+import os
+from urlparse import urlparse
+
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4
+
+
+class RangeReader(object):
+    """
+    A read only file over http.
+    Only the blocks that are read are downloaded and neighbouring missing blocks are requested together.
+    """
+
+    def __init__(self, client, url, block_size=64 * 1024):
+        """
+        :param client: the HttpClient used to make the range requests
+        :param url:
+        :param int block_size: the number of bytes in each block
+        """
+        self.client = client
+        self.url = url
+        self.block_size = block_size
+        self.requests = 0
+        self._blocks = {}
+        self._pos = 0
+        self.size = None
+        # the first block also tells us the size of the file
+        self._fetch(0, 0)
+        if self.size is None:
+            raise IOError('Could not read the size of {}'.format(url))
+
+    def _fetch(self, first, last):
+        """
+        Downloads a run of blocks in a single request
+        :param int first: the index of the first block
+        :param int last: the index of the last block
+        :return:
+        """
+        start = first * self.block_size
+        self.requests += 1
+        data, size = self.client.get_range(self.url, start, (last + 1) * self.block_size - 1)
+        if size is not None:
+            self.size = size
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            self._blocks[index] = data[offset:offset + self.block_size]
+
+    def read(self, n=-1):
+        end = self.size
+        if n is not None and n >= 0:
+            end = min(self._pos + n, self.size)
+        if end <= self._pos:
+            return b''
+
+        first = self._pos // self.block_size
+        last = (end - 1) // self.block_size
+        missing = [index for index in range(first, last + 1) if index not in self._blocks]
+        while missing:
+            run_end = 0
+            while run_end + 1 < len(missing) and missing[run_end + 1] == missing[run_end] + 1:
+                run_end += 1
+            self._fetch(missing[0], missing[run_end])
+            missing = missing[run_end + 1:]
+
+        blocks = []
+        for index in range(first, last + 1):
+            block_start = index * self.block_size
+            blocks.append(self._blocks[index][max(self._pos - block_start, 0):end - block_start])
+        data = b''.join(blocks)
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self.size
+        if offset < 0:
+            raise IOError('Invalid seek to {}'.format(offset))
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._blocks = {}
+
+
+class MediaProber(object):
+    """
+    Reads the size and playback length of remote media files with range requests.
+    Only the headers of mp3 files and the atoms of mp4 files that describe the media are downloaded.
+    """
+
+    def __init__(self, client, block_size=64 * 1024):
+        """
+        :param client: the HttpClient used to make the range requests
+        :param int block_size: the number of bytes downloaded at a time
+        """
+        self.client = client
+        self.block_size = block_size
+
+    def probe(self, url, length=True):
+        """
+        Reads the metadata of a remote file
+        :param url:
+        :param bool length: read the playback length of mp3 and mp4 files
+        :return: a dictionary with the size and, if requested, the length in seconds
+        """
+        _, ext = os.path.splitext(urlparse(url).path)
+        ext = ext.lower()
+        if not length or ext not in ('.mp3', '.mp4'):
+            data, size = self.client.get_range(url, 0, 0)
+            return {'size': size}
+
+        reader = RangeReader(self.client, url, self.block_size)
+        info = {'size': reader.size}
+        if ext == '.mp3':
+            info['length'] = MP3(reader).info.length
+        else:
+            info['length'] = MP4(reader).info.length
+        return info
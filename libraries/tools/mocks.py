@@ -5,6 +5,8 @@ This allows us to avoid designing ways to pass mock objects into our code (which
 """
 
 import codecs
+import datetime
+import hashlib
 import json
 import os
 import shutil
@@ -176,13 +178,35 @@ class MockS3Handler:
     def upload_file(self, path, key, cache_time=600):
         upload_path = os.path.join(self.temp_dir, key)
         parent_dir = os.path.dirname(upload_path)
-        if not os.path.isdir(parent_dir):
+        try:
             os.makedirs(parent_dir)
+        except OSError:
+            # TRICKY: uploads may run in parallel so the directory could have been created by another thread
+            if not os.path.isdir(parent_dir):
+                raise
 
         shutil.copy(path, upload_path)
         self.__uploads[key] = upload_path
         self._recent_uploads[key] = upload_path
 
+    def list_objects(self, prefix=''):
+        """
+        Lists the available files like libraries.tools.s3_index.list_objects
+        :param prefix:
+        :return:
+        """
+        objects = {}
+        for key, path in self.__uploads.items():
+            if key.startswith(prefix) and os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    etag = hashlib.md5(f.read()).hexdigest()
+                objects[key] = {
+                    'size': os.path.getsize(path),
+                    'etag': etag,
+                    'modified': datetime.datetime.utcfromtimestamp(os.path.getmtime(path)).isoformat()
+                }
+        return objects
+
     def download_file(self, key, path):
         if key in self.__uploads:
             shutil.copy(self.__uploads[key], path)
@@ -224,7 +248,7 @@ class MockDynamodbHandler(object):
         item = self.get_item(record_keys)
         if not item:
             item = row.copy()
-            item.update(row)
+            item.update(record_keys)
             self.insert_item(item)
         else:
             item.update(row)
@@ -300,7 +324,7 @@ class MockSigner(object):
         self.__should_fail_signing = False
         self.__should_fail_verification = False
 
-    def sign_file(self, file_to_sign, private_pem_file=None):
+    def sign_file(self, file_to_sign, private_pem_file=None, digest=None):
         if self.__should_fail_signing:
             raise Exception('Mock signing failed')
 
@@ -311,7 +335,7 @@ class MockSigner(object):
         open(sig_file_name, 'a').close()
         return sig_file_name
 
-    def verify_signature(self, content_file, sig_file, public_pem_file=None):
+    def verify_signature(self, content_file, sig_file, public_pem_file=None, digest=None):
         if self.__should_fail_verification:
             raise RuntimeError('Mock verification failed')
 
@@ -343,4 +367,7 @@ class MockChecker(ConsistencyChecker):
         self._urls_do_exist = True
 
     def _url_exists(self, url):
-        return self._urls_do_exist
\ No newline at end of file
+        return self._urls_do_exist
+
+    def _urls_exist(self, urls):
+        return dict((url, self._urls_do_exist) for url in urls)
\ No newline at end of file
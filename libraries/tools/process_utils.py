@@ -0,0 +1,149 @@
+import os
+import pickle
+import select
+import subprocess
+import sys
+import time
+import traceback
+
+
+def _worker_env():
+    """
+    Returns the environment for a worker so it can import the same modules as this process
+    :return: dict
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.abspath(p) if p else os.getcwd() for p in sys.path])
+    return env
+
+
+def _start_worker(func, item):
+    """
+    Starts a new interpreter that applies func to item.
+    TRICKY: the worker is exec'd rather than forked from this process.
+    A forked child would inherit every lock held by our other threads (logging, tempfile, connection pools)
+    and would hang forever on any of them that was taken at the moment of the fork.
+    :return: subprocess.Popen
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'libraries.tools.process_utils'], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, env=_worker_env(), close_fds=True)
+    try:
+        pickle.dump((func, item), process.stdin, pickle.HIGHEST_PROTOCOL)
+        process.stdin.close()
+    except Exception:
+        _stop_worker(process)
+        raise
+    return process
+
+
+def _stop_worker(process):
+    if process.poll() is None:
+        process.kill()
+    process.stdout.close()
+    process.wait()
+
+
+def _finish_worker(process):
+    """
+    Reads the outcome of a worker once it has started writing it
+    :return: a tuple of whether the worker succeeded and the result or error message
+    """
+    try:
+        # read before waiting so large results do not block the worker
+        success, result = pickle.load(process.stdout)
+    except (EOFError, pickle.UnpicklingError):
+        success, result = False, None
+    finally:
+        process.stdout.close()
+    process.wait()
+    if not success and result is None:
+        result = 'process exited with code {}'.format(process.returncode)
+    return success, result
+
+
+def _run_worker():
+    """
+    The entry point of a worker.
+    Reads the function and item from stdin and writes the outcome to stdout.
+    """
+    out_file = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    # anything printed by the function goes to stderr so it cannot corrupt the result
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    func, item = pickle.load(sys.stdin)
+    try:
+        outcome = (True, func(item))
+    except Exception as e:
+        outcome = (False, '{}\n{}'.format(e, traceback.format_exc()))
+    pickle.dump(outcome, out_file, pickle.HIGHEST_PROTOCOL)
+    out_file.close()
+
+
+def imap_processes(func, items, max_workers=4, timeout=None):
+    """
+    Applies func to each item in a bounded number of worker processes.
+    Results are yielded as soon as each item finishes so callers can act on them
+    while the remaining items are still being processed.
+    Each item runs in its own interpreter which makes this suitable for CPU bound work
+    and for libraries that are not thread safe. It is also safe to call from a multithreaded process.
+    Items and results are passed through pipes because lambda does not provide /dev/shm for multiprocessing.Pool.
+    If an item fails or times out no new items will be started and an exception is raised
+    once the running items have finished.
+    :param func: a module level function accepting a single item. The function, items and results must be picklable.
+    :param list items: the items to process
+    :param int max_workers: the maximum number of processes to run at once
+    :param int timeout: the maximum number of seconds a single item may run before it is killed.
+    Items are only run in this process when there is no timeout and they cannot run in parallel.
+    :return: a generator of (item, result) tuples in the order the items finished
+    """
+    items = list(items)
+    if max_workers is None or max_workers < 1:
+        max_workers = 1
+    if timeout is None and (max_workers == 1 or len(items) <= 1):
+        for item in items:
+            yield item, func(item)
+        return
+
+    pending = list(reversed(items))
+    running = {}
+    error = None
+    try:
+        while running or (pending and not error):
+            while pending and not error and len(running) < max_workers:
+                item = pending.pop()
+                process = _start_worker(func, item)
+                running[process.stdout] = (process, item, time.time())
+
+            wait = None
+            if timeout is not None:
+                oldest = min(started for process, item, started in running.values())
+                wait = max(0, oldest + timeout - time.time())
+            ready, _, _ = select.select(list(running.keys()), [], [], wait)
+
+            for out in ready:
+                process, item, started = running.pop(out)
+                success, result = _finish_worker(process)
+                if not success:
+                    if not error:
+                        error = result
+                    continue
+                if not error:
+                    yield item, result
+
+            if timeout is not None:
+                now = time.time()
+                for out, (process, item, started) in running.items():
+                    if now - started >= timeout:
+                        del running[out]
+                        _stop_worker(process)
+                        if not error:
+                            error = 'process timed out after {} seconds'.format(timeout)
+    finally:
+        for process, item, started in running.values():
+            _stop_worker(process)
+
+    if error:
+        raise Exception(error)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    _run_worker()
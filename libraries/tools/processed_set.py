@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+#
+# Helpers for storing the finished processes of a catalog status compactly
+#
+
+import base64
+import json
+import zlib
+
+# DynamoDB items are limited to 400KB so large sets are split into parts smaller than this
+MAX_PART_SIZE = 300000
+
+
+def pack_json(data):
+    """
+    Encodes an object as compressed json
+    :param data:
+    :return: the packed string
+    """
+    data = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return base64.b64encode(zlib.compress(data.encode('utf-8'), 9)).decode('ascii')
+
+
+def unpack_json(value):
+    """
+    Decodes an object packed with pack_json
+    :param value: the packed string
+    :return:
+    """
+    return json.loads(zlib.decompress(base64.b64decode(value)).decode('utf-8'))
+
+
+def pack_processed(processed):
+    """
+    Encodes the finished processes as a compressed string.
+    :param dict processed: a dictionary of process ids and their catalog keys
+    :return: the packed string
+    """
+    return pack_json(processed)
+
+
+def unpack_processed(value):
+    """
+    Decodes the finished processes.
+    Statuses written before the processes were packed are returned as a dictionary.
+    :param value: the packed string or the dictionary or list of processes
+    :return: a dictionary of process ids and their catalog keys
+    """
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, list):
+        # the earliest statuses only listed the process ids
+        return dict((process_id, []) for process_id in value)
+    return unpack_json(value)
+
+
+def _shard_keys(keys, index):
+    return dict((k, '{}.processed.{}'.format(v, index)) for k, v in keys.items())
+
+
+def save_processed(db_handler, keys, status, max_part_size=MAX_PART_SIZE):
+    """
+    Prepares a status record for writing with the finished processes packed.
+    If the packed processes are too large for a single record the extra parts
+    are written to their own records first.
+    :param db_handler: the DynamoDBHandler (or MockDynamodbHandler) of the status table
+    :param dict keys: the keys of the status record e.g. {'api_version': 'ts.2'}
+    :param dict status: the status record with a dictionary of processes
+    :param int max_part_size: the maximum length of the packed processes in each record
+    :return: a copy of the status record that should be written
+    """
+    packed = pack_processed(status['processed'])
+    parts = [packed[i:i + max_part_size] for i in range(0, len(packed), max_part_size)] or ['']
+    for index, part in enumerate(parts[1:], 1):
+        db_handler.update_item(_shard_keys(keys, index), {
+            'processed': part,
+            # TRICKY: identifies the record as part of a status so it is not treated as a status itself
+            'shard_of': keys
+        })
+    record = dict(status)
+    record['processed'] = parts[0]
+    record['processed_shards'] = len(parts) - 1
+    return record
+
+
+def load_processed(db_handler, keys, status):
+    """
+    Reads the finished processes of a status record including any parts stored in other records.
+    A set that cannot be read is treated as empty so the processes will simply be run again.
+    :param db_handler: the DynamoDBHandler (or MockDynamodbHandler) of the status table
+    :param dict keys: the keys of the status record e.g. {'api_version': 'ts.2'}
+    :param dict status: the status record
+    :return: a dictionary of process ids and their catalog keys
+    """
+    value = status.get('processed')
+    if isinstance(value, (dict, list)):
+        return unpack_processed(value)
+    try:
+        parts = [value or '']
+        for index in range(1, int(status.get('processed_shards', 0)) + 1):
+            parts.append(db_handler.get_item(_shard_keys(keys, index))['processed'])
+        return unpack_processed(''.join(parts))
+    except Exception:
+        return {}
+
+
+def is_shard(record):
+    """
+    Checks if a record of the status table holds part of the finished processes of another status
+    :param record:
+    :return:
+    """
+    return 'shard_of' in record
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for caching extracted resource containers on disk
+#
+
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import md5
+
+
+class RCCache(object):
+    """
+    An on-disk cache of extracted resource containers.
+    Entries are keyed by the url and version (modified date or ETag) of the RC
+    and evicted in least recently used order once the byte budget is exceeded.
+    """
+
+    # TRICKY: lambda only provides 512MB in /tmp and the RCs are also extracted for processing
+    default_max_bytes = 200 * 1024 * 1024
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        :param cache_dir: the directory where entries are stored. Existing entries will be re-used.
+        :param max_bytes: the maximum number of bytes to keep on disk
+        """
+        if not cache_dir:
+            cache_dir = tempfile.mkdtemp('', 'rc_cache', None)
+        if max_bytes is None:
+            max_bytes = RCCache.default_max_bytes
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load()
+
+    @staticmethod
+    def _key(url, version):
+        return md5(u'{}\n{}'.format(url, version).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _dir_size(path):
+        size = 0
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+        return size
+
+    def _load(self):
+        """
+        Indexes entries left over from a previous instance, oldest first
+        :return:
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.'):
+                # incomplete entry
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.isdir(path):
+                entries.append((os.path.getmtime(path), name))
+        for mtime, key in sorted(entries):
+            size = RCCache._dir_size(os.path.join(self.cache_dir, key))
+            self._entries[key] = size
+            self.size += size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            self.size -= size
+
+    def checkout(self, url, version, dest_dir):
+        """
+        Copies a cached RC into the destination.
+        Callers receive their own copy because they are free to modify or delete it.
+        :param url: the url of the RC
+        :param version: the modified date or ETag of the RC
+        :param dest_dir: the directory that will receive the extracted RC
+        :return: True if the RC was found in the cache
+        """
+        key = RCCache._key(url, version)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            self._entries[key] = self._entries.pop(key)
+            self.hits += 1
+            src_dir = os.path.join(self.cache_dir, key)
+            os.utime(src_dir, None)
+            if os.path.isdir(dest_dir):
+                shutil.rmtree(dest_dir, ignore_errors=True)
+            shutil.copytree(src_dir, dest_dir)
+        return True
+
+    def store(self, url, version, src_dir):
+        """
+        Adds an extracted RC to the cache.
+        RCs larger than the budget are not cached.
+        :param url: the url of the RC
+        :param version: the modified date or ETag of the RC
+        :param src_dir: the directory containing the extracted RC. This is not modified.
+        :return: True if the RC was cached
+        """
+        size = RCCache._dir_size(src_dir)
+        if size > self.max_bytes:
+            return False
+        key = RCCache._key(url, version)
+        staging_dir = os.path.join(self.cache_dir, '.{}.{}'.format(key, threading.current_thread().ident))
+        shutil.copytree(src_dir, staging_dir)
+        with self._lock:
+            if key in self._entries:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                return True
+            os.rename(staging_dir, os.path.join(self.cache_dir, key))
+            self._entries[key] = size
+            self.size += size
+            self._evict()
+        return True
+
+    def clear(self):
+        """
+        Removes all entries from the cache
+        :return:
+        """
+        with self._lock:
+            for key in self._entries:
+                shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for answering existence checks from a listing of an s3 bucket
+#
+
+import threading
+import time
+import urllib
+import urlparse
+
+from libraries.tools.file_utils import load_json_object, write_file
+
+
+def list_objects(s3_handler, prefix=''):  # pragma: no cover
+    """
+    Lists the objects in a bucket.
+    :param s3_handler: an S3Handler
+    :param prefix: limits the listing to keys with this prefix
+    :return: a dictionary of object details keyed by object key
+    """
+    objects = {}
+    paginator = s3_handler.client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=s3_handler.bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = {
+                'size': obj['Size'],
+                'etag': obj['ETag'].strip('"'),
+                'modified': obj['LastModified'].isoformat()
+            }
+    return objects
+
+
+class S3Index(object):
+    """
+    An in-memory index of the objects in a bucket.
+    Keys are listed a prefix at a time (e.g. "en/ulb/") the first time they are looked up
+    and prefixes are listed again once they are older than max_age.
+    Changes are only written to disk by save() which should be called once at the end of a run.
+    """
+
+    def __init__(self, s3_handler, hosts, path=None, max_age=3600, prefix_depth=2, list_handler=None):
+        """
+        :param s3_handler: the S3Handler (or MockS3Handler) of the bucket
+        :param list hosts: the url host names that are served from the bucket
+        :param path: optional file where the index is saved between runs
+        :param int max_age: the number of seconds before a listed prefix is listed again
+        :param int prefix_depth: the number of path segments in the listed prefixes
+        :param list_handler: lists the objects in the bucket. Defaults to list_objects
+        """
+        self.s3_handler = s3_handler
+        self.hosts = hosts
+        self.path = path
+        self.max_age = max_age
+        self.prefix_depth = prefix_depth
+        if list_handler:
+            self.list_objects = list_handler
+        else:
+            self.list_objects = list_objects  # pragma: no cover
+        self.listings = 0
+        self._objects = {}
+        self._prefixes = {}
+        # prefixes that are being listed by a thread
+        self._listing = {}
+        self._lock = threading.RLock()
+        if path:
+            self._load()
+
+    def _load(self):
+        data = load_json_object(self.path, {})
+        if isinstance(data, dict):
+            self._objects = data.get('objects', {})
+            self._prefixes = data.get('prefixes', {})
+
+    def save(self):
+        """
+        Saves the index so it can be re-used by the next run
+        :return:
+        """
+        if not self.path:
+            return
+        with self._lock:
+            write_file(self.path, {
+                'objects': self._objects,
+                'prefixes': self._prefixes
+            })
+
+    def _prefix(self, key):
+        """
+        Returns the listing prefix of a key
+        """
+        parts = key.split('/')
+        if len(parts) <= self.prefix_depth:
+            return '/'.join(parts[:-1] + [''])
+        return '/'.join(parts[:self.prefix_depth] + [''])
+
+    def _is_fresh(self, key):
+        """
+        Checks if the key is covered by a listing that has not expired
+        :param key:
+        :return: bool
+        """
+        now = time.time()
+        parts = key.split('/')
+        # every prefix that could contain the key, from the whole bucket down to the key's folder
+        for depth in range(len(parts)):
+            listed = self._prefixes.get('/'.join(parts[:depth] + ['']))
+            if listed is not None and now - listed < self.max_age:
+                return True
+        return False
+
+    def refresh(self, prefix=''):
+        """
+        Lists the objects under the prefix and replaces the indexed objects with the same prefix
+        :param prefix:
+        :return:
+        """
+        objects = self.list_objects(self.s3_handler, prefix)
+        with self._lock:
+            self.listings += 1
+            for key in [k for k in self._objects if k.startswith(prefix)]:
+                del self._objects[key]
+            self._objects.update(objects)
+            # nested prefixes are covered by the new listing
+            for p in [p for p in self._prefixes if p.startswith(prefix)]:
+                del self._prefixes[p]
+            self._prefixes[prefix] = time.time()
+
+    def get(self, key):
+        """
+        Returns the details of an object
+        :param key:
+        :return: a dictionary with the size, etag, and modified date or None if the object does not exist
+        """
+        prefix = self._prefix(key)
+        while True:
+            with self._lock:
+                if self._is_fresh(key):
+                    return self._objects.get(key)
+                # only one thread lists a prefix and the others wait for it
+                listing = self._listing.get(prefix)
+                if listing is None:
+                    listing = threading.Event()
+                    self._listing[prefix] = listing
+                    break
+            # the listing may have failed so check again once it is done
+            listing.wait()
+
+        # TRICKY: the lock is not held while listing so other keys can be looked up in the meantime
+        try:
+            self.refresh(prefix)
+        finally:
+            with self._lock:
+                del self._listing[prefix]
+            listing.set()
+        with self._lock:
+            return self._objects.get(key)
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def add(self, key, size=None, etag=None, modified=None):
+        """
+        Records an object that was uploaded after its prefix was listed
+        :param key:
+        :param size:
+        :param etag:
+        :param modified:
+        :return:
+        """
+        with self._lock:
+            self._objects[key] = {
+                'size': size,
+                'etag': etag,
+                'modified': modified
+            }
+
+    def key_from_url(self, url):
+        """
+        Returns the object key of a url served from the bucket
+        :param url:
+        :return: the key or None if the url is not in the bucket
+        """
+        url_info = urlparse.urlparse(url)
+        if url_info.hostname not in self.hosts:
+            return None
+        return urllib.unquote(url_info.path).lstrip('/')
+
+    def url_exists(self, url):
+        """
+        Checks if a url exists in the bucket
+        :param url:
+        :return: True or False if the url is in the bucket otherwise None
+        """
+        key = self.key_from_url(url)
+        if not key:
+            return None
+        return self.exists(key)
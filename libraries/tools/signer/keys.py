@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+#
+# SHA-384 signing of precomputed digests with openssl.
+# Files are hashed once in python (often while they are downloaded) so openssl only has to sign the digest.
+#
+
+import hashlib
+import os
+import shutil
+import tempfile
+from subprocess import Popen, PIPE
+
+
+class UnsupportedKeyError(Exception):
+    """
+    Raised when a key cannot be used to sign digests.
+    Files must be signed with `openssl dgst` instead.
+    """
+    pass
+
+
+class KeyFileError(Exception):
+    """
+    Raised when a key file is missing or is not the expected kind of key
+    """
+    pass
+
+
+def _openssl(args, data=None):
+    """
+    Runs an openssl command
+    :param list args: the arguments after `openssl`
+    :param data: the bytes written to stdin
+    :return: a tuple of the return code, stdout and stderr
+    """
+    com = Popen(['openssl'] + args, shell=False, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    out, err = com.communicate(data)
+    return com.returncode, out, err
+
+
+def _check_key_file(path, args):
+    """
+    Checks that openssl can read the key without a pass phrase
+    :param path:
+    :param list args: extra arguments for `openssl pkey`
+    :return:
+    """
+    if not os.path.isfile(path):
+        raise KeyFileError('unable to load key file {}: the file does not exist'.format(path))
+
+    with open(path, 'rb') as in_file:
+        if 'ENCRYPTED' in in_file.read():
+            raise UnsupportedKeyError('Encrypted key file: {}'.format(path))
+
+    # an empty pass phrase stops openssl from prompting for one
+    code, out, err = _openssl(['pkey', '-in', path, '-noout', '-passin', 'pass:'] + args)
+    if code != 0:
+        raise KeyFileError('unable to load key file {}: {}'.format(path, err.strip()))
+
+
+class PrivateKey(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def sign_digest(self, digest):
+        """
+        Signs a SHA-384 digest.
+        The signature is the same as `openssl dgst -sha384 -sign` would produce for the file
+        :param digest: the binary SHA-384 digest
+        :return: the binary signature
+        """
+        code, out, err = _openssl(['pkeyutl', '-sign', '-inkey', self.path, '-pkeyopt', 'digest:sha384'], digest)
+        if code != 0:
+            raise Exception(err)
+        return out
+
+
+class PublicKey(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def verify_digest(self, digest, signature):
+        """
+        Verifies the signature of a SHA-384 digest
+        :param digest: the binary SHA-384 digest
+        :param signature: the binary signature
+        :return: bool
+        """
+        temp_dir = tempfile.mkdtemp(prefix='verify_digest_')
+        try:
+            signature_path = os.path.join(temp_dir, 'signature.sig')
+            with open(signature_path, 'wb') as out_file:
+                out_file.write(signature)
+            code, out, err = _openssl(['pkeyutl', '-verify', '-pubin', '-inkey', self.path, '-pkeyopt',
+                                       'digest:sha384', '-sigfile', signature_path], digest)
+            return code == 0
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def load_private_key(path):
+    """
+    Loads a private key that can sign digests
+    :param path: the pem file
+    :return: PrivateKey
+    """
+    _check_key_file(path, [])
+    return PrivateKey(path)
+
+
+def load_public_key(path):
+    """
+    Loads a public key that can verify digests
+    :param path: the pem file
+    :return: PublicKey
+    """
+    _check_key_file(path, ['-pubin'])
+    return PublicKey(path)
+
+
+def file_sha384(path, block_size=1024 * 1024):
+    """
+    Calculates the SHA-384 digest of a file without loading it into memory
+    :param path:
+    :param block_size:
+    :return: the binary digest
+    """
+    sha384 = hashlib.sha384()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha384.update(block)
+    return sha384.digest()
@@ -4,41 +4,80 @@ import os
 import shlex
 import shutil
 import tempfile
-from base64 import b64decode
+import threading
+from base64 import b64decode, b64encode
 from subprocess import Popen, PIPE
 
 from libraries.tools.url_utils import download_file
 
 from aws_decrypt import decrypt_file
+from keys import load_private_key, load_public_key, file_sha384, UnsupportedKeyError
 from libraries.tools.file_utils import write_file
 
 
+def _openssl_base64(data):
+    """
+    Base64 encodes data the same way as `openssl base64` (64 characters per line)
+    :param data:
+    :return:
+    """
+    encoded = b64encode(data)
+    return ''.join(encoded[i:i + 64] + '\n' for i in range(0, len(encoded), 64))
+
+
 class Signer(object):
 
-    def __init__(self, priv_pem_path=None, pub_pem_path=None):
+    def __init__(self, priv_pem_path=None, pub_pem_path=None, use_openssl=False):
         """
         Initialize a new signer object
         :param string priv_pem_path: path to the default private pem file. If encrypted (has .enc extension) it will be decrypted by aws
         :param string pub_pem_path: path to the default public pem file.
+        :param bool use_openssl: always sign and verify whole files with `openssl dgst`.
+        By default keys are checked once and only the SHA-384 digest of each file is signed.
+        Keys that cannot sign digests (e.g. encrypted pems) always use `openssl dgst`.
         """
         self.__priv_pem = priv_pem_path
         self.__pub_pem = pub_pem_path
+        self.__decrypted_priv_pem = None
         self.__temp_dir = tempfile.mkdtemp(prefix='signer_')
+        self.use_openssl = use_openssl
+        self.__keys = {}
+        self.__keys_lock = threading.Lock()
+        self.__pem_lock = threading.Lock()
 
     def __del__(self):
         shutil.rmtree(self.__temp_dir, ignore_errors=True)
 
-    def sign_file(self, file_to_sign, private_pem_file=None):
+    def sign_file(self, file_to_sign, private_pem_file=None, digest=None):
         """
         Generates a .sig file and returns the full file name of the .sig file
         :param str|unicode file_to_sign:
         :param str|unicode|None private_pem_file:
+        :param str|None digest: the SHA-384 digest of the file if it is already known
         :return: str|unicode The full file name of the .sig file
         """
         # if pem file was not passed, use the default one
         if not private_pem_file:
             private_pem_file = self._default_priv_pem()
 
+        key = self._load_key(private_pem_file, load_private_key)
+        if key is None:
+            return self._openssl_sign_file(file_to_sign, private_pem_file)
+
+        if digest is None:
+            digest = file_sha384(file_to_sign)
+        signature = key.sign_digest(digest)
+        sig_file_name = '{}.sig'.format(os.path.splitext(file_to_sign)[0])
+        self._write_sig_file(sig_file_name, _openssl_base64(signature))
+        return sig_file_name
+
+    def _openssl_sign_file(self, file_to_sign, private_pem_file):
+        """
+        Signs the file with the openssl command line tool
+        :param file_to_sign:
+        :param private_pem_file:
+        :return: The full file name of the .sig file
+        """
         # use openssl to sign the content
         sha384_file = file_to_sign + '.sha384'
         sign_com = 'openssl dgst -sha384 -sign {0} -out {1} {2}'.format(private_pem_file, sha384_file, file_to_sign)
@@ -64,36 +103,63 @@ class Signer(object):
         with codecs.open(sig_file_name, 'r', encoding='utf-8') as in_file:
             signed_content = in_file.read()
 
-        # save the signed content
+        self._write_sig_file(sig_file_name, signed_content)
+        return sig_file_name
+
+    @staticmethod
+    def _write_sig_file(sig_file_name, signed_content):
+        """
+        Saves the base64 encoded signature
+        :param sig_file_name:
+        :param signed_content:
+        :return:
+        """
         file_content = []
         signature = {'si': 'uW', 'sig': signed_content}
         file_content.append(signature)
         write_file(sig_file_name, file_content)
 
-        return sig_file_name
-
-    def verify_signature(self, content_file, sig_file, public_pem_file=None):
+    def verify_signature(self, content_file, sig_file, public_pem_file=None, digest=None):
         """
         Verify that the file content has not changed since it was signed
         :param str|unicode content_file:
         :param str|unicode sig_file:
         :param str|unicode|None public_pem_file: If left null the default pem file will be used
+        :param str|None digest: the SHA-384 digest of the content file if it is already known
         :return:
         """
+        # if pem file was not passed, use the default one
+        if not public_pem_file:
+            public_pem_file = self._default_pub_pem()
 
-        temp_dir = tempfile.mkdtemp(prefix='tempVerify_')
+        # get the uW signature from the sig file
+        with codecs.open(sig_file, 'r', 'utf-8-sig') as in_file:
+            sig_file_content = json.loads(in_file.read())
 
-        try:
+        signature = [x['sig'] for x in sig_file_content if x['si'] == 'uW'][0]
+
+        key = self._load_key(public_pem_file, load_public_key)
+        if key is None:
+            return self._openssl_verify_signature(content_file, signature, public_pem_file)
 
-            # if pem file was not passed, use the default one
-            if not public_pem_file:
-                public_pem_file = self._default_pub_pem()
+        if digest is None:
+            digest = file_sha384(content_file)
+        if key.verify_digest(digest, b64decode(signature)):
+            return True
 
-            # get the uW signature from the sig file
-            with codecs.open(sig_file, 'r', 'utf-8-sig') as in_file:
-                sig_file_content = json.loads(in_file.read())
+        raise RuntimeError('Verification Failure')
+
+    def _openssl_verify_signature(self, content_file, signature, public_pem_file):
+        """
+        Verifies the signature with the openssl command line tool
+        :param content_file:
+        :param signature: the base64 encoded signature
+        :param public_pem_file:
+        :return:
+        """
+        temp_dir = tempfile.mkdtemp(prefix='tempVerify_')
 
-            signature = [x['sig'] for x in sig_file_content if x['si'] == 'uW'][0]
+        try:
             signature_path = os.path.join(temp_dir, 'signature.sig')
 
             # save the signature to a temp file
@@ -117,6 +183,25 @@ class Signer(object):
             if temp_dir and os.path.isdir(temp_dir):
                 shutil.rmtree(temp_dir, ignore_errors=True)
 
+    def _load_key(self, pem_file, loader):
+        """
+        Loads a key once so it can be used for many files
+        :param pem_file:
+        :param loader: load_private_key or load_public_key
+        :return: the key or None if openssl should be used instead
+        """
+        if self.use_openssl:
+            return None
+
+        cache_key = (loader.__name__, pem_file)
+        with self.__keys_lock:
+            if cache_key not in self.__keys:
+                try:
+                    self.__keys[cache_key] = loader(pem_file)
+                except UnsupportedKeyError:
+                    self.__keys[cache_key] = None
+            return self.__keys[cache_key]
+
     def _default_priv_pem(self):
         """
         Returns the path to the default private pem.
@@ -127,13 +212,20 @@ class Signer(object):
             raise Exception('No default private pem was specified')
 
         if self.__priv_pem.endswith('.enc'):
-            # decrypt pem
-            pem_file = os.path.join(tempfile.gettempdir(), 'uW-sk.pem')
-            result = decrypt_file(self.__priv_pem, pem_file)
-            if not result:
-                raise Exception('Not able to decrypt the pem file.')
-
-            return pem_file
+            # TRICKY: files may be signed from several threads at once
+            with self.__pem_lock:
+                # the pem is only decrypted once
+                if self.__decrypted_priv_pem and os.path.isfile(self.__decrypted_priv_pem):
+                    return self.__decrypted_priv_pem
+
+                # decrypt pem
+                pem_file = os.path.join(tempfile.gettempdir(), 'uW-sk.pem')
+                result = decrypt_file(self.__priv_pem, pem_file)
+                if not result:
+                    raise Exception('Not able to decrypt the pem file.')
+
+                self.__decrypted_priv_pem = pem_file
+                return pem_file
         else:
             return self.__priv_pem
 
@@ -143,9 +235,10 @@ class Signer(object):
         If a default has not been manually specified then the aws pem will be downloaded
         :return:
         """
-        if not self.__pub_pem:
-            pem_path = os.path.join(self.__temp_dir, 'uW-vk.pem')
-            download_file('https://pki.unfoldingword.org/uW-vk.pem', pem_path)
-            self.__pub_pem = pem_path
+        with self.__pem_lock:
+            if not self.__pub_pem:
+                pem_path = os.path.join(self.__temp_dir, 'uW-vk.pem')
+                download_file('https://pki.unfoldingword.org/uW-vk.pem', pem_path)
+                self.__pub_pem = pem_path
 
-        return self.__pub_pem
+            return self.__pub_pem
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for recording the progress of a catalog build without writing the status after every step
+#
+
+import threading
+import time
+
+from libraries.tools.processed_set import save_processed
+
+
+class StatusCheckpoint(object):
+    """
+    Coalesces updates to a catalog status record in the status table.
+    Finished processes are collected in memory and the status is written once enough processes
+    have finished, enough time has passed, or the lambda is about to time out.
+    """
+
+    def __init__(self, db_handler, keys, status, max_pending=25, max_age=60, min_sec_remaining=60,
+                 check_abort=False, before_write=None, sec_remaining=None, clock=None):
+        """
+        :param db_handler: the DynamoDBHandler (or MockDynamodbHandler) of the status table
+        :param dict keys: the keys of the status record e.g. {'api_version': 'ts.2'}
+        :param dict status: the status record. This must contain a "processed" dictionary
+        :param int max_pending: the number of finished processes that are collected before the status is written
+        :param int max_age: the number of seconds finished processes may wait before the status is written
+        :param int min_sec_remaining: once the lambda has fewer seconds than this left the status is written
+        after every finished process
+        :param bool check_abort: the status record is read before each write and an exception is raised
+        if the state of the same build has been set to "aborted"
+        :param before_write: called before the status is written e.g. to wait for the uploads of the finished processes.
+        If this raises, the processes finished since the last write are forgotten so they will be run again.
+        :param sec_remaining: returns the seconds left before the lambda times out or None if there is no time limit
+        :param clock: returns the current time in seconds. Defaults to time.time
+        """
+        self.db_handler = db_handler
+        self.keys = keys
+        self.status = status
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.min_sec_remaining = min_sec_remaining
+        self.check_abort = check_abort
+        self.before_write = before_write
+        self.sec_remaining = sec_remaining
+        if clock:
+            self.clock = clock
+        else:
+            self.clock = time.time
+        self.reads = 0
+        self.writes = 0
+        self._pending = 0
+        self._unsaved = set()
+        self._last_write = self.clock()
+        # TRICKY: processes may finish in several threads at once
+        self._lock = threading.RLock()
+
+    def is_processed(self, process_id):
+        """
+        Checks if a process has already been recorded as finished
+        :param process_id:
+        :return:
+        """
+        with self._lock:
+            return process_id in self.status['processed']
+
+    def get_processed(self, process_id):
+        """
+        Returns the catalog keys recorded for a finished process
+        :param process_id:
+        :return:
+        """
+        with self._lock:
+            return list(self.status['processed'][process_id])
+
+    def mark_processed(self, finished_processes):
+        """
+        Records some finished processes.
+        The status is only written if it is due.
+        :param dict finished_processes: a dictionary of process ids and their catalog keys
+        :return:
+        """
+        with self._lock:
+            self.status['processed'].update(finished_processes)
+            self._unsaved.update(finished_processes.keys())
+            self._pending += len(finished_processes)
+            if self._is_due():
+                self.save()
+
+    def _is_due(self):
+        if self._pending >= self.max_pending:
+            return True
+        if self.clock() - self._last_write >= self.max_age:
+            return True
+        if self.sec_remaining:
+            sec_remaining = self.sec_remaining()
+            if sec_remaining is not None and sec_remaining < self.min_sec_remaining:
+                return True
+        return False
+
+    def flush(self):
+        """
+        Writes the status if there are finished processes that have not been written yet
+        :return:
+        """
+        with self._lock:
+            if self._pending:
+                self.save()
+
+    def save(self):
+        """
+        Writes the status.
+        If check_abort is enabled and the status has been set to "aborted" an exception is raised instead.
+        :return:
+        """
+        with self._lock:
+            if self.before_write:
+                try:
+                    self.before_write()
+                except Exception:
+                    # TRICKY: the files of these processes may not exist so they must not be recorded as finished
+                    for process_id in self._unsaved:
+                        self.status['processed'].pop(process_id, None)
+                    self._unsaved = set()
+                    self._pending = 0
+                    raise
+            if self.check_abort:
+                self.reads += 1
+                record = self.db_handler.get_item(self.keys)
+                # TRICKY: an aborted record from an earlier build does not stop a new build
+                if record and record.get('state') == 'aborted' \
+                        and record.get('source_timestamp') == self.status.get('source_timestamp'):
+                    raise Exception("Aborted because the status flag is set to 'aborted' in dynamodb")
+
+            self.status['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ")
+            # TRICKY: the finished processes are packed so large sets stay within the item size limit
+            self.db_handler.update_item(self.keys, save_processed(self.db_handler, self.keys, self.status))
+            self.writes += 1
+            self._unsaved = set()
+            self._pending = 0
+            self._last_write = self.clock()
@@ -0,0 +1,56 @@
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def map_concurrent(func, items, max_workers=4):
+    """
+    Applies func to each item using a bounded pool of worker threads.
+    Results are returned in the same order as the items so callers can
+    merge them deterministically.
+    Once an item fails no new items will be started and the first error
+    is re-raised after the running items have finished.
+    Threads are used instead of processes because lambda does not provide /dev/shm.
+    :param func: a callable accepting a single item
+    :param list items: the items to process
+    :param int max_workers: the maximum number of items to process at once
+    :return: a list of results
+    """
+    items = list(items)
+    if max_workers is None or max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    tasks = queue.Queue()
+    for index, item in enumerate(items):
+        tasks.put((index, item))
+
+    def worker():
+        while not errors:
+            try:
+                index, item = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception:
+                errors.append(sys.exc_info())
+
+    threads = []
+    for _ in range(min(max_workers, len(items))):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    if errors:
+        e = errors[0]
+        raise e[0], e[1], e[2]
+    return results
@@ -11,26 +11,187 @@ import dateutil.parser
 import os
 import json
 import tempfile
+import threading
 import shutil
 import pytz
 
 from libraries.lambda_handlers.handler import Handler
-from libraries.tools.file_utils import read_file, write_file
+from libraries.tools.file_utils import read_file, write_file, write_json_file
 from libraries.tools.url_utils import get_url
 from usfm_tools.transform import UsfmTransform
 from libraries.tools.usfm_utils import usfm3_to_usfm2
-from libraries.tools.versification import hebrew_to_ufw
+from libraries.tools.versification import map_verse
 
 
-def download_chunks(pid, dest):
+CHUNKS_URL = 'https://cdn.door43.org/bible/txt/1/{}/chunks.json'
+
+
+class PaddedKeys(object):
+    """
+    Precomputes the zero padded forms of a set of keys so they can be matched in constant time.
+    See pad_to_match
+    """
+
+    def _init_padding(self, keys):
+        self._keys = frozenset(keys)
+        self._padding = {}
+
+    def pad(self, num, max_len=3):
+        """
+        z-fills a number until a match has been found.
+        :param num: the number to zfill
+        :param max_len: the maximum length to zfill
+        :return: the z-filled number if a match was found otherwise the original value
+        """
+        if max_len not in self._padding:
+            padding = {}
+            # TRICKY: the shortest padding wins just like when z-filling one digit at a time
+            for key in sorted(self._keys, key=len):
+                if len(key) > max_len:
+                    break
+                for i in range(1, len(key)):
+                    if key[i - 1] != '0':
+                        break
+                    if key[i:] not in self._keys:
+                        padding.setdefault(key[i:], key)
+            self._padding[max_len] = padding
+        num = '{}'.format(num)
+        return self._padding[max_len].get(num, num)
+
+
+class ChunkVerses(PaddedKeys, list):
+    """
+    The first verse of each chunk within a chapter
+    """
+
+    def __init__(self, verses=()):
+        list.__init__(self, verses)
+        self._init_padding(self)
+
+    def append(self, verse):
+        list.append(self, verse)
+        self._init_padding(self)
+
+    def __contains__(self, verse):
+        return verse in self._keys
+
+
+class ChunkIndex(PaddedKeys, dict):
+    """
+    Chunk verses keyed by chapter
+    """
+
+    def __init__(self, chapters=()):
+        dict.__init__(self, chapters)
+        self._init_padding(self)
+
+    def __setitem__(self, chapter, verses):
+        dict.__setitem__(self, chapter, verses)
+        self._init_padding(self)
+
+
+class ChunkIndexRegistry(object):
+    """
+    A thread safe registry of chunk indexes.
+    The chunks for each book are retrieved at most once.
+    """
+
+    def __init__(self, snapshot_dir=None):
+        """
+        :param snapshot_dir: an optional directory of chunk files to load instead of downloading them.
+        See load_snapshot
+        """
+        self._chunks = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._book_locks = {}
+        if snapshot_dir:
+            self.load_snapshot(snapshot_dir)
+
+    def load_snapshot(self, snapshot_dir):
+        """
+        Loads chunks from a local directory.
+        Chunks may be stored as {pid}.json or {pid}/chunks.json
+        :param snapshot_dir:
+        :return: the number of books loaded
+        """
+        loaded = 0
+        for name in os.listdir(snapshot_dir):
+            path = os.path.join(snapshot_dir, name)
+            if os.path.isdir(path):
+                pid = name
+                path = os.path.join(path, 'chunks.json')
+            elif name.endswith('.json'):
+                pid = name[:-len('.json')]
+            else:
+                continue
+            if not os.path.isfile(path):
+                continue
+            self.add(pid, json.loads(read_file(path)))
+            loaded += 1
+        return loaded
+
+    def add(self, pid, chunks):
+        """
+        Adds the chunks for a book
+        :param pid: the book id
+        :param chunks: the chunks array
+        :return:
+        """
+        index = index_chunks(chunks)
+        with self._lock:
+            # TRICKY: the chunks are stored last because get_chunks reads them without the lock
+            self._indexes[pid.lower()] = index
+            self._chunks[pid.lower()] = chunks
+
+    def _book_lock(self, pid):
+        with self._lock:
+            return self._book_locks.setdefault(pid, threading.Lock())
+
+    def get_chunks(self, pid):
+        """
+        Returns the chunks array for a book, downloading it if necessary
+        :param pid: the book id
+        :return: the chunks array
+        :raises Exception: if the chunks could not be retrieved
+        """
+        pid = pid.lower()
+        if pid not in self._chunks:
+            # TRICKY: only one thread downloads a book while the others wait for it
+            with self._book_lock(pid):
+                if pid not in self._chunks:
+                    self.add(pid, json.loads(get_url(CHUNKS_URL.format(pid))))
+        return self._chunks[pid]
+
+    def get(self, pid):
+        """
+        Returns the chunk index for a book, downloading it if necessary.
+        See index_chunks
+        :param pid: the book id
+        :return: the chunk index
+        :raises Exception: if the chunks could not be retrieved
+        """
+        self.get_chunks(pid)
+        return self._indexes[pid.lower()]
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._indexes.clear()
+
+
+# TRICKY: chunks are the same for every language so they are shared by the whole process
+chunk_registry = ChunkIndexRegistry()
+
+
+def download_chunks(pid, dest=None):
     """
     Downloads the chunks for the bible book
     :param pid:
     :return: the chunk json data or None
     """
     try:
-        data = get_url('https://cdn.door43.org/bible/txt/1/{}/chunks.json'.format(pid))
-        return json.loads(data)
+        return chunk_registry.get_chunks(pid)
     except:
         return None
 
@@ -39,14 +200,16 @@ def index_chunks(chunks):
     """
     Turns a chunks array into a dictionary keyed by chapter
     :param chunks:
-    :return:
+    :return: a ChunkIndex
     """
-    dict = {}
+    index = {}
     for chunk in chunks:
-        if not chunk['chp'] in dict:
-            dict[chunk['chp']] = []
-        dict[chunk['chp']].append(chunk['firstvs'])
-    return dict
+        if not chunk['chp'] in index:
+            index[chunk['chp']] = ChunkVerses()
+        list.append(index[chunk['chp']], chunk['firstvs'])
+    for verses in index.values():
+        verses._init_padding(verses)
+    return ChunkIndex(index)
 
 
 def tn_tsv_to_json(tsv, chunks):
@@ -144,10 +307,12 @@ def pad_to_match(num, matches, max_len=3):
     """
     z-fills a number until a match has been found.
     :param num: the number to zfill
-    :param matches: the available matches
+    :param matches: the available matches. Lookups are constant time if these are PaddedKeys such as a ChunkIndex.
     :param max_len: the maximum length to zfill
     :return: the z-filled number if a match was found otherwise the original value
     """
+    if isinstance(matches, PaddedKeys):
+        return matches.pad(num, max_len)
     padded_num = '{}'.format(num)
     while len(padded_num) < max_len and padded_num not in matches:
         padded_num = padded_num.zfill(len(padded_num) + 1)
@@ -165,7 +330,7 @@ def prep_data_upload(key, data, temp_dir):
     :return:
     """
     temp_file = os.path.join(temp_dir, key)
-    write_file(temp_file, json.dumps(data, sort_keys=True))
+    write_json_file(temp_file, data)
     return {
         'key': key,
         'path': temp_file
@@ -339,9 +504,7 @@ def usx_to_chunked_json(usx, chunks, lid, pid):
             effective_chapter = chapter_index
             effective_verse = verse_index
             if lid == 'hbo':
-                ref = hebrew_to_ufw(b=pid.lower(), c=chapter_index, v=verse_index)
-                effective_chapter = ref.c
-                effective_verse = ref.v
+                effective_chapter, effective_verse = map_verse(pid.lower(), chapter_index, verse_index)
             line = re.sub(r'<chapter number="\d+" style="c" />\n*', '', line)
 
         # detect the start of a new verse
@@ -349,9 +512,7 @@ def usx_to_chunked_json(usx, chunks, lid, pid):
             verse_index = int(verse_re.search(line).group(1))
             effective_verse = verse_index
             if lid == 'hbo':
-                ref = hebrew_to_ufw(b=pid.lower(), c=chapter_index, v=verse_index)
-                effective_chapter = ref.c
-                effective_verse = ref.v
+                effective_chapter, effective_verse = map_verse(pid.lower(), chapter_index, verse_index)
             if first_effective_verse == 0:
                 first_effective_verse = effective_verse
 
@@ -532,27 +693,33 @@ def usx_to_json(usx, path='', reporter=None):
     return chapters
 
 
-def build_json_source_from_usx(path, lid, pid, date_modified, reporter=None):
+def build_json_source_from_usx(path, lid, pid, date_modified, reporter=None, registry=None):
     """
     Builds a json source object from a USX file
     :param path:
     :param date_modified:
     :param reporter: a lambda handler instance for reporting
     :type reporter: Handler
+    :param registry: the ChunkIndexRegistry from which chunks will be retrieved. Defaults to chunk_registry
+    :type registry: ChunkIndexRegistry
     :return:
     """
     # use utf-8-sig to remove the byte order mark
     with codecs.open(path, 'r', encoding='utf-8-sig') as in_file:
         usx = in_file.readlines()
 
+    if not registry:
+        registry = chunk_registry
     try:
-        data = get_url('https://cdn.door43.org/bible/txt/1/{}/chunks.json'.format(pid))
-        chunks = index_chunks(json.loads(data))
+        chunks = registry.get(pid)
     except:
-        raise 'Failed to retrieve chunk information for {}'.format(path)
+        raise Exception('Failed to retrieve chunk information for {}'.format(path))
 
     book = usx_to_chunked_json(usx, chunks, lid, pid)
+    return _json_source(book, date_modified)
 
+
+def _json_source(book, date_modified):
     return {
         'source': {
             'chapters': book,
@@ -561,6 +728,48 @@ def build_json_source_from_usx(path, lid, pid, date_modified, reporter=None):
     }
 
 
+def build_json_source_from_usfm(usfm_file, usx_dir, lid, pid, date_modified, chunks):
+    """
+    Converts a single USFM book to USX and builds a json source object from it.
+    This does not rely on any shared state so books can be built in separate processes.
+    :param usfm_file: the USFM 3 file of the book
+    :param usx_dir: the directory where the USX file will be written
+    :param lid:
+    :param pid:
+    :param date_modified:
+    :param chunks: the chunk index of the book
+    :return:
+    """
+    usfm2_dir = tempfile.mkdtemp(prefix='usfm2')
+    try:
+        usfm2 = usfm3_to_usfm2(read_file(usfm_file))
+        write_file(os.path.join(usfm2_dir, os.path.basename(usfm_file)), usfm2)
+        UsfmTransform.buildUSX(usfm2_dir, usx_dir, '', True)
+    finally:
+        shutil.rmtree(usfm2_dir, ignore_errors=True)
+
+    path = os.path.join(usx_dir, '{}.usx'.format(pid.upper()))
+    with codecs.open(path, 'r', encoding='utf-8-sig') as in_file:
+        usx = in_file.readlines()
+
+    book = usx_to_chunked_json(usx, chunks, lid, pid)
+    return _json_source(book, date_modified)
+
+
+def build_book_source(book):
+    """
+    Builds the json source object of a single USFM book.
+    This is a module level function so it can be run in a worker process.
+    :param dict book: the arguments of build_json_source_from_usfm along with the process_id of the book
+    :return:
+    """
+    try:
+        return build_json_source_from_usfm(book['usfm_file'], book['usx_dir'], book['lid'], book['pid'],
+                                           book['modified'], book['chunks'])
+    except Exception as e:
+        raise Exception('Failed to generate usx for {}: {}'.format(book['process_id'], e))
+
+
 def convert_rc_links(content, logger=None):
     """
     Converts rc links in the content to legacy links
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for uploading files to s3 in the background
+#
+
+import hashlib
+import os
+import sys
+import threading
+import time
+
+from libraries.tools.s3_index import list_objects
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def file_md5(path, block_size=1024 * 1024):
+    """
+    Calculates the md5 hex digest of a file
+    :param path:
+    :param block_size:
+    :return:
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def list_s3_etags(s3_handler, prefix=''):  # pragma: no cover
+    """
+    Lists the ETags of the objects in a bucket.
+    :param s3_handler: an S3Handler
+    :param prefix: limits the listing to keys with this prefix
+    :return: a dictionary of ETags keyed by object key
+    """
+    objects = list_objects(s3_handler, prefix)
+    return dict((key, obj['etag']) for key, obj in objects.items())
+
+
+class UploadQueue(object):
+    """
+    Uploads files on a pool of background threads.
+    Workers are started as files are queued and exit once the queue is empty.
+    Uploads are tracked separately for each thread that queues them.
+    Call flush() to wait for the uploads queued by the current thread before relying on them
+    and wait_all() to wait for every queued upload.
+    """
+
+    def __init__(self, s3_handler, max_workers=4, etags=None, logger=None):
+        """
+        :param s3_handler: the S3Handler (or MockS3Handler) that will perform the uploads
+        :param int max_workers: the maximum number of concurrent uploads
+        :param dict etags: the known remote ETags keyed by object key.
+        When given, files whose md5 matches the remote ETag will not be uploaded again.
+        :param logger:
+        """
+        self.s3_handler = s3_handler
+        self.max_workers = max(1, max_workers)
+        self.etags = etags
+        self.logger = logger
+        self.batches = []
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._workers = 0
+        self._pending = 0
+        self._callers = {}
+        self._failures = []
+
+    @staticmethod
+    def _new_batch():
+        return {
+            'pending': 0,
+            'files': 0,
+            'skipped': 0,
+            'bytes': 0,
+            'started': None,
+            'errors': []
+        }
+
+    def _batch(self, caller):
+        """
+        Returns the uploads of a caller. This must be called while holding the lock
+        :param caller:
+        :return:
+        """
+        if caller not in self._callers:
+            self._callers[caller] = UploadQueue._new_batch()
+        return self._callers[caller]
+
+    def put(self, path, key, cache_time=None):
+        """
+        Queues a file for upload.
+        The file must not be removed until the queue has been flushed.
+        :param path: the local file
+        :param key: the destination key
+        :param cache_time: optional cache time passed on to the s3 handler
+        :return:
+        """
+        # TRICKY: the thread object is the key so its id cannot be reused by another thread
+        caller = threading.current_thread()
+        with self._lock:
+            batch = self._batch(caller)
+            if batch['started'] is None:
+                batch['started'] = time.time()
+            batch['pending'] += 1
+            self._pending += 1
+        self._tasks.put((caller, path, key, cache_time))
+        with self._lock:
+            if self._workers < self.max_workers:
+                self._workers += 1
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+
+    def _work(self):
+        while True:
+            try:
+                caller, path, key, cache_time = self._tasks.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    # TRICKY: a task may have been queued after we found the queue empty
+                    if self._tasks.empty():
+                        self._workers -= 1
+                        return
+                continue
+            error = None
+            try:
+                self._upload(caller, path, key, cache_time)
+            except Exception:
+                error = sys.exc_info()
+            with self._lock:
+                batch = self._batch(caller)
+                if error:
+                    batch['errors'].append(error)
+                    self._failures.append(error)
+                batch['pending'] -= 1
+                self._pending -= 1
+                self._done.notify_all()
+
+    def _upload(self, caller, path, key, cache_time):
+        size = os.path.getsize(path)
+        md5 = None
+        if self.etags is not None:
+            md5 = file_md5(path)
+            if self.etags.get(key, '').strip('"') == md5:
+                with self._lock:
+                    self._batch(caller)['skipped'] += 1
+                return
+
+        if cache_time is None:
+            self.s3_handler.upload_file(path, key)
+        else:
+            self.s3_handler.upload_file(path, key, cache_time=cache_time)
+
+        with self._lock:
+            if md5 is not None:
+                self.etags[key] = md5
+            batch = self._batch(caller)
+            batch['files'] += 1
+            batch['bytes'] += size
+
+    def flush(self):
+        """
+        Waits for the uploads queued by the current thread to finish.
+        If any of them failed the first error will be raised.
+        Uploads queued by other threads are neither waited for nor reported.
+        :return: the statistics for the uploads of the current thread since its last flush
+        """
+        caller = threading.current_thread()
+        with self._lock:
+            while caller in self._callers and self._callers[caller]['pending']:
+                self._done.wait()
+            batch = self._callers.pop(caller, None) or UploadQueue._new_batch()
+
+        seconds = 0
+        if batch['started'] is not None:
+            seconds = time.time() - batch['started']
+        stats = {
+            'files': batch['files'],
+            'skipped': batch['skipped'],
+            'bytes': batch['bytes'],
+            'seconds': seconds,
+            'files_per_second': batch['files'] / seconds if seconds else 0,
+            'bytes_per_second': batch['bytes'] / seconds if seconds else 0
+        }
+        if batch['files'] or batch['skipped']:
+            with self._lock:
+                self.batches.append(stats)
+            if self.logger:
+                self.logger.debug('Uploaded {} files ({} bytes, {} unchanged) in {:.3f}s: {:.1f} files/s {:.0f} bytes/s'.format(
+                    stats['files'], stats['bytes'], stats['skipped'], seconds, stats['files_per_second'],
+                    stats['bytes_per_second']))
+
+        if batch['errors']:
+            e = batch['errors'][0]
+            raise e[0], e[1], e[2]
+        return stats
+
+    def wait_all(self):
+        """
+        Waits for every queued upload to finish.
+        This is used before recording that work is finished so it raises the first error of any upload
+        that has failed since the queue was created, even if the thread that queued it has already seen it.
+        Nothing is cleared.
+        :return:
+        """
+        with self._lock:
+            while self._pending:
+                self._done.wait()
+            failures = list(self._failures)
+        if failures:
+            e = failures[0]
+            raise e[0], e[1], e[2]
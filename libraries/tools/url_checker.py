@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for checking the existence of many urls at once
+#
+
+import threading
+import time
+
+from libraries.tools import url_utils
+from libraries.tools.thread_utils import map_concurrent
+
+
+class URLChecker(object):
+    """
+    Checks if many urls exist at once.
+    Each url is checked concurrently with url_utils.url_exists over the pooled connections of the http client
+    and the results are cached for a limited time.
+    """
+
+    def __init__(self, max_workers=8, ttl=300, client=None):
+        """
+        :param int max_workers: the maximum number of concurrent requests
+        :param int ttl: the number of seconds results are cached. Use 0 to disable the cache.
+        :param HttpClient client: sends the requests. Defaults to the client shared by url_utils
+        """
+        self.max_workers = max_workers
+        self.ttl = ttl
+        if client:
+            self.client = client
+        else:
+            self.client = url_utils.get_client()  # pragma: no cover
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def exists(self, url):
+        """
+        Checks if a single url exists
+        :param url:
+        :return: bool
+        """
+        return self.check([url])[url]
+
+    def check(self, urls):
+        """
+        Checks if the urls exist.
+        Duplicates and cached urls are only requested once.
+        :param urls:
+        :return: a dictionary of booleans keyed by url
+        """
+        results = {}
+        pending = []
+        now = time.time()
+        with self._lock:
+            for url in urls:
+                if url in results:
+                    continue
+                cached = self._cache.get(url)
+                if cached and cached[1] > now:
+                    results[url] = cached[0]
+                else:
+                    results[url] = None
+                    pending.append(url)
+
+        found = map_concurrent(self._head, pending, self.max_workers)
+
+        expires = time.time() + self.ttl
+        with self._lock:
+            for url, exists in zip(pending, found):
+                results[url] = exists
+                if self.ttl > 0:
+                    self._cache[url] = (exists, expires)
+        return results
+
+    def clear(self):
+        """
+        Empties the result cache
+        :return:
+        """
+        with self._lock:
+            self._cache = {}
+
+    def _head(self, url):
+        """
+        Sends a HEAD request for the url
+        :param url:
+        :return: bool
+        """
+        if not url:
+            return False
+        return url_utils.url_exists(url, self.client)
@@ -3,15 +3,31 @@
 from __future__ import print_function, unicode_literals
 from contextlib import closing
 import json
-import shutil
+import os
 import sys
-import httplib
-from urlparse import urlparse
+import tempfile
+import threading
+
+from libraries.tools.file_digest import FileDigest
+from libraries.tools.http_client import HttpClient
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the http client shared by the functions in this module.
+    Connections are kept alive between requests and small responses are cached
+    in the temp directory so they are only downloaded again when they change.
+    :return: HttpClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(cache_dir=os.path.join(tempfile.gettempdir(), 'http_cache'))
+        return _client
 
-try:
-    import urllib.request as urllib2
-except ImportError:
-    import urllib2
 
 def get_url_size(url):
     """
@@ -27,11 +43,8 @@ def url_headers(url):
     :param url:
     :return:
     """
-    p = urlparse(url)
-    conn = httplib.HTTPConnection(p.netloc)
-    conn.request('HEAD', p.path)
-    resp = conn.getresponse()
-    return HeaderReader(resp.getheaders(), resp.status)
+    resp = get_client().head(url)
+    return HeaderReader(resp.headers.items(), resp.status)
 
 class HeaderReader(object):
     def __init__(self, header_list, status=200):
@@ -57,16 +70,14 @@ class HeaderReader(object):
         else:
             return default
 
-def url_exists(url):
+def url_exists(url, client=None):
     """
     Checks if a url exists
     :param url:
+    :param HttpClient client: sends the request. Defaults to the shared client
     :return:
     """
-    p = urlparse(url)
-    conn = httplib.HTTPConnection(p.netloc)
-    conn.request('HEAD', p.path)
-    resp = conn.getresponse()
+    resp = (client or get_client()).head(url)
     return resp.status == 301 or resp.status == 200
 
 def get_url(url, catch_exception=False):
@@ -74,7 +85,7 @@ def get_url(url, catch_exception=False):
     :param str|unicode url: URL to open
     :param bool catch_exception: If <True> catches all exceptions and returns <False>
     """
-    return _get_url(url, catch_exception, urlopen=urllib2.urlopen)
+    return _get_url(url, catch_exception, urlopen=get_client().urlopen)
 
 
 def _get_url(url, catch_exception, urlopen):
@@ -97,15 +108,19 @@ def _get_url(url, catch_exception, urlopen):
 
 
 def download_file(url, outfile):
-    """Downloads a file and saves it."""
-    _download_file(url, outfile, urlopen=urllib2.urlopen)
+    """
+    Downloads a file and saves it.
+    The file is hashed while it is written so it does not need to be read again.
+    :return: the FileDigest of the file
+    """
+    return _download_file(url, outfile, urlopen=get_client().urlopen)
 
 
 def _download_file(url, outfile, urlopen):
     try:
         with closing(urlopen(url)) as request:
             with open(outfile, 'wb') as fp:
-                shutil.copyfileobj(request, fp)
+                return FileDigest.copy(request, fp)
     except IOError as err:
         print('ERROR retrieving %s' % url)
         print(err)
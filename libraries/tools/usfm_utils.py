@@ -342,27 +342,135 @@ def convert_chunk_markers(str):
     """
     return re.sub(r'\\ts\b', '\n\\s5', str)
 
+_MILESTONE_PATTERNS = [
+    # opening and closing alignment markers
+    re.compile(r'\n?\\zaln-s((?!\\\*).)*(\\\*)?\n?', flags=re.UNICODE | re.MULTILINE),
+    re.compile(r'\n?\\zaln-e\\\*\n?', flags=re.UNICODE | re.MULTILINE),
+    # opening and closing key term markers
+    re.compile(r'\n?\\k-s.*\n?', flags=re.UNICODE | re.MULTILINE),
+    re.compile(r'\n?\\k-e\\\*\n?', flags=re.UNICODE | re.MULTILINE)
+]
+
+
+def _remove_milestones(usfm):
+    for pattern in _MILESTONE_PATTERNS:
+        usfm = pattern.sub(r'', usfm)
+    return usfm
+
+
 def strip_milestones(usfm):
     """
     Removes zaln-* and k-s milestones from the usfm.
     :param str:
     :return:
     """
-    # remove opening marker
-    usfm = re.sub(r'\n?\\zaln-s((?!\\\*).)*(\\\*)?\n?', r'', usfm, flags=re.UNICODE | re.MULTILINE)
-    # remove closing marker
-    usfm = re.sub(r'\n?\\zaln-e\\\*\n?', r'', usfm, flags=re.UNICODE | re.MULTILINE)
-
-    # remove opening marker
-    usfm = re.sub(r'\n?\\k-s.*\n?', r'', usfm, flags=re.UNICODE | re.MULTILINE)
-    # remove closing marker
-    usfm = re.sub(r'\n?\\k-e\\\*\n?', r'', usfm, flags=re.UNICODE | re.MULTILINE)
-    return usfm.strip()
+    return _remove_milestones(usfm).strip()
+
+
+_ZALN_S = r'\\zaln-s[^\n\\]*(?:\\(?!\*)[^\n\\]*)*(?:\\\*)?'
+_ZALN_E = r'\\zaln-e\\\*'
+_K_E = r'\\k-e\\\*'
+# a key term milestone removes the rest of the line after the alignment milestones have been removed
+# so the line may continue past the line breaks around alignment milestones
+_K_S = r'\\k-s(?:(?:\n*(?:{zaln_s}|{zaln_e}))+\n*|.)*'.format(zaln_s=_ZALN_S, zaln_e=_ZALN_E)
+# alignment and closing key term milestones in the order they are removed by strip_milestones
+_MILESTONE = re.compile(r'({})|({})|({})'.format(_ZALN_S, _ZALN_E, _K_E), re.UNICODE)
+_MILESTONES = r'(?:(?:{}|{}|{}|{})\n*)+'.format(_ZALN_S, _ZALN_E, _K_E, _K_S)
+
+# The tokens that are removed or rewritten while converting USFM 3 to USFM 2.
+# Adjacent milestones are matched together with the line breaks around them.
+# Every alternative starts with a line break or a backslash so the text in between is skipped quickly.
+_USFM3_TOKENS = re.compile(r"""
+    (\n+{milestones})
+    |({milestones})
+    |(\\w\s*(?:\|[^\\]*)?\\w\*)
+    # a word ends with the last closing marker before the next word
+    |\\w\s+([^|\\]*)[^\n\\]*(?:\\(?!w(?!\*))[^\n\\]*)*\\w\*
+    |(\\w\s)
+    """.format(milestones=_MILESTONES), re.UNICODE | re.VERBOSE)
+_MILESTONES_TOKEN, _MILESTONES_NO_BREAK_TOKEN, _EMPTY_WORD_TOKEN, _WORD_TOKEN, _WORD_START_TOKEN = range(1, 6)
+_LINE_JOIN = re.compile(r'\n(?!\\)', re.UNICODE)
+_TRAILING_SPACE = re.compile(r'[ \t]+$', re.UNICODE | re.MULTILINE)
+_MULTIPLE_SPACES = re.compile(r' {2,}', re.UNICODE)
+_CHUNK_MARKER = re.compile(r'\n*(\\s5)\s*', re.UNICODE)
+_TS_CHUNK_MARKER = re.compile(r'\\ts\b')
+
+
+def _remove_milestone_group(usfm):
+    """
+    Removes a group of adjacent milestones.
+    Each milestone removes at most one line break on either side of it
+    and the kinds of milestones are removed one after another as in strip_milestones.
+    :param usfm: the milestones and the line breaks around them
+    :return: the line breaks that are left over
+    """
+    if '\\k-s' in usfm:
+        # key terms may have removed words along with the rest of the line
+        return _USFM3_TOKENS.sub(_replace_usfm3_token, _remove_milestones(usfm))
+
+    kinds = []
+    breaks = [0]
+    end = 0
+    for match in _MILESTONE.finditer(usfm):
+        breaks[-1] += usfm.count('\n', end, match.start())
+        kinds.append(match.lastindex)
+        breaks.append(0)
+        end = match.end()
+    breaks[-1] += usfm.count('\n', end)
+
+    for kind in range(1, _MILESTONE.groups + 1):
+        remaining_kinds = []
+        remaining_breaks = [breaks[0]]
+        # the line breaks directly in front of the next milestone
+        leading_breaks = breaks[0]
+        for k, trailing_breaks in zip(kinds, breaks[1:]):
+            if k == kind:
+                if leading_breaks:
+                    remaining_breaks[-1] -= 1
+                trailing_breaks = max(trailing_breaks - 1, 0)
+                remaining_breaks[-1] += trailing_breaks
+            else:
+                remaining_kinds.append(k)
+                remaining_breaks.append(trailing_breaks)
+            leading_breaks = trailing_breaks
+        kinds = remaining_kinds
+        breaks = remaining_breaks
+    return '\n' * breaks[0]
+
+
+def _replace_usfm3_token(match):
+    token = match.lastindex
+    if token == _WORD_TOKEN:
+        word = match.group(token)
+        # words are placed on their own line and then joined to the previous line
+        return ' ' + word if word else '\n'
+    if token == _MILESTONES_TOKEN:
+        return _remove_milestone_group(match.group(token))
+    if token == _MILESTONES_NO_BREAK_TOKEN:
+        milestones = match.group(token)
+        if '\n' in milestones or '\\k-s' in milestones:
+            return _remove_milestone_group(milestones)
+        return ''
+    if token == _WORD_START_TOKEN:
+        return '\n' + match.group(token)
+    return ''
+
 
 def usfm3_to_usfm2(usfm3):
     """
-    Converts a USFM 3 string to a USFM 2 compatible string
+    Converts a USFM 3 string to a USFM 2 compatible string.
+    This produces the same output as convert_chunk_markers(strip_word_data(strip_milestones(usfm3)))
+    but removes the milestones and word data in a single pass.
     :param usfm3:
     :return: the USFM 2 version of the string
     """
-    return convert_chunk_markers(strip_word_data(strip_milestones(usfm3)))
+    usfm = _USFM3_TOKENS.sub(_replace_usfm3_token, usfm3.strip())
+
+    # stick lines without markup on the previous line
+    usfm = _LINE_JOIN.sub(' ', usfm)
+    usfm = _TRAILING_SPACE.sub('', usfm.lstrip(' \t'))
+    usfm = _MULTIPLE_SPACES.sub(' ', usfm)
+    # put spaces back between chapters and verses
+    usfm = _CHUNK_MARKER.sub(r'\n\n\g<1>\n', usfm).strip()
+
+    return _TS_CHUNK_MARKER.sub(r'\n\\s5', usfm)
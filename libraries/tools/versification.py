@@ -27,6 +27,122 @@ class Opt:
         self.split = split
 
 
+# The number of verses in each chapter of the original (Hebrew) versification. Taken from org.vrs
+ORIGINAL_VERSE_COUNTS = {
+    'gen': [31, 25, 24, 26, 32, 22, 24, 22, 29, 32, 32, 20, 18, 24, 21, 16, 27, 33, 38, 18, 34, 24, 20, 67, 34, 35, 46,
+            22, 35, 43, 54, 33, 20, 31, 29, 43, 36, 30, 23, 23, 57, 38, 34, 34, 28, 34, 31, 22, 33, 26],
+    'exo': [22, 25, 22, 31, 23, 30, 29, 28, 35, 29, 10, 51, 22, 31, 27, 36, 16, 27, 25, 26, 37, 30, 33, 18, 40, 37, 21,
+            43, 46, 38, 18, 35, 23, 35, 35, 38, 29, 31, 43, 38],
+    'lev': [17, 16, 17, 35, 26, 23, 38, 36, 24, 20, 47, 8, 59, 57, 33, 34, 16, 30, 37, 27, 24, 33, 44, 23, 55, 46, 34],
+    'num': [54, 34, 51, 49, 31, 27, 89, 26, 23, 36, 35, 16, 33, 45, 41, 35, 28, 32, 22, 29, 35, 41, 30, 25, 19, 65, 23,
+            31, 39, 17, 54, 42, 56, 29, 34, 13],
+    'deu': [46, 37, 29, 49, 33, 25, 26, 20, 29, 22, 32, 31, 19, 29, 23, 22, 20, 22, 21, 20, 23, 29, 26, 22, 19, 19, 26,
+            69, 28, 20, 30, 52, 29, 12],
+    'jos': [18, 24, 17, 24, 15, 27, 26, 35, 27, 43, 23, 24, 33, 15, 63, 10, 18, 28, 51, 9, 45, 34, 16, 33],
+    'jdg': [36, 23, 31, 24, 31, 40, 25, 35, 57, 18, 40, 15, 25, 20, 20, 31, 13, 31, 30, 48, 25],
+    'rut': [22, 23, 18, 22],
+    '1sa': [28, 36, 21, 22, 12, 21, 17, 22, 27, 27, 15, 25, 23, 52, 35, 23, 58, 30, 24, 42, 16, 23, 28, 23, 44, 25, 12,
+            25, 11, 31, 13],
+    '2sa': [27, 32, 39, 12, 25, 23, 29, 18, 13, 19, 27, 31, 39, 33, 37, 23, 29, 32, 44, 26, 22, 51, 39, 25],
+    '1ki': [53, 46, 28, 20, 32, 38, 51, 66, 28, 29, 43, 33, 34, 31, 34, 34, 24, 46, 21, 43, 29, 54],
+    '2ki': [18, 25, 27, 44, 27, 33, 20, 29, 37, 36, 20, 22, 25, 29, 38, 20, 41, 37, 37, 21, 26, 20, 37, 20, 30],
+    '1ch': [54, 55, 24, 43, 41, 66, 40, 40, 44, 14, 47, 41, 14, 17, 29, 43, 27, 17, 19, 8, 30, 19, 32, 31, 31, 32, 34,
+            21, 30],
+    '2ch': [18, 17, 17, 22, 14, 42, 22, 18, 31, 19, 23, 16, 23, 14, 19, 14, 19, 34, 11, 37, 20, 12, 21, 27, 28, 23, 9,
+            27, 36, 27, 21, 33, 25, 33, 27, 23],
+    'ezr': [11, 70, 13, 24, 17, 22, 28, 36, 15, 44],
+    'neh': [11, 20, 38, 17, 19, 19, 72, 18, 37, 40, 36, 47, 31],
+    'est': [22, 23, 15, 17, 14, 14, 10, 17, 32, 3],
+    'job': [22, 13, 26, 21, 27, 30, 21, 22, 35, 22, 20, 25, 28, 22, 35, 22, 16, 21, 29, 29, 34, 30, 17, 25, 6, 14, 23,
+            28, 25, 31, 40, 22, 33, 37, 16, 33, 24, 41, 30, 32, 26, 17],
+    'psa': [6, 12, 9, 9, 13, 11, 18, 10, 21, 18, 7, 9, 6, 7, 5, 11, 15, 51, 15, 10, 14, 32, 6, 10, 22, 12, 14, 9, 11,
+            13, 25, 11, 22, 23, 28, 13, 40, 23, 14, 18, 14, 12, 5, 27, 18, 12, 10, 15, 21, 23, 21, 11, 7, 9, 24, 14, 12,
+            12, 18, 14, 9, 13, 12, 11, 14, 20, 8, 36, 37, 6, 24, 20, 28, 23, 11, 13, 21, 72, 13, 20, 17, 8, 19, 13, 14,
+            17, 7, 19, 53, 17, 16, 16, 5, 23, 11, 13, 12, 9, 9, 5, 8, 29, 22, 35, 45, 48, 43, 14, 31, 7, 10, 10, 9, 8,
+            18, 19, 2, 29, 176, 7, 8, 9, 4, 8, 5, 6, 5, 6, 8, 8, 3, 18, 3, 3, 21, 26, 9, 8, 24, 14, 10, 8, 12, 15, 21,
+            10, 20, 14, 9, 6],
+    'pro': [33, 22, 35, 27, 23, 35, 27, 36, 18, 32, 31, 28, 25, 35, 33, 33, 28, 24, 29, 30, 31, 29, 35, 34, 28, 28, 27,
+            28, 27, 33, 31],
+    'ecc': [18, 26, 22, 17, 19, 12, 29, 17, 18, 20, 10, 14],
+    'sng': [17, 17, 11, 16, 16, 12, 14, 14],
+    'isa': [31, 22, 26, 6, 30, 13, 25, 23, 20, 34, 16, 6, 22, 32, 9, 14, 14, 7, 25, 6, 17, 25, 18, 23, 12, 21, 13, 29,
+            24, 33, 9, 20, 24, 17, 10, 22, 38, 22, 8, 31, 29, 25, 28, 28, 25, 13, 15, 22, 26, 11, 23, 15, 12, 17, 13,
+            12, 21, 14, 21, 22, 11, 12, 19, 11, 25, 24],
+    'jer': [19, 37, 25, 31, 31, 30, 34, 23, 25, 25, 23, 17, 27, 22, 21, 21, 27, 23, 15, 18, 14, 30, 40, 10, 38, 24, 22,
+            17, 32, 24, 40, 44, 26, 22, 19, 32, 21, 28, 18, 16, 18, 22, 13, 30, 5, 28, 7, 47, 39, 46, 64, 34],
+    'lam': [22, 22, 66, 22, 22],
+    'ezk': [28, 10, 27, 17, 17, 14, 27, 18, 11, 22, 25, 28, 23, 23, 8, 63, 24, 32, 14, 44, 37, 31, 49, 27, 17, 21, 36,
+            26, 21, 26, 18, 32, 33, 31, 15, 38, 28, 23, 29, 49, 26, 20, 27, 31, 25, 24, 23, 35],
+    'dan': [21, 49, 33, 34, 30, 29, 28, 27, 27, 21, 45, 13],
+    'hos': [9, 25, 5, 19, 15, 11, 16, 14, 17, 15, 11, 15, 15, 10],
+    'jol': [20, 27, 5, 21],
+    'amo': [15, 16, 15, 13, 27, 14, 17, 14, 15],
+    'oba': [21],
+    'jon': [16, 11, 10, 11],
+    'mic': [16, 13, 12, 14, 14, 16, 20],
+    'nam': [14, 14, 19],
+    'hab': [17, 20, 19],
+    'zep': [18, 15, 20],
+    'hag': [15, 23],
+    'zec': [17, 17, 10, 14, 11, 15, 14, 23, 17, 12, 17, 14, 9, 21],
+    'mal': [14, 17, 24]
+}
+
+# the number of extra verses in each chapter that are added to the lookup tables
+# to cover the longer chapters of the ufw versification
+_VERSE_MARGIN = 20
+
+# lookup tables keyed by book and then by from_original
+_tables = {}
+
+
+def _build_tables(b):
+    """
+    Builds the lookup tables of a book by evaluating the versification rules for every verse.
+    The tables are lists indexed by chapter and then by verse of (chapter, verse) tuples.
+    :param b: book of the bible
+    :return: the tables keyed by from_original or None if the book is not in the original canon
+    """
+    counts = ORIGINAL_VERSE_COUNTS.get(b)
+    if not counts:
+        return None
+    tables = {True: [None], False: [None]}
+    refs = {}
+    for c in range(1, len(counts) + 2):
+        max_verse = max(counts[max(c - 2, 0):c + 1]) + _VERSE_MARGIN
+        for from_original, table in tables.items():
+            verses = [None]
+            for v in range(1, max_verse + 1):
+                ref = _hebrew_to_ufw_rules(b, c, v, from_original)
+                # share the tuples so the tables stay small
+                verses.append(refs.setdefault((ref.c, ref.v), (ref.c, ref.v)))
+            table.append(verses)
+    return tables
+
+
+def map_verse(b, c, v, from_original=True):
+    """
+    Converts a hebrew chapter and verse to the ufw chapter and verse.
+    Verses in the original canon are looked up from precomputed tables
+    while anything else falls back to evaluating the rules.
+    :param b: book of the bible
+    :param c: chapter number
+    :param v: verse number
+    :param from_original: indicates if we are converting the versification from the original language i.e. Hebrew.
+    :return: a tuple of the ufw chapter and verse. Or, if `from_original` is False, the hebrew chapter and verse
+    """
+    if b not in _tables:
+        # TRICKY: building a book twice from separate threads is harmless
+        _tables[b] = _build_tables(b)
+    table = _tables[b] and _tables[b].get(from_original)
+    if table and 0 < c < len(table):
+        verses = table[c]
+        if 0 < v < len(verses):
+            return verses[v]
+    ref = _hebrew_to_ufw_rules(b, c, v, from_original)
+    return ref.c, ref.v
+
+
 def hebrew_to_ufw(b, c, v, from_original=True):
     """
     Converts a hebrew reference to a ufw reference.
@@ -36,6 +152,20 @@ def hebrew_to_ufw(b, c, v, from_original=True):
     :param from_original: indicates if we are converting the versification from the original language i.e. Hebrew.
     :return: the ufw reference. Or, if `from_original` is False, the hebrew reference
     """
+    c, v = map_verse(b, c, v, from_original)
+    return Ref(b, c, v)
+
+
+def _hebrew_to_ufw_rules(b, c, v, from_original=True):
+    """
+    Converts a hebrew reference to a ufw reference by evaluating each of the versification rules.
+    This is slow so use hebrew_to_ufw or map_verse instead.
+    :param b: book of the bible
+    :param c: chapter number
+    :param v: verse number
+    :param from_original: indicates if we are converting the versification from the original language i.e. Hebrew.
+    :return: the ufw reference. Or, if `from_original` is False, the hebrew reference
+    """
     ref = Ref(b, c, v)
     if b == 'gen':
         # chapter break gen 31:55
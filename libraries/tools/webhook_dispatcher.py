@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+#
+# Classes for invoking a lambda function for many payloads at a limited rate
+#
+
+import json
+import random
+import threading
+import time
+
+from libraries.tools.thread_utils import map_concurrent
+
+THROTTLE_ERRORS = ('TooManyRequestsException', 'ThrottlingException', 'Throttling')
+
+
+def is_throttle_error(error):
+    """
+    Checks if an error raised by a boto3 client was caused by throttling
+    :param error:
+    :return: bool
+    """
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    return response.get('Error', {}).get('Code') in THROTTLE_ERRORS
+
+
+class TokenBucket(object):
+    """
+    Limits how often something may happen.
+    Tokens are added at a constant rate up to the size of the bucket and each call takes one.
+    """
+
+    def __init__(self, rate, capacity=None, clock=None, sleep=None):
+        """
+        :param float rate: the number of tokens added each second
+        :param int capacity: the maximum number of tokens that can be saved up. Defaults to the rate.
+        :param clock: returns the current time in seconds
+        :param sleep: waits for a number of seconds
+        """
+        self.rate = float(rate)
+        self.capacity = max(1, capacity if capacity is not None else int(rate))
+        self._clock = clock or time.time
+        self._sleep = sleep or time.sleep
+        self._tokens = float(self.capacity)
+        self._updated = self._clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Waits until a token is available and takes it
+        :return: the number of seconds spent waiting
+        """
+        waited = 0
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                waited = (1 - self._tokens) / self.rate
+                self._sleep(waited)
+                self._refill()
+                # the wait earned the token even if rounding left the bucket just short of it
+                self._tokens = max(self._tokens, 1.0)
+            self._tokens -= 1
+        return waited
+
+
+class WebhookDispatcher(object):
+    """
+    Invokes a lambda function asynchronously for each payload.
+    Invocations are made concurrently but no faster than the token bucket allows.
+    Throttled invocations are retried with a jittered exponential backoff.
+    """
+
+    def __init__(self, client, function_name, rate=10, max_workers=4, retries=3, backoff=0.5, logger=None,
+                 sleep=None, clock=None, rand=None):
+        """
+        :param client: the boto3 lambda client
+        :param string function_name: the lambda function to invoke
+        :param float rate: the maximum number of invocations each second
+        :param int max_workers: the maximum number of invocations in flight
+        :param int retries: the number of times a throttled invocation is retried
+        :param float backoff: the base delay in seconds before retrying
+        :param logger:
+        :param sleep: waits for a number of seconds
+        :param clock: returns the current time in seconds
+        :param rand: returns a random float between 0 and 1
+        """
+        self.client = client
+        self.function_name = function_name
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logger
+        self._sleep = sleep or time.sleep
+        self._random = rand or random.random
+        self.bucket = TokenBucket(rate, clock=clock, sleep=self._sleep)
+        self._lock = threading.Lock()
+        self.stats = {
+            'dispatched': 0,
+            'failed': 0,
+            'throttled': 0
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _invoke(self, job):
+        """
+        Invokes the function for a single payload.
+        Errors are recorded rather than raised so one repo cannot stop the others.
+        :param tuple job: the name used in log messages and the payload
+        :return: bool True if the invocation was accepted
+        """
+        name, payload = job
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                self.client.invoke(
+                    FunctionName=self.function_name,
+                    InvocationType='Event',
+                    Payload=json.dumps(payload)
+                )
+                self._count('dispatched')
+                return True
+            except Exception as e:
+                if is_throttle_error(e) and attempt < self.retries:
+                    self._count('throttled')
+                    # full jitter keeps the retries of concurrent workers apart
+                    self._sleep(self._random() * self.backoff * (2 ** attempt))
+                    attempt += 1
+                    continue
+                if is_throttle_error(e):
+                    self._count('throttled')
+                self._count('failed')
+                if self.logger:
+                    self.logger.error('Failed to trigger webhook {0}: {1}'.format(name, e))
+                return False
+
+    def dispatch(self, jobs):
+        """
+        Invokes the function for each payload
+        :param list jobs: tuples of a name used in log messages and the payload
+        :return: a list of booleans in the same order as the jobs
+        """
+        return map_concurrent(self._invoke, jobs, self.max_workers)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for fitting the work of a catalog build into the time left before the lambda times out
+#
+
+import heapq
+import threading
+import time
+
+from libraries.tools.processed_set import pack_json, unpack_json
+
+
+class TimeBudgetExceeded(Exception):
+    """
+    Raised when there is not enough time left to start more work.
+    The finished work has been recorded and the build will continue in the next run.
+    """
+    pass
+
+
+class WorkPlanner(object):
+    """
+    Estimates how long each unit of work will take from how long it took in earlier runs
+    and only starts work that can finish before the lambda times out.
+    Timings and the predicted versus actual time of the last run are stored in the status table.
+    """
+
+    def __init__(self, db_handler, keys, sec_remaining=None, reserve=120, default_cost=30, weight=0.5, clock=None):
+        """
+        :param db_handler: the DynamoDBHandler (or MockDynamodbHandler) of the status table
+        :param dict keys: the keys of the catalog status e.g. {'api_version': 'ts.2'}
+        :param sec_remaining: returns the seconds left before the lambda times out or None if there is no time limit
+        :param int reserve: the number of seconds kept back for finishing the build
+        :param int default_cost: the estimated seconds of work that has never been timed
+        :param float weight: the weight given to the latest timing when it is merged with the earlier timings
+        :param clock: returns the current time in seconds. Defaults to time.time
+        """
+        self.db_handler = db_handler
+        self.keys = dict((k, '{}.timings'.format(v)) for k, v in keys.items())
+        self.owner = keys
+        self.sec_remaining = sec_remaining
+        self.reserve = reserve
+        self.default_cost = default_cost
+        self.weight = weight
+        if clock:
+            self.clock = clock
+        else:
+            self.clock = time.time
+        self.timings = {}
+        self.deferred = []
+        self.finished = set()
+        self._started = {}
+        self._predicted = 0
+        self._actual = 0
+        self._finished = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the timings of earlier runs.
+        Missing or unreadable timings are treated as empty.
+        :return:
+        """
+        try:
+            record = self.db_handler.get_item(self.keys)
+            if record and record.get('timings'):
+                self.timings = dict((k, v / 1000.0) for k, v in unpack_json(record['timings']).items())
+        except Exception:
+            self.timings = {}
+
+    def save(self):
+        """
+        Writes the timings and the metrics of this run
+        :return:
+        """
+        with self._lock:
+            timings = dict((k, int(round(v * 1000))) for k, v in self.timings.items())
+            self.db_handler.update_item(self.keys, {
+                # TRICKY: identifies the record as part of a status so it is not treated as a status itself
+                'timings_of': self.owner,
+                'timings': pack_json(timings),
+                'metrics': self.metrics()
+            })
+
+    def metrics(self):
+        """
+        Returns the predicted and actual time of the work finished in this run
+        :return: a dictionary of times in milliseconds
+        """
+        metrics = {
+            'units': self._finished,
+            'deferred': len(self.deferred),
+            'predicted_ms': int(round(self._predicted * 1000)),
+            'actual_ms': int(round(self._actual * 1000)),
+            'predicted_per_unit_ms': 0,
+            'actual_per_unit_ms': 0,
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        }
+        if self._finished:
+            metrics['predicted_per_unit_ms'] = metrics['predicted_ms'] // self._finished
+            metrics['actual_per_unit_ms'] = metrics['actual_ms'] // self._finished
+        return metrics
+
+    def estimate(self, unit):
+        """
+        Returns the estimated seconds a unit of work will take.
+        Units that have never been timed are given the average of the known timings.
+        :param unit: the id of the unit of work
+        :return:
+        """
+        if unit in self.timings:
+            return self.timings[unit]
+        if self.timings:
+            return sum(self.timings.values()) / len(self.timings)
+        return self.default_cost
+
+    def budget(self):
+        """
+        Returns the seconds that may still be spent on new work or None if there is no time limit
+        :return:
+        """
+        if not self.sec_remaining:
+            return None
+        sec_remaining = self.sec_remaining()
+        if sec_remaining is None:
+            return None
+        return sec_remaining - self.reserve
+
+    def plan(self, units, workers=1, finished=None):
+        """
+        Orders the units so the longest start first and drops the units that would not finish in time.
+        The dropped units are added to deferred.
+        Units that were finished by an earlier run are planned last and cost nothing
+        so their old timings do not push the pending units out of the plan.
+        :param list units: the ids of the units of work
+        :param int workers: the number of units that are worked on at once
+        :param finished: the ids of the units that have no work left
+        :return: the units to work on in the order they should be started
+        """
+        self.finished = set(finished or [])
+        pending = [unit for unit in units if unit not in self.finished]
+        done = [unit for unit in units if unit in self.finished]
+        ordered = sorted(pending, key=self.estimate, reverse=True)
+        budget = self.budget()
+        if budget is None:
+            return ordered + done
+
+        planned = []
+        lanes = [0] * max(workers, 1)
+        for unit in ordered:
+            # give the unit to the worker that will be free first
+            finish = lanes[0] + self.estimate(unit)
+            if finish <= budget:
+                heapq.heapreplace(lanes, finish)
+                planned.append(unit)
+            else:
+                with self._lock:
+                    self.deferred.append(unit)
+        return planned + done
+
+    def begin(self, unit):
+        """
+        Records the start of a unit of work.
+        :param unit: the id of the unit of work
+        :raises TimeBudgetExceeded: if the unit would not finish in time
+        :return:
+        """
+        budget = self.budget()
+        if budget is not None and unit not in self.finished and self.estimate(unit) > budget:
+            with self._lock:
+                self.deferred.append(unit)
+            raise TimeBudgetExceeded('Not enough time left to start {}'.format(unit))
+        with self._lock:
+            self._started[unit] = self.clock()
+
+    def end(self, unit):
+        """
+        Records the end of a unit of work and updates its timing
+        :param unit: the id of the unit of work
+        :return:
+        """
+        with self._lock:
+            started = self._started.pop(unit, None)
+            if started is None:
+                return
+            actual = self.clock() - started
+            self._predicted += self.estimate(unit)
+            self._actual += actual
+            self._finished += 1
+            if unit in self.timings:
+                actual = self.timings[unit] * (1 - self.weight) + actual * self.weight
+            self.timings[unit] = actual
+
+    def cancel(self, unit):
+        """
+        Forgets the start of a unit of work that did not need to be timed
+        :param unit: the id of the unit of work
+        :return:
+        """
+        with self._lock:
+            self._started.pop(unit, None)
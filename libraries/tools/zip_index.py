@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+#
+# Class for reading the files in a repository archive without unzipping it
+#
+
+import os
+import posixpath
+import shutil
+import threading
+import zipfile
+
+
+class ZipIndex(object):
+    """
+    Answers file system queries about a folder inside a zip archive.
+    Only the central directory is read when the index is created.
+    Members are read straight from the archive and are only extracted to disk when a path is required.
+    Each thread reads through its own handle so members can be extracted concurrently.
+    """
+
+    def __init__(self, zip_file, root, extract_dir):
+        """
+        :param zip_file: the path to the zip archive
+        :param root: the folder in the archive that paths are relative to.
+        This is matched case insensitively because gogs gives a lower case name to the folder.
+        :param extract_dir: the directory members are extracted to
+        """
+        self.zip_file = zip_file
+        self.extract_dir = extract_dir
+        self.extracted = {}
+        self._files = {}
+        self._dirs = {}
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+        prefix = root.lower().rstrip('/') + '/'
+        for info in self._zip().infolist():
+            name = info.filename.replace('\\', '/')
+            if not name.lower().startswith(prefix):
+                continue
+            path = name[len(prefix):].rstrip('/')
+            if name.endswith('/'):
+                self._add_dir(path)
+            else:
+                self._files[path] = info
+                self._add_dir(posixpath.dirname(path))
+                self._dirs[posixpath.dirname(path)].add(posixpath.basename(path))
+
+    def _add_dir(self, path):
+        """
+        Records a directory and its parents
+        :param path:
+        :return:
+        """
+        if path in self._dirs:
+            return
+        self._dirs[path] = set()
+        if path:
+            parent = posixpath.dirname(path)
+            self._add_dir(parent)
+            self._dirs[parent].add(posixpath.basename(path))
+
+    def _zip(self):
+        """
+        Returns the archive handle of the current thread
+        :return: zipfile.ZipFile
+        """
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.zip_file)
+            self._local.handle = handle
+            with self._lock:
+                self._handles.append(handle)
+        return handle
+
+    @staticmethod
+    def _normalize(path):
+        """
+        Converts a path relative to the root folder into the key used by the index
+        :param path:
+        :return:
+        """
+        path = posixpath.normpath(path.replace('\\', '/')).lstrip('/')
+        if path == '.':
+            return ''
+        return path
+
+    def isfile(self, path):
+        return self._normalize(path) in self._files
+
+    def isdir(self, path):
+        return self._normalize(path) in self._dirs
+
+    def listdir(self, path):
+        """
+        Lists the names of the files and directories in a directory
+        :param path:
+        :return: a sorted list of names
+        """
+        key = self._normalize(path)
+        if key not in self._dirs:
+            raise OSError('No such directory in {}: {}'.format(self.zip_file, path))
+        return sorted(self._dirs[key])
+
+    def getsize(self, path):
+        """
+        Returns the uncompressed size of a file
+        :param path:
+        :return: int
+        """
+        return self._info(path).file_size
+
+    def read(self, path):
+        """
+        Reads a file from the archive
+        :param path:
+        :return: the bytes of the file
+        """
+        return self._zip().read(self._info(path))
+
+    def extract(self, path):
+        """
+        Extracts a file to the extract directory the first time it is needed
+        :param path:
+        :return: the path to the extracted file
+        """
+        key = self._normalize(path)
+        if key in self.extracted:
+            return self.extracted[key]
+
+        info = self._info(key)
+        out_path = os.path.join(self.extract_dir, *key.split('/'))
+        with self._lock:
+            if not os.path.isdir(os.path.dirname(out_path)):
+                os.makedirs(os.path.dirname(out_path))
+        with self._zip().open(info) as source:
+            with open(out_path, 'wb') as out_file:
+                shutil.copyfileobj(source, out_file)
+        with self._lock:
+            self.extracted[key] = out_path
+        return out_path
+
+    def _info(self, path):
+        key = self._normalize(path)
+        if key not in self._files:
+            raise IOError('No such file in {}: {}'.format(self.zip_file, path))
+        return self._files[key]
+
+    def close(self):
+        with self._lock:
+            for handle in self._handles:
+                handle.close()
+            self._handles = []
+        self._local = threading.local()
@@ -476,4 +476,96 @@ class TestCatalog(TestCase):
         state = self.make_handler_instance('valid.json')
         new_catalog = {}
         result = state['handler']._catalog_has_changed(new_catalog)
-        self.assertTrue(result)
\ No newline at end of file
+        self.assertTrue(result)
+
+    def _rerun(self, state, get_url=None):
+        """
+        Runs a new handler instance against the same mocks as a previous run
+        :param state: the state returned by run_with_db
+        :return: the response
+        """
+        mocks = state['mocks']
+        dbs = {
+            'd43-catalog-in-progress': mocks['db']['progress'],
+            'd43-catalog-status': mocks['db']['status'],
+            'd43-catalog-errors': mocks['db']['errors']
+        }
+        handler = CatalogHandler(state['event'],
+                                 None,
+                                 s3_handler=lambda bucket: mocks['s3'],
+                                 dynamodb_handler=lambda table: dbs[table],
+                                 ses_handler=lambda: mocks['ses'],
+                                 consistency_checker=lambda: mocks['checker'],
+                                 url_exists_handler=lambda url: True,
+                                 get_url_handler=get_url or mocks['api'].get_url)
+        state['handler'] = handler
+        return handler.run()
+
+    def test_incremental_catalog(self, mock_reporter):
+        state = self.make_handler_instance('complex.json')
+        state['event']['stage-variables']['catalog_fragments_key'] = 'temp/catalog_fragments.json'
+        response = self._rerun(state)
+        assert_object_equals_file(self, response['catalog'], os.path.join(self.resources_dir, 'v3_catalog_complex.json'))
+        self.assertEqual(0, state['handler'].fragments.hits)
+        self.assertIn('catalog_hash', state['mocks']['db']['status']._db[0])
+
+        # unchanged rows are re-used and the stored hash avoids downloading the published catalog
+        get_url = MagicMock()
+        response = self._rerun(state, get_url)
+        rc_rows = [i for i in state['mocks']['db']['progress']._db
+                   if i['repo_name'] not in ['catalogs', 'localization', 'versification']]
+        self.assertEqual(len(rc_rows), state['handler'].fragments.hits)
+        self.assertEqual('No changes detected. Catalog not deployed', response['message'])
+        get_url.assert_not_called()
+
+        # only the changed row is built again
+        rc_rows[0]['commit_id'] = 'changed'
+        response = self._rerun(state, get_url)
+        self.assertEqual(len(rc_rows) - 1, state['handler'].fragments.hits)
+        self.assertEqual('No changes detected. Catalog not deployed', response['message'])
+
+    def test_reused_rows_are_not_decoded(self, mock_reporter):
+        state = self.make_handler_instance('complex.json')
+        state['event']['stage-variables']['catalog_fragments_key'] = 'temp/catalog_fragments.json'
+        self._rerun(state)
+
+        with patch('libraries.lambda_handlers.catalog_handler.json.loads', wraps=json.loads) as loads:
+            self._rerun(state)
+        rows = state['mocks']['db']['progress']._db
+        decoded = [call[0][0] for call in loads.call_args_list]
+        self.assertTrue(state['handler'].fragments.hits > 0)
+        for row in rows:
+            if row['repo_name'] not in ['catalogs', 'localization', 'versification']:
+                self.assertNotIn(row['package'], decoded)
+
+    def test_reused_rows_are_checked(self, mock_reporter):
+        state = self.make_handler_instance('complex.json')
+        state['event']['stage-variables']['catalog_fragments_key'] = 'temp/catalog_fragments.json'
+        self._rerun(state)
+
+        # the files of the rows have been removed since the fragments were saved
+        state['mocks']['checker']._urls_do_exist = False
+        response = self._rerun(state)
+        self.assertEqual(0, state['handler'].fragments.hits)
+        self.assertTrue(response['incomplete'])
+        self.assertTrue(len(state['mocks']['checker'].all_errors) > 0)
+
+    def test_incremental_catalog_matches_full_build(self, mock_reporter):
+        full = self.run_with_db('complex.json')['response']['catalog']
+
+        state = self.make_handler_instance('complex.json')
+        state['event']['stage-variables']['catalog_fragments_key'] = 'temp/catalog_fragments.json'
+        self._rerun(state)
+        response = self._rerun(state)
+        self.assertTrue(state['handler'].fragments.hits > 0)
+        self.assertEqual('No changes detected. Catalog not deployed', response['message'])
+        self.assertEqual(json.dumps(full, sort_keys=True), json.dumps(response['catalog'], sort_keys=True))
+
+    def test_get_language(self, mock_reporter):
+        handler = self.make_handler_instance('valid.json')['handler']
+        en = handler.get_language({'identifier': 'en', 'title': 'English'})
+        fr = handler.get_language({'identifier': 'fr', 'title': 'French'})
+        self.assertIs(en, handler.get_language({'identifier': 'en', 'title': 'Other'}))
+        self.assertEqual('English', en['title'])
+        self.assertEqual([en, fr], handler.catalog['languages'])
+        self.assertEqual([], fr['resources'])
@@ -0,0 +1,89 @@
+from __future__ import unicode_literals, print_function
+
+import json
+import os
+import time
+import unittest
+from mock import patch
+from unittest import TestCase
+
+from libraries.tools.mocks import MockChecker, MockDynamodbHandler, MockS3Handler, MockSESHandler
+from libraries.lambda_handlers.catalog_handler import CatalogHandler
+from libraries.tools.file_utils import load_json_object
+
+
+@unittest.skipUnless(os.environ.get('BENCHMARK'), 'Set BENCHMARK=1 to run the benchmarks')
+@patch('libraries.lambda_handlers.handler.ErrorReporter')
+class TestCatalogBenchmark(TestCase):
+    """
+    Builds a large synthetic catalog. Run with:
+    BENCHMARK=1 python -m unittest tests.catalog.test_catalog_benchmark
+    """
+    resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+    num_languages = 5000
+    num_resources = 50000
+
+    def make_handler(self):
+        event = {
+            'stage-variables': {
+                'api_url': 'my-api',
+                'api_bucket': 'my-bucket',
+                'to_email': 'me@example.com',
+                'from_email': 'me@example.com',
+                'cdn_bucket': 'cdn-bucket',
+                'cdn_url': 'cdn-url',
+                'version': '3',
+            }
+        }
+        return CatalogHandler(event,
+                              None,
+                              s3_handler=lambda bucket: MockS3Handler(),
+                              dynamodb_handler=lambda table: MockDynamodbHandler(),
+                              ses_handler=lambda: MockSESHandler(),
+                              consistency_checker=lambda: MockChecker(),
+                              url_exists_handler=lambda url: True,
+                              get_url_handler=lambda url, catch_exception=False: None)
+
+    def make_rows(self):
+        template = load_json_object(os.path.join(self.resources_dir, 'progress_db/valid.json'))[0]
+        manifest = json.loads(template['package'])
+        rows = []
+        for i in range(self.num_resources):
+            lid = 'lang-{}'.format(i % self.num_languages)
+            manifest['dublin_core']['language']['identifier'] = lid
+            manifest['dublin_core']['identifier'] = 'res-{}'.format(i // self.num_languages)
+            row = template.copy()
+            row['repo_name'] = '{}_{}'.format(lid, manifest['dublin_core']['identifier'])
+            row['package'] = json.dumps(manifest)
+            rows.append(row)
+        return rows
+
+    def make_localization(self):
+        localization = {}
+        for i in range(self.num_languages):
+            lid = 'lang-{}'.format(i)
+            localization[lid] = {
+                'language': {'identifier': lid, 'title': lid, 'direction': 'ltr'},
+                'category_labels': {'bible-ot': 'Old Testament'}
+            }
+        return localization
+
+    def test_build_large_catalog(self, mock_reporter):
+        rows = self.make_rows()
+        localization = self.make_localization()
+        handler = self.make_handler()
+
+        start = time.time()
+        for row in rows:
+            handler._build_rc(row, json.loads(row['package']), handler.checker)
+        rc_time = time.time() - start
+
+        start = time.time()
+        handler._build_localization(localization)
+        localization_time = time.time() - start
+
+        print('\nBuilt {} resources in {} languages: _build_rc {:.2f}s, _build_localization {:.2f}s'.format(
+            self.num_resources, self.num_languages, rc_time, localization_time))
+        self.assertEqual(self.num_languages, len(handler.catalog['languages']))
+        self.assertEqual(['lang-0', 'lang-1'], [l['identifier'] for l in handler.catalog['languages'][:2]])
+        self.assertEqual(self.num_resources // self.num_languages, len(handler.catalog['languages'][0]['resources']))
@@ -205,6 +205,36 @@ class TestFork(TestCase):
         for repo in repos:
             self.assertNotIn(repo.full_name, ['Door43-Catalog/pt-br-obs'])
 
+    def test_get_changed_repos(self, mock_reporter):
+        event = self.create_event()
+
+        # mock data
+        self.MockGogsClient.MockGogsApi.repos = []
+        self.MockGogsClient.MockGogsApi.repos.append(TestFork.create_repo("hmr-obs"))
+        self.MockGogsClient.MockGogsApi.repos.append(TestFork.create_repo("en-obs"))
+        self.MockGogsClient.MockGogsApi.repos.append(TestFork.create_repo("es-obs"))
+        self.MockGogsClient.MockGogsApi.branch = TestFork.create_branch("master")
+        self.addCleanup(setattr, self.MockGogsClient.MockGogsApi, 'branch', None)
+
+        unchanged_record = TestFork.create_db_item("hmr-obs")
+        unchanged_record['commit_id'] = 'c17825309a'
+        mockDb = MockDynamodbHandler()
+        mockDb.insert_item(unchanged_record)
+        mockDb.insert_item(TestFork.create_db_item("es-obs"))
+        mockLog = MockLogger()
+
+        handler = ForkHandler(event=event,
+                              context=None,
+                              logger=mockLog,
+                              gitea_client=self.MockGogsClient,
+                              dynamodb_handler=mockDb,
+                              boto_handler=self.MockBotoClient(),
+                              max_workers=2)
+        repos = handler.get_new_repos()
+
+        # new and changed repos are returned in the order of the organization
+        self.assertEqual(['Door43-Catalog/en-obs', 'Door43-Catalog/es-obs'], [repo.full_name for repo in repos])
+
     @patch('libraries.lambda_handlers.webhook_handler.url_exists')
     def test_make_hook_payload(self, mock_url_exists, mock_reporter):
         mock_url_exists.return_value = True
@@ -254,6 +284,46 @@ class TestFork(TestCase):
 
         self.assertIn('Simulating Webhook for my_repo', mockLog._messages)
 
+    def test_trigger_hook_throttled(self, mock_reporter):
+        event = self.create_event()
+        mockDb = MockDynamodbHandler()
+        mockLog = MockLogger()
+
+        class ThrottledError(Exception):
+            response = {'Error': {'Code': 'TooManyRequestsException'}}
+
+        class ThrottlingClient(object):
+            def __init__(self):
+                self.calls = []
+
+            def invoke(self, FunctionName, InvocationType, Payload):
+                self.calls.append((FunctionName, InvocationType))
+                if len(self.calls) == 1:
+                    raise ThrottledError('slow down')
+
+        sleeps = []
+        handler = ForkHandler(event=event,
+                              context=None,
+                              logger=mockLog,
+                              gitea_client=self.MockGogsClient,
+                              dynamodb_handler=mockDb,
+                              max_workers=1,
+                              dispatcher_options={'sleep': sleeps.append})
+        mockClient = ThrottlingClient()
+        repos = []
+        for name in ['en_obs', 'es_obs']:
+            repo = self.MockGogsRepo()
+            repo.full_name = 'Door43-Catalog/{}'.format(name)
+            repo.name = name
+            repos.append(repo)
+        stats = handler._trigger_webhook(mockClient, repos)
+
+        self.assertEqual({'dispatched': 2, 'failed': 0, 'throttled': 1}, stats)
+        self.assertEqual(3, len(mockClient.calls))
+        self.assertEqual(('d43-catalog_webhook', 'Event'), mockClient.calls[0])
+        self.assertEqual(1, len(sleeps))
+        self.assertIn('Webhooks dispatched: 2, failed: 0, throttled: 1', mockLog._messages)
+
     def test_trigger_hook_no_repos(self, mock_reporter):
         event = self.create_event()
         mockDb = MockDynamodbHandler()
@@ -0,0 +1,120 @@
+from __future__ import unicode_literals, print_function
+
+import os
+import threading
+import time
+import unittest
+from mock import patch
+from unittest import TestCase
+
+from libraries.lambda_handlers.fork_handler import ForkHandler
+from libraries.tools.mocks import MockDynamodbHandler, MockLogger
+
+
+class StandInRepo(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.full_name = 'Door43-Catalog/{}'.format(name)
+        self.default_branch = 'master'
+
+
+class StandInCommit(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class StandInBranch(object):
+
+    def __init__(self, commit_id):
+        self.commit = StandInCommit(commit_id)
+
+
+class StandInGogsClient(object):
+    """
+    A Gogs client with a large organization whose branch requests take some time
+    """
+    repos = []
+    commits = {}
+    latency = 0.001
+
+    class Token(object):
+        def __init__(self, sha1):
+            pass
+
+    class GiteaApi(object):
+        requests = 0
+        lock = threading.Lock()
+
+        def __init__(self, base_url, session=None):
+            pass
+
+        def get_user_repos(self, auth, username):
+            return StandInGogsClient.repos
+
+        def get_branch(self, auth, username, repo_name, branch):
+            with StandInGogsClient.GiteaApi.lock:
+                StandInGogsClient.GiteaApi.requests += 1
+            time.sleep(StandInGogsClient.latency)
+            return StandInBranch(StandInGogsClient.commits[repo_name])
+
+
+@unittest.skipUnless(os.environ.get('BENCHMARK'), 'Set BENCHMARK=1 to run the benchmarks')
+@patch('libraries.lambda_handlers.handler.ErrorReporter')
+class TestForkBenchmark(TestCase):
+    """
+    Finds the new and changed repos of a large organization. Run with:
+    BENCHMARK=1 python -m unittest tests.fork.test_fork_benchmark
+    """
+    num_repos = 5000
+
+    def setUp(self):
+        StandInGogsClient.repos = []
+        StandInGogsClient.commits = {}
+        self.db = MockDynamodbHandler()
+        for i in range(self.num_repos):
+            name = 'lang-{}_res'.format(i)
+            StandInGogsClient.repos.append(StandInRepo(name))
+            StandInGogsClient.commits[name] = '{:040x}'.format(i)
+            # every 10th repo is new and every 10th known repo has changed
+            if i % 10:
+                commit_id = '{:040x}'.format(i)[:10]
+                if i % 100 == 1:
+                    commit_id = 'old-commit'
+                self.db.insert_item({'repo_name': name, 'commit_id': commit_id})
+
+    def make_handler(self, max_workers):
+        event = {
+            'stage-variables': {
+                'gogs_token': '',
+                'gogs_url': 'https://git.door43.org/',
+                'gogs_org': 'Door43-Catalog',
+                'from_email': '',
+                'to_email': ''
+            },
+            'context': {}
+        }
+        return ForkHandler(event=event,
+                           context=None,
+                           logger=MockLogger(),
+                           gitea_client=StandInGogsClient,
+                           dynamodb_handler=self.db,
+                           boto_handler=None,
+                           max_workers=max_workers)
+
+    def test_get_new_repos(self, mock_reporter):
+        timings = []
+        for max_workers in [1, 8, 32]:
+            handler = self.make_handler(max_workers)
+            StandInGogsClient.GiteaApi.requests = 0
+            start = time.time()
+            repos = handler.get_new_repos()
+            timings.append('{} workers {:.2f}s'.format(max_workers, time.time() - start))
+
+            self.assertEqual(self.num_repos // 10 + self.num_repos // 100, len(repos))
+            self.assertEqual(self.num_repos - self.num_repos // 10, StandInGogsClient.GiteaApi.requests)
+            self.assertEqual('Door43-Catalog/lang-0_res', repos[0].full_name)
+            self.assertEqual('Door43-Catalog/lang-1_res', repos[1].full_name)
+
+        print('\nChecked {} repos: {}'.format(self.num_repos, ', '.join(timings)))
@@ -0,0 +1,112 @@
+from __future__ import unicode_literals, print_function
+
+import os
+import shutil
+import tempfile
+from base64 import b64decode
+from subprocess import Popen, PIPE
+from unittest import TestCase
+
+from mock import patch
+
+from libraries.tools.signer import Signer
+from libraries.tools.signer.keys import load_private_key, load_public_key, file_sha384, KeyFileError, \
+    UnsupportedKeyError
+from libraries.tools.signer.signer import _openssl_base64
+
+
+def _openssl(*args):
+    com = Popen(['openssl'] + list(args), shell=False, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    out, err = com.communicate()
+    if com.returncode != 0:
+        raise Exception(err)
+    return out
+
+
+class TestKeys(TestCase):
+
+    def setUp(self):
+        self.resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+        self.temp_dir = tempfile.mkdtemp(prefix='signing_keys_tests_')
+        self.source_file = os.path.join(self.temp_dir, 'source.json')
+        shutil.copy(os.path.join(self.resources_dir, 'source.json'), self.source_file)
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def _openssl_sign(self, private_pem):
+        _openssl('dgst', '-sha384', '-sign', private_pem, '-out', self._path('openssl.sig'), self.source_file)
+        with open(self._path('openssl.sig'), 'rb') as f:
+            return f.read()
+
+    def _openssl_verify(self, public_pem, signature):
+        with open(self._path('signature.sig'), 'wb') as f:
+            f.write(signature)
+        _openssl('dgst', '-sha384', '-verify', public_pem, '-signature', self._path('signature.sig'), self.source_file)
+
+    def test_rsa_signatures_match_openssl(self):
+        _openssl('genrsa', '-out', self._path('rsa.pem'), '2048')
+        _openssl('rsa', '-in', self._path('rsa.pem'), '-traditional', '-out', self._path('rsa1.pem'))
+        _openssl('rsa', '-in', self._path('rsa.pem'), '-pubout', '-out', self._path('rsa.pub'))
+        public_key = load_public_key(self._path('rsa.pub'))
+
+        for pem in ['rsa.pem', 'rsa1.pem']:
+            signature = load_private_key(self._path(pem)).sign_digest(file_sha384(self.source_file))
+            self.assertEqual(self._openssl_sign(self._path(pem)), signature)
+            self.assertTrue(public_key.verify_digest(file_sha384(self.source_file), signature))
+
+    def test_named_curve_signatures_verify_with_openssl(self):
+        for curve in ['prime256v1', 'secp384r1', 'secp521r1']:
+            pem = self._path(curve + '.pem')
+            pub = self._path(curve + '.pub')
+            _openssl('ecparam', '-name', curve, '-genkey', '-noout', '-out', pem)
+            _openssl('ec', '-in', pem, '-pubout', '-out', pub)
+            digest = file_sha384(self.source_file)
+
+            self._openssl_verify(pub, load_private_key(pem).sign_digest(digest))
+            public_key = load_public_key(pub)
+            self.assertTrue(public_key.verify_digest(digest, self._openssl_sign(pem)))
+            self.assertFalse(public_key.verify_digest(file_sha384(pem), self._openssl_sign(pem)))
+
+    def test_explicit_curve_signatures_verify_with_openssl(self):
+        private_pem = os.path.join(self.resources_dir, 'unit-test-private.pem')
+        public_pem = os.path.join(self.resources_dir, 'unit-test-public.pem')
+        digest = file_sha384(self.source_file)
+
+        self._openssl_verify(public_pem, load_private_key(private_pem).sign_digest(digest))
+        self.assertTrue(load_public_key(public_pem).verify_digest(digest, self._openssl_sign(private_pem)))
+
+    def test_base64_matches_openssl(self):
+        for size in [0, 1, 47, 48, 49, 96, 139, 200]:
+            data = os.urandom(size)
+            with open(self._path('data.bin'), 'wb') as f:
+                f.write(data)
+            self.assertEqual(_openssl('base64', '-in', self._path('data.bin')).decode('ascii'),
+                             _openssl_base64(data))
+            self.assertEqual(data, b64decode(_openssl_base64(data)))
+
+    def test_missing_key_file(self):
+        with self.assertRaises(KeyFileError) as context:
+            load_private_key(self._path('missing.pem'))
+        self.assertIn('key file', str(context.exception))
+
+    def test_wrong_key_type(self):
+        with self.assertRaises(KeyFileError) as context:
+            load_public_key(os.path.join(self.resources_dir, 'unit-test-private.pem'))
+        self.assertIn('key file', str(context.exception))
+
+    def test_encrypted_key_falls_back_to_openssl(self):
+        private_pem = self._path('encrypted.pem')
+        _openssl('ec', '-in', os.path.join(self.resources_dir, 'unit-test-private.pem'), '-aes256',
+                 '-passout', 'pass:secret', '-out', private_pem)
+        with self.assertRaises(UnsupportedKeyError):
+            load_private_key(private_pem)
+
+        signer = Signer()
+        with patch.object(signer, '_openssl_sign_file', return_value='source.sig') as openssl_sign:
+            self.assertEqual('source.sig', signer.sign_file(self.source_file, private_pem_file=private_pem))
+            self.assertEqual(1, openssl_sign.call_count)
@@ -1,11 +1,13 @@
 from __future__ import unicode_literals, print_function
 
+import json
 import os
 import shutil
 import tempfile
 import unittest
 from unittest import TestCase
 
+from libraries.tools.file_digest import FileDigest
 from libraries.tools.signer import Signer, ENC_PRIV_PEM_PATH
 
 from libraries.tools.test_utils import is_travis
@@ -51,6 +53,23 @@ class TestSigner(TestCase):
         self.assertTrue(self.signer.verify_signature(source_file, sig_file_name,
                                                      public_pem_file=os.path.join(self.resources_dir, 'unit-test-public.pem')))
 
+    def test_sign_file_with_known_digest(self):
+        source_file = os.path.join(self.temp_dir, 'source.json')
+        shutil.copy(os.path.join(self.resources_dir, 'source.json'), source_file)
+        digest = FileDigest.from_file(source_file)
+        private_pem = os.path.join(self.resources_dir, 'unit-test-private.pem')
+        public_pem = os.path.join(self.resources_dir, 'unit-test-public.pem')
+
+        sig_file_name = self.signer.sign_file(source_file, private_pem_file=private_pem, digest=digest.sha384)
+
+        # the signature matches the file
+        self.assertTrue(self.signer.verify_signature(source_file, sig_file_name, public_pem_file=public_pem))
+        self.assertTrue(self.signer.verify_signature(source_file, sig_file_name, public_pem_file=public_pem,
+                                                     digest=digest.sha384))
+        with self.assertRaises(RuntimeError):
+            self.signer.verify_signature(source_file, sig_file_name, public_pem_file=public_pem,
+                                         digest=FileDigest().sha384)
+
     def test_verify_with_bogus_certificate(self):
 
         # initialization
@@ -197,3 +216,43 @@ class TestSigner(TestCase):
             self.signer.sign_file(source_file, private_pem_file=os.path.join(self.resources_dir, 'none.pem'))
 
         self.assertIn('key file', str(context.exception))
+
+    def _sign_source(self, signer):
+        source_file = os.path.join(self.temp_dir, 'source.json')
+        shutil.copy(os.path.join(self.resources_dir, 'source.json'), source_file)
+        sig_file = signer.sign_file(source_file, private_pem_file=os.path.join(self.resources_dir,
+                                                                               'unit-test-private.pem'))
+        return source_file, sig_file
+
+    def test_in_process_and_openssl_signatures_are_interchangeable(self):
+        public_pem = os.path.join(self.resources_dir, 'unit-test-public.pem')
+        openssl_signer = Signer(use_openssl=True)
+
+        source_file, sig_file = self._sign_source(self.signer)
+        self.assertFalse(os.path.isfile(source_file + '.sha384'))
+        self.assertTrue(openssl_signer.verify_signature(source_file, sig_file, public_pem_file=public_pem))
+
+        source_file, sig_file = self._sign_source(openssl_signer)
+        self.assertTrue(self.signer.verify_signature(source_file, sig_file, public_pem_file=public_pem))
+
+    def test_sig_file_format_matches_openssl(self):
+        source_file, sig_file = self._sign_source(self.signer)
+        with open(sig_file) as f:
+            in_process = json.load(f)
+        source_file, sig_file = self._sign_source(Signer(use_openssl=True))
+        with open(sig_file) as f:
+            openssl = json.load(f)
+
+        self.assertEqual(['si', 'sig'], sorted(in_process[0].keys()))
+        self.assertEqual('uW', in_process[0]['si'])
+        self.assertEqual([len(l) for l in openssl[0]['sig'].split('\n')][:-2],
+                         [len(l) for l in in_process[0]['sig'].split('\n')][:-2])
+        self.assertTrue(in_process[0]['sig'].endswith('\n'))
+
+    def test_verify_modified_file(self):
+        source_file, sig_file = self._sign_source(self.signer)
+        with open(source_file, 'a') as f:
+            f.write(' ')
+        with self.assertRaises(RuntimeError):
+            self.signer.verify_signature(source_file, sig_file,
+                                         public_pem_file=os.path.join(self.resources_dir, 'unit-test-public.pem'))
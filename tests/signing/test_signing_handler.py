@@ -4,13 +4,18 @@ import json
 import os
 import shutil
 import tempfile
+import threading
+import time
 import unittest
+import urllib2
 import mock
 from mock import Mock, patch, MagicMock
 from unittest import TestCase
 
-from libraries.tools.file_utils import load_json_object
+from libraries.tools.file_digest import FileDigest
+from libraries.tools.file_utils import load_json_object, write_file
 from libraries.tools.mocks import MockDynamodbHandler, MockS3Handler, MockLogger, MockSigner, MockAPI
+from libraries.tools.s3_index import S3Index
 from libraries.tools.signer import Signer
 from libraries.tools.url_utils import HeaderReader
 
@@ -380,6 +385,219 @@ class TestSigningHandler(TestCase):
         self.assertFalse(already_signed)
         self.assertTrue(newly_signed)
 
+    def test_signing_uses_download_digest(self, mock_reporter):
+        """
+        Ensure the digest calculated while downloading is used instead of reading the file again
+        :return:
+        """
+        mock_s3 = MockS3Handler()
+        mock_api = MockAPI(os.path.join(self.resources_dir, 'cdn'), 'https://cdn.door43.org/')
+        mock_signer = MagicMock(wraps=self.mock_signer)
+        downloads = []
+
+        def mock_download_file(url, dest):
+            path = os.path.join(self.temp_dir, 'download')
+            mock_api.download_file(url, path)
+            with open(path, 'rb') as source, open(dest, 'wb') as out_file:
+                downloads.append(FileDigest.copy(source, out_file))
+            return downloads[-1]
+
+        format = {
+            'build_rules': ['signing.sign_given_url'],
+            'format': 'application/zip',
+            'modified': '',
+            'signature': '',
+            'size': 1,
+            'url': 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_64kbps.zip'
+        }
+        signer = SigningHandler(self.create_event(),
+                                None,
+                                logger=MockLogger(),
+                                signer=mock_signer,
+                                s3_handler=mock_s3,
+                                dynamodb_handler=MockDynamodbHandler(),
+                                url_exists_handler=mock_api.url_exists,
+                                download_handler=mock_download_file,
+                                url_headers_handler=lambda url: HeaderReader([('content-length', 123)]))
+        with patch('libraries.lambda_handlers.signing_handler.FileDigest.from_file') as mock_from_file:
+            (already_signed, newly_signed) = signer.process_format({'repo_name': 'repo_name', 'commit_id': 'commitid'},
+                                                                   None, None, format)
+            self.assertFalse(mock_from_file.called)
+        self.assertTrue(newly_signed)
+        digest = downloads[0]
+        self.assertEqual(digest.sha384, mock_signer.sign_file.call_args[1]['digest'])
+        self.assertEqual(digest.sha384, mock_signer.verify_signature.call_args[1]['digest'])
+        self.assertEqual(digest.size, format['size'])
+
+    def test_probe_media_without_downloading(self, mock_reporter):
+        """
+        Ensure signed and external media are completed from the remote file
+        :return:
+        """
+        mock_prober = Mock()
+        mock_prober.probe.return_value = {'size': 10, 'length': 2.5}
+        mock_download = Mock()
+        signer = SigningHandler(self.create_event(),
+                                None,
+                                logger=MockLogger(),
+                                signer=self.mock_signer,
+                                s3_handler=MockS3Handler(),
+                                dynamodb_handler=MockDynamodbHandler(),
+                                url_exists_handler=lambda url: True,
+                                download_handler=mock_download,
+                                media_prober=mock_prober)
+        item = {'repo_name': 'repo_name', 'commit_id': 'commitid'}
+
+        signed = {
+            'format': '',
+            'modified': '',
+            'signature': 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_01_64kbps.mp3.sig',
+            'size': 0,
+            'url': 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_01_64kbps.mp3'
+        }
+        self.assertEqual((True, False), signer.process_format(item, None, None, signed))
+        self.assertEqual(10, signed['size'])
+        self.assertEqual(2.5, signed['length'])
+        self.assertEqual('audio/mp3', signed['format'])
+
+        external = {
+            'format': '',
+            'modified': '',
+            'signature': '',
+            'size': 0,
+            'url': 'https://example.com/en/obs/en_obs_01_360p.mp4'
+        }
+        self.assertEqual((True, True), signer.process_format(item, None, None, external))
+        self.assertEqual(10, external['size'])
+        self.assertEqual(2.5, external['length'])
+        self.assertEqual('video/mp4', external['format'])
+        mock_prober.probe.assert_called_with('https://example.com/en/obs/en_obs_01_360p.mp4', length=True)
+
+        # complete formats are not probed again
+        mock_prober.probe.reset_mock()
+        self.assertEqual((True, False), signer.process_format(item, None, None, signed))
+        self.assertFalse(mock_prober.probe.called)
+        self.assertFalse(mock_download.called)
+
+        # signed formats whose length could not be read are not probed on every run
+        del signed['length']
+        self.assertEqual((True, False), signer.process_format(item, None, None, signed))
+        self.assertFalse(mock_prober.probe.called)
+
+    def test_probe_media_falls_back_to_headers(self, mock_reporter):
+        """
+        Ensure the size is read from the headers when the host does not support range requests
+        :return:
+        """
+        mock_prober = Mock()
+        mock_prober.probe.side_effect = urllib2.URLError('Range requests are not supported')
+        signer = SigningHandler(self.create_event(),
+                                None,
+                                logger=MockLogger(),
+                                signer=self.mock_signer,
+                                s3_handler=MockS3Handler(),
+                                dynamodb_handler=MockDynamodbHandler(),
+                                url_exists_handler=lambda url: True,
+                                download_handler=Mock(),
+                                url_headers_handler=lambda url: HeaderReader([('content-length', '1234')]),
+                                media_prober=mock_prober)
+        format = {
+            'format': '',
+            'modified': '',
+            'signature': '',
+            'size': 0,
+            'url': 'https://example.com/en/obs/en_obs_01_360p.mp4'
+        }
+        signer._probe_media(format)
+        self.assertEqual(1234, format['size'])
+        self.assertNotIn('length', format)
+
+        # a missing resource leaves the size unknown
+        signer.url_headers = lambda url: HeaderReader([('content-length', '9')], 404)
+        format['size'] = 0
+        signer._probe_media(format)
+        self.assertEqual(0, format['size'])
+
+    def test_sign_chapters_concurrently(self, mock_reporter):
+        """
+        Ensure chapters are signed concurrently within the disk budget
+        :return:
+        """
+        media_file = os.path.join(self.resources_dir, 'cdn', 'en', 'obs', 'v4', '64kbps', 'en_obs_01_64kbps.mp3')
+        lock = threading.Lock()
+        active = []
+        peak = [0]
+
+        def mock_download_file(url, dest):
+            with lock:
+                active.append(url)
+                peak[0] = max(peak[0], len(active))
+            time.sleep(0.02)
+            shutil.copyfile(media_file, dest)
+            with lock:
+                active.remove(url)
+
+        chapters = []
+        for chapter in range(1, 13):
+            chapters.append({
+                'build_rules': ['signing.sign_given_url'],
+                'format': 'audio/mp3',
+                'identifier': str(chapter).zfill(2),
+                'length': 1,
+                'modified': '2017-01-01T00:00:00+00:00',
+                'signature': '',
+                'size': 0,
+                'url': 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_{}_64kbps.mp3'.format(str(chapter).zfill(2))
+            })
+        package = {
+            'dublin_core': {'identifier': 'obs', 'language': {'identifier': 'en'}},
+            'projects': [{
+                'identifier': 'obs',
+                'formats': [{
+                    'format': 'application/zip',
+                    'modified': '2017-01-01T00:00:00+00:00',
+                    'signature': 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_64kbps.zip.sig',
+                    'size': 1,
+                    'url': 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_64kbps.zip',
+                    'chapters': chapters
+                }]
+            }]
+        }
+        mock_db = MagicMock(wraps=MockDynamodbHandler())
+        signer = SigningHandler(self.create_event(),
+                                None,
+                                logger=MockLogger(),
+                                signer=self.mock_signer,
+                                s3_handler=MockS3Handler(),
+                                dynamodb_handler=mock_db,
+                                url_exists_handler=lambda url: not url.endswith('_05_64kbps.mp3'),
+                                download_handler=mock_download_file,
+                                url_headers_handler=lambda url: HeaderReader([('content-length', 100)]),
+                                media_prober=Mock(),
+                                max_workers=4,
+                                max_disk_bytes=250)
+        signer.process_db_item({'repo_name': 'en_obs', 'commit_id': 'commitid'}, package)
+
+        # only two downloads fit in the disk budget at once
+        self.assertEqual(2, peak[0])
+        self.assertEqual(200, signer.disk_budget.peak)
+        self.assertEqual(0, signer.disk_budget.reserved)
+
+        # chapters keep their order and the missing chapter is dropped
+        signed_chapters = package['projects'][0]['formats'][0]['chapters']
+        self.assertEqual(['01', '02', '03', '04', '06', '07', '08', '09', '10', '11', '12'],
+                         [chapter['identifier'] for chapter in signed_chapters])
+        for chapter in signed_chapters:
+            self.assertEqual('{}.sig'.format(chapter['url']), chapter['signature'])
+            self.assertEqual(os.path.getsize(media_file), chapter['size'])
+            self.assertFalse(os.path.exists(os.path.join(signer.temp_dir, os.path.basename(chapter['url']))))
+
+        # the package is written once
+        self.assertEqual(1, mock_db.update_item.call_count)
+        record = mock_db.update_item.call_args[0][1]
+        self.assertTrue(record['signed'])
+        self.assertEqual(11, len(json.loads(record['package'])['projects'][0]['formats'][0]['chapters']))
+
     def test_signing_obs_html(self, mock_reporter):
         mock_s3 = MockS3Handler()
         mock_db = MockDynamodbHandler()
@@ -456,6 +674,9 @@ class TestSigningHandler(TestCase):
         mockHeaders = HeaderReader([
             ('content-length', 345)
         ])
+        # the host does not support range requests
+        mock_prober = Mock()
+        mock_prober.probe.side_effect = urllib2.URLError('Range requests are not supported')
         signer = SigningHandler(event,
                                 None,
                                 logger=mock_logger,
@@ -464,11 +685,12 @@ class TestSigningHandler(TestCase):
                                 dynamodb_handler=mock_db,
                                 url_exists_handler=mock_api.url_exists,
                                 download_handler=mock_api.download_file,
-                                url_headers_handler=lambda url: mockHeaders)
+                                url_headers_handler=lambda url: mockHeaders,
+                                media_prober=mock_prober)
         (already_signed, newly_signed) = signer.process_format(item, None, None, format)
         self.assertEqual('', format['signature'])
         self.assertEqual('application/zip; content=video/3gpp', format['format'])
-        self.assertEqual(116, format['size'])
+        self.assertEqual(345, format['size'])
         self.assertTrue(already_signed)
         self.assertTrue(newly_signed)
 
@@ -515,3 +737,36 @@ class TestSigningHandler(TestCase):
         (already_signed, newly_signed) = signing_handler.process_format(item, None, None, format)
         self.assertTrue(newly_signed)
         mock_s3.download_file('{}.sig'.format(key), os.path.expanduser('~/{}.sig'.format(os.path.basename(key))))
+
+    def test_safe_url_exists_uses_s3_index(self, mock_reporter):
+        media_file = os.path.join(self.temp_dir, '01.mp3')
+        write_file(media_file, 'audio')
+        mock_s3 = MockS3Handler()
+        mock_s3.upload_file(media_file, 'en/obs/v4/01.mp3')
+        mock_url_exists = Mock(return_value=True)
+        s3_index = S3Index(mock_s3, ['cdn.door43.org'], list_handler=lambda handler, prefix: handler.list_objects(prefix))
+
+        handler = SigningHandler(self.create_event(),
+                                 None,
+                                 logger=MockLogger(),
+                                 signer=self.mock_signer,
+                                 s3_handler=mock_s3,
+                                 dynamodb_handler=MockDynamodbHandler(),
+                                 url_exists_handler=mock_url_exists,
+                                 download_handler=None,
+                                 s3_index=s3_index)
+        self.assertTrue(handler._safe_url_exists('https://cdn.door43.org/en/obs/v4/01.mp3'))
+        self.assertFalse(handler._safe_url_exists('https://cdn.door43.org/en/obs/v4/02.mp3'))
+        self.assertFalse(mock_url_exists.called)
+
+        # urls outside of the cdn are still requested
+        self.assertTrue(handler._safe_url_exists('https://example.com/en/obs/v4/01.mp3'))
+        self.assertTrue(mock_url_exists.called)
+
+        # uploads are added to the index
+        handler._upload_file(media_file, 'en/obs/v4/02.mp3')
+        self.assertTrue(handler._safe_url_exists('https://cdn.door43.org/en/obs/v4/02.mp3'))
+        digest = FileDigest.from_file(media_file)
+        handler._upload_file(media_file, 'en/obs/v4/03.mp3', digest)
+        self.assertEqual({'size': 5, 'etag': digest.md5, 'modified': None}, s3_index.get('en/obs/v4/03.mp3'))
+        self.assertEqual(1, s3_index.listings)
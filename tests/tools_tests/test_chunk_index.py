@@ -0,0 +1,95 @@
+# coding=utf-8
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+from libraries.tools.file_utils import write_file
+from libraries.tools.ts_v2_utils import ChunkIndexRegistry, index_chunks, pad_to_match
+
+
+def _slow_pad_to_match(num, matches, max_len=3):
+    # the original z-fill implementation
+    padded_num = '{}'.format(num)
+    while len(padded_num) < max_len and padded_num not in matches:
+        padded_num = padded_num.zfill(len(padded_num) + 1)
+        if padded_num in matches:
+            return padded_num
+    return '{}'.format(num)
+
+
+class TestChunkIndex(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_chunk_index_')
+        self.chunks = [
+            {'chp': '01', 'firstvs': '01'},
+            {'chp': '01', 'firstvs': '04'},
+            {'chp': '02', 'firstvs': '01'},
+            {'chp': '100', 'firstvs': '010'},
+            {'chp': '150', 'firstvs': '1'}
+        ]
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_pad_matches_zfill(self):
+        index = index_chunks(self.chunks)
+        matches = list(index.keys())
+        for max_len in [2, 3, 4]:
+            for num in [1, 2, 3, 10, 100, 150, '1', '01', '001', '0100', 'front', 'intro']:
+                self.assertEqual(_slow_pad_to_match(num, matches, max_len), pad_to_match(num, index, max_len))
+                for chapter in index:
+                    self.assertEqual(_slow_pad_to_match(num, list(index[chapter]), max_len),
+                                     pad_to_match(num, index[chapter], max_len))
+
+    def test_pad_prefers_shortest_match(self):
+        index = index_chunks([{'chp': '05', 'firstvs': '1'}, {'chp': '005', 'firstvs': '1'}])
+        self.assertEqual('05', pad_to_match(5, index))
+
+    def test_index_is_still_a_dict_of_lists(self):
+        index = index_chunks(self.chunks)
+        self.assertEqual({
+            '01': ['01', '04'],
+            '02': ['01'],
+            '100': ['010'],
+            '150': ['1']
+        }, index)
+        self.assertIn('04', index['01'])
+        self.assertNotIn('4', index['01'])
+
+    def test_download_once(self):
+        requests = []
+
+        def mock_get_url(url, catch_exception=False):
+            requests.append(url)
+            return json.dumps(self.chunks)
+
+        registry = ChunkIndexRegistry()
+        with patch('libraries.tools.ts_v2_utils.get_url', mock_get_url):
+            first = registry.get('gen')
+            second = registry.get('GEN')
+        self.assertIs(first, second)
+        self.assertEqual(['https://cdn.door43.org/bible/txt/1/gen/chunks.json'], requests)
+
+    def test_download_failure_is_not_cached(self):
+        responses = ['not json', json.dumps(self.chunks)]
+
+        registry = ChunkIndexRegistry()
+        with patch('libraries.tools.ts_v2_utils.get_url', lambda url: responses.pop(0)):
+            with self.assertRaises(ValueError):
+                registry.get('gen')
+            self.assertIn('01', registry.get('gen'))
+
+    def test_load_snapshot(self):
+        write_file(os.path.join(self.temp_dir, 'gen.json'), json.dumps(self.chunks))
+        write_file(os.path.join(self.temp_dir, 'exo', 'chunks.json'), json.dumps(self.chunks))
+        write_file(os.path.join(self.temp_dir, 'README.md'), 'ignored')
+
+        registry = ChunkIndexRegistry(self.temp_dir)
+        with patch('libraries.tools.ts_v2_utils.get_url') as mock_get_url:
+            self.assertEqual(self.chunks, registry.get_chunks('gen'))
+            self.assertEqual('01', pad_to_match(1, registry.get('exo')))
+            self.assertFalse(mock_get_url.called)
@@ -0,0 +1,64 @@
+# coding=utf-8
+import threading
+import time
+from unittest import TestCase
+from libraries.tools.disk_budget import DiskBudget
+
+
+class TestDiskBudget(TestCase):
+
+    def test_reserve(self):
+        budget = DiskBudget(100)
+        with budget.reserve(60):
+            with budget.reserve(40):
+                self.assertEqual(100, budget.reserved)
+        self.assertEqual(0, budget.reserved)
+        self.assertEqual(100, budget.peak)
+
+    def test_waits_for_release(self):
+        budget = DiskBudget(100)
+        budget.acquire(80)
+        acquired = threading.Event()
+
+        def worker():
+            budget.acquire(30)
+            acquired.set()
+
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        budget.release(80)
+        self.assertTrue(acquired.wait(1))
+        self.assertEqual(30, budget.reserved)
+        self.assertEqual(80, budget.peak)
+
+    def test_oversized_reservation(self):
+        budget = DiskBudget(100)
+        # a reservation larger than the budget does not wait if nothing else is reserved
+        with budget.reserve(500):
+            self.assertEqual(500, budget.reserved)
+        self.assertEqual(0, budget.reserved)
+
+    def test_concurrent_workers(self):
+        budget = DiskBudget(100)
+        active = []
+        peak = [0]
+        lock = threading.Lock()
+
+        def worker():
+            with budget.reserve(40):
+                with lock:
+                    active.append(1)
+                    peak[0] = max(peak[0], len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, peak[0])
+        self.assertEqual(0, budget.reserved)
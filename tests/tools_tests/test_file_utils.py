@@ -0,0 +1,55 @@
+# coding=utf-8
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from libraries.tools.file_utils import write_file, write_json_file
+
+
+class TestFileUtils(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_file_utils_')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _assert_json_file_matches(self, data, separators=None):
+        expected_path = os.path.join(self.temp_dir, 'expected.json')
+        path = os.path.join(self.temp_dir, 'streamed.json')
+        write_file(expected_path, json.dumps(data, sort_keys=True, separators=separators))
+        md5, size = write_json_file(path, data, separators=separators, block_size=4)
+
+        with open(expected_path, 'rb') as f:
+            expected = f.read()
+        with open(path, 'rb') as f:
+            self.assertEqual(expected, f.read())
+        self.assertEqual(hashlib.md5(expected).hexdigest(), md5)
+        self.assertEqual(len(expected), size)
+
+    def test_write_json_file(self):
+        data = {
+            'languages': [{
+                'identifier': u'ru',
+                'title': u'Русский',
+                'resources': [{'identifier': 'ulb', 'checking': {'level': '3'}, 'formats': []}]
+            }, {
+                'identifier': 'en',
+                'title': 'English',
+                'direction': None,
+                'modified': 20170101,
+                'version': 1.5,
+                'published': True
+            }],
+            'catalogs': []
+        }
+        self._assert_json_file_matches(data)
+        self._assert_json_file_matches(data, separators=(',', ':'))
+
+    def test_write_json_file_empty(self):
+        self._assert_json_file_matches({})
+        self._assert_json_file_matches([])
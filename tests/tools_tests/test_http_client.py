@@ -0,0 +1,257 @@
+# coding=utf-8
+import gzip
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import urllib2
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+from unittest import TestCase
+from mock import patch
+from libraries.tools import url_utils
+from libraries.tools.http_client import HttpClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def _respond(self, send_body):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        headers = {}
+        body = b'hello world'
+        status = 200
+        if self.path.startswith('/moved'):
+            status = 301
+            headers['Location'] = '/file.txt'
+            body = b''
+        elif self.path.startswith('/missing'):
+            status = 404
+            body = b''
+        elif self.path.startswith('/flaky') and self.server.failures > 0:
+            self.server.failures -= 1
+            status = 503
+            body = b''
+        elif self.path.startswith('/tagged'):
+            headers['ETag'] = '"v1"'
+            if self.headers.get('If-None-Match') == '"v1"':
+                status = 304
+                body = b''
+        elif self.path.startswith('/gzip') and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            out = StringIO()
+            with gzip.GzipFile(fileobj=out, mode='wb') as f:
+                f.write(body)
+            body = out.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        elif self.headers.get('Range') and not self.path.startswith('/norange'):
+            start, end = [int(x) for x in self.headers['Range'][len('bytes='):].split('-')]
+            if start >= len(body):
+                status = 416
+                headers['Content-Range'] = 'bytes */{}'.format(len(body))
+                body = b''
+            else:
+                status = 206
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, min(end, len(body) - 1), len(body))
+                body = body[start:end + 1]
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body and status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.requests = []
+        self.connections = 0
+        self.failures = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+
+class TestHttpClient(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_http_client_')
+        self.server = _Server()
+        self.host = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.sleeps = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _client(self, **kwargs):
+        return HttpClient(sleep=self.sleeps.append, **kwargs)
+
+    def test_connections_are_reused(self):
+        client = self._client()
+        for i in range(20):
+            self.assertEqual(b'hello world', client.get('{}/{}.txt'.format(self.host, i)).read())
+        self.assertEqual(20, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(1, client.connects)
+
+    def test_unread_response_is_not_reused(self):
+        client = self._client()
+        client.get(self.host + '/a.txt').close()
+        client.get(self.host + '/b.txt').read()
+        self.assertEqual(2, self.server.connections)
+
+    def test_closed_connection_is_replaced(self):
+        client = self._client()
+        client.get(self.host + '/a.txt').read()
+        for idle in client._connections.values():
+            for conn in idle:
+                conn.sock.close()
+        self.assertEqual(b'hello world', client.get(self.host + '/b.txt').read())
+        self.assertEqual([], self.sleeps)
+
+    def test_gzip(self):
+        client = self._client()
+        self.assertEqual(b'hello world', client.get(self.host + '/gzip.txt').read())
+        self.assertEqual('gzip', self.server.requests[0][2]['accept-encoding'])
+
+    def test_conditional_get(self):
+        client = self._client(cache_dir=os.path.join(self.temp_dir, 'cache'))
+        url = self.host + '/tagged.txt'
+        self.assertEqual(b'hello world', client.get(url).read())
+        response = client.get(url)
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'hello world', response.read())
+        self.assertEqual(1, client.cache_hits)
+        self.assertNotIn('if-none-match', self.server.requests[0][2])
+        self.assertEqual('"v1"', self.server.requests[1][2]['if-none-match'])
+
+        # the cache is re-used by new clients
+        client = self._client(cache_dir=os.path.join(self.temp_dir, 'cache'))
+        self.assertEqual(b'hello world', client.get(url).read())
+        self.assertEqual(1, client.cache_hits)
+
+    def test_cache_dir_is_removed(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        client = self._client(cache_dir=cache_dir)
+        url = self.host + '/tagged.txt'
+        self.assertEqual(b'hello world', client.get(url).read())
+
+        # lambda handlers wipe the temp directory between runs on a warm container
+        shutil.rmtree(cache_dir)
+        self.assertEqual(b'hello world', client.get(url).read())
+        self.assertEqual(0, client.cache_hits)
+        self.assertEqual(b'hello world', client.get(url).read())
+        self.assertEqual(1, client.cache_hits)
+
+    def test_cache_errors_are_ignored(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        client = self._client(cache_dir=cache_dir)
+        shutil.rmtree(cache_dir)
+        # the cache directory cannot be created again
+        with open(cache_dir, 'w') as f:
+            f.write('not a directory')
+        url = self.host + '/tagged.txt'
+        self.assertEqual(b'hello world', client.get(url).read())
+        self.assertEqual(b'hello world', client.get(url).read())
+        self.assertEqual(0, client.cache_hits)
+
+    def test_incomplete_response_is_not_cached(self):
+        client = self._client(cache_dir=os.path.join(self.temp_dir, 'cache'))
+        url = self.host + '/tagged.txt'
+        client.get(url).close()
+        client.get(url).read()
+        self.assertEqual(0, client.cache_hits)
+
+    def test_retry(self):
+        self.server.failures = 2
+        client = self._client(retries=3, backoff=0.5)
+        self.assertEqual(b'hello world', client.get(self.host + '/flaky.txt').read())
+        self.assertEqual([0.5, 1.0], self.sleeps)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_retries_exhausted(self):
+        self.server.failures = 5
+        client = self._client(retries=2)
+        with self.assertRaises(urllib2.HTTPError) as context:
+            client.get(self.host + '/flaky.txt')
+        self.assertEqual(503, context.exception.code)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_connection_error(self):
+        # find a port nothing is listening on
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        client = self._client(retries=1)
+        with self.assertRaises(urllib2.URLError):
+            client.get('http://127.0.0.1:{}/file.txt'.format(port))
+        self.assertEqual([0.5], self.sleeps)
+
+    def test_missing(self):
+        client = self._client()
+        with self.assertRaises(urllib2.HTTPError) as context:
+            client.get(self.host + '/missing.txt')
+        self.assertEqual(404, context.exception.code)
+        self.assertEqual([], self.sleeps)
+
+    def test_redirects(self):
+        client = self._client()
+        response = client.get(self.host + '/moved.txt')
+        self.assertEqual(self.host + '/file.txt', response.url)
+        self.assertEqual(b'hello world', response.read())
+        self.assertEqual(301, client.head(self.host + '/moved.txt').status)
+        self.assertEqual(200, client.head(self.host + '/moved.txt', follow_redirects=True).status)
+
+    def test_get_range(self):
+        client = self._client()
+        self.assertEqual((b'world', 11), client.get_range(self.host + '/file.txt', 6, 20))
+        self.assertEqual((b'', 11), client.get_range(self.host + '/file.txt', 20, 30))
+        self.assertEqual('identity', self.server.requests[0][2]['accept-encoding'])
+        with self.assertRaises(urllib2.URLError):
+            client.get_range(self.host + '/norange.txt', 0, 0)
+        with self.assertRaises(urllib2.HTTPError):
+            client.get_range(self.host + '/missing.txt', 0, 0)
+
+    def test_url_utils(self):
+        client = self._client(cache_dir=os.path.join(self.temp_dir, 'cache'))
+        with patch('libraries.tools.url_utils._client', client):
+            self.assertEqual('hello world', url_utils.get_url(self.host + '/file.txt'))
+            self.assertFalse(url_utils.get_url(self.host + '/missing.txt', True))
+            self.assertTrue(url_utils.url_exists(self.host + '/moved.txt'))
+            self.assertFalse(url_utils.url_exists(self.host + '/missing.txt'))
+            self.assertEqual('11', url_utils.url_headers(self.host + '/file.txt').get('content-length'))
+
+            outfile = os.path.join(self.temp_dir, 'file.txt')
+            url_utils.download_file(self.host + '/tagged.txt', outfile)
+            digest = url_utils.download_file(self.host + '/tagged.txt', outfile)
+            with open(outfile, 'rb') as f:
+                self.assertEqual(b'hello world', f.read())
+        self.assertEqual(11, digest.size)
+        self.assertEqual(hashlib.md5(b'hello world').hexdigest(), digest.md5)
+        self.assertEqual(hashlib.sha384(b'hello world').digest(), digest.sha384)
+        self.assertEqual(1, client.cache_hits)
+        self.assertEqual(1, self.server.connections)
@@ -0,0 +1,85 @@
+# coding=utf-8
+import os
+import urllib2
+from unittest import TestCase
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4
+from libraries.tools.media_prober import MediaProber, RangeReader
+
+
+class LocalRangeClient(object):
+    """
+    Serves range requests from local files
+    """
+
+    def __init__(self, root, host='https://cdn.door43.org/'):
+        self.root = root
+        self.host = host
+        self.ranges = []
+
+    def get_range(self, url, start, end):
+        path = os.path.join(self.root, url[len(self.host):])
+        if not os.path.isfile(path):
+            raise urllib2.HTTPError(url, 404, 'Not Found', {}, None)
+        self.ranges.append((start, end))
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start + 1), os.path.getsize(path)
+
+    @property
+    def downloaded(self):
+        return sum(end - start + 1 for start, end in self.ranges)
+
+
+class TestMediaProber(TestCase):
+
+    def setUp(self):
+        self.resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'signing',
+                                          'resources', 'cdn')
+        self.media_dir = os.path.join(self.resources_dir, 'en', 'obs', 'v4')
+        self.client = LocalRangeClient(self.resources_dir)
+
+    def test_reader(self):
+        path = os.path.join(self.media_dir, '64kbps', 'en_obs_64kbps.zip')
+        with open(path, 'rb') as f:
+            expected = f.read()
+        reader = RangeReader(self.client, 'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_64kbps.zip', block_size=1000)
+        self.assertEqual(len(expected), reader.size)
+        self.assertEqual(expected[:10], reader.read(10))
+        reader.seek(-500, 2)
+        self.assertEqual(expected[-500:], reader.read())
+        self.assertEqual(b'', reader.read(10))
+        reader.seek(1990)
+        self.assertEqual(expected[1990:5010], reader.read(3020))
+        self.assertEqual(5010, reader.tell())
+        reader.seek(-10, 1)
+        self.assertEqual(expected[5000:5010], reader.read(10))
+        # the missing blocks 1 to 5 were requested together
+        self.assertEqual([(0, 999), (11000, 12999), (1000, 5999)], self.client.ranges)
+
+    def test_probe_mp3(self):
+        path = os.path.join(self.media_dir, '64kbps', 'en_obs_01_64kbps.mp3')
+        info = MediaProber(self.client, block_size=1024).probe(
+            'https://cdn.door43.org/en/obs/v4/64kbps/en_obs_01_64kbps.mp3')
+        self.assertEqual({'size': os.path.getsize(path), 'length': MP3(path).info.length}, info)
+        self.assertTrue(self.client.downloaded < os.path.getsize(path))
+
+    def test_probe_mp4(self):
+        path = os.path.join(self.media_dir, '320p', 'en_obs_02_320p.mp4')
+        info = MediaProber(self.client, block_size=1024).probe(
+            'https://cdn.door43.org/en/obs/v4/320p/en_obs_02_320p.mp4')
+        self.assertEqual({'size': os.path.getsize(path), 'length': MP4(path).info.length}, info)
+        # the media data is skipped
+        self.assertTrue(self.client.downloaded < os.path.getsize(path) / 2)
+
+    def test_probe_size(self):
+        path = os.path.join(self.media_dir, '64kbps', 'en_obs_01_64kbps.mp3')
+        prober = MediaProber(self.client)
+        self.assertEqual({'size': os.path.getsize(path)},
+                         prober.probe('https://cdn.door43.org/en/obs/v4/64kbps/en_obs_01_64kbps.mp3', length=False))
+        self.assertEqual({'size': 12032}, prober.probe('https://cdn.door43.org/en/obs/v4/64kbps/en_obs_64kbps.zip'))
+        self.assertEqual([(0, 0), (0, 0)], self.client.ranges)
+
+    def test_probe_missing(self):
+        with self.assertRaises(urllib2.HTTPError):
+            MediaProber(self.client).probe('https://cdn.door43.org/en/obs/v4/64kbps/missing.mp3')
@@ -0,0 +1,132 @@
+# coding=utf-8
+import os
+import threading
+import time
+from unittest import TestCase
+from libraries.tools.process_utils import imap_processes
+
+# workers import the function by name so these must be defined at the module level
+
+
+def slow_square(n):
+    # finish later items first
+    time.sleep((3 - n) * 0.1)
+    return n * n
+
+
+def get_pid(n):
+    return os.getpid()
+
+
+def fail_on_first(n):
+    if n == 0:
+        raise ValueError('bad item')
+    time.sleep(0.05)
+    return n
+
+
+def crash(n):
+    os._exit(3)
+
+
+def hang_on_first(n):
+    if n == 0:
+        time.sleep(60)
+    return n
+
+
+shared_lock = threading.Lock()
+
+
+def use_shared_lock(n):
+    with shared_lock:
+        return n
+
+
+def noisy(n):
+    print('printed output should not be mistaken for the result')
+    return n
+
+
+class TestProcessUtils(TestCase):
+
+    def test_results_are_yielded_as_they_finish(self):
+        results = list(imap_processes(slow_square, range(4), max_workers=4))
+        self.assertEqual([(3, 9), (2, 4), (1, 1), (0, 0)], results)
+
+    def test_items_run_in_other_processes(self):
+        pids = [pid for n, pid in imap_processes(get_pid, range(4), max_workers=2)]
+        self.assertEqual(4, len(pids))
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_serial(self):
+        pids = [pid for n, pid in imap_processes(get_pid, range(3), max_workers=1)]
+        self.assertEqual([os.getpid()] * 3, pids)
+
+    def test_empty(self):
+        self.assertEqual([], list(imap_processes(get_pid, [], max_workers=4)))
+
+    def test_error_is_raised(self):
+        results = []
+        with self.assertRaises(Exception) as context:
+            for n, result in imap_processes(fail_on_first, range(20), max_workers=2):
+                results.append(result)
+        self.assertIn('bad item', str(context.exception))
+        # no new items should be started once an item fails
+        self.assertTrue(len(results) < 19)
+
+    def test_crashed_process(self):
+        with self.assertRaises(Exception) as context:
+            list(imap_processes(crash, range(2), max_workers=2))
+        self.assertIn('exited with code 3', str(context.exception))
+
+    def test_printed_output(self):
+        self.assertEqual([0, 1], sorted(n for n, result in imap_processes(noisy, range(2), max_workers=2)))
+
+    def test_timeout(self):
+        start = time.time()
+        results = []
+        with self.assertRaises(Exception) as context:
+            for n, result in imap_processes(hang_on_first, range(2), max_workers=2, timeout=2):
+                results.append(result)
+        self.assertIn('timed out after 2 seconds', str(context.exception))
+        self.assertEqual([1], results)
+        self.assertTrue(time.time() - start < 30)
+
+    def test_single_item_timeout(self):
+        with self.assertRaises(Exception) as context:
+            list(imap_processes(hang_on_first, [0], max_workers=4, timeout=1))
+        self.assertIn('timed out after 1 seconds', str(context.exception))
+
+    def test_serial_timeout(self):
+        results = []
+        with self.assertRaises(Exception) as context:
+            for n, result in imap_processes(hang_on_first, [1, 0, 2], max_workers=1, timeout=1):
+                results.append(result)
+        self.assertIn('timed out after 1 seconds', str(context.exception))
+        self.assertEqual([1], results)
+
+    def test_serial_with_timeout_runs_in_other_processes(self):
+        pids = [pid for n, pid in imap_processes(get_pid, range(2), max_workers=1, timeout=30)]
+        self.assertEqual(2, len(pids))
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_while_other_threads_hold_locks(self):
+        # a forked worker would inherit the lock while it is held and hang on it
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with shared_lock:
+                held.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait()
+        try:
+            results = list(imap_processes(use_shared_lock, range(2), max_workers=2, timeout=10))
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual([0, 1], sorted(n for n, result in results))
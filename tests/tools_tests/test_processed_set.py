@@ -0,0 +1,65 @@
+# coding=utf-8
+import json
+from unittest import TestCase
+from libraries.tools.mocks import MockDynamodbHandler
+from libraries.tools.processed_set import pack_processed, unpack_processed, save_processed, load_processed, is_shard
+
+
+class TestProcessedSet(TestCase):
+
+    def setUp(self):
+        self.db = MockDynamodbHandler()
+        self.keys = {'api_version': 'ts.2'}
+        self.processed = {}
+        for lid in range(300):
+            for pid in ['gen', 'exo', 'lev', 'num', 'deu', 'mat', 'mrk', 'luk', 'jhn', 'act']:
+                self.processed['lang{}_ulb_{}'.format(lid, pid)] = []
+                self.processed['lang{}_*_{}_tn'.format(lid, pid)] = ['lang{}_*_{}_tn'.format(lid, pid)]
+
+    def test_pack(self):
+        packed = pack_processed(self.processed)
+        self.assertEqual(self.processed, unpack_processed(packed))
+        # compressed to a fraction of the plain json
+        self.assertTrue(len(packed) * 5 < len(json.dumps(self.processed)))
+
+    def test_unpack_legacy(self):
+        self.assertEqual({'en_ulb_gen': []}, unpack_processed({'en_ulb_gen': []}))
+        self.assertEqual({}, unpack_processed(None))
+        self.assertEqual({}, unpack_processed(pack_processed({})))
+
+    def test_save_and_load(self):
+        status = {'api_version': 'ts.2', 'state': 'in-progress', 'processed': self.processed}
+        record = save_processed(self.db, self.keys, status)
+        self.assertEqual(0, record['processed_shards'])
+        self.db.update_item(self.keys, record)
+        self.assertEqual(1, len(self.db.query_items()))
+        # the status is not changed
+        self.assertIs(self.processed, status['processed'])
+
+        self.assertEqual(self.processed, load_processed(self.db, self.keys, self.db.get_item(self.keys)))
+
+    def test_sharded(self):
+        status = {'api_version': 'ts.2', 'state': 'in-progress', 'processed': self.processed}
+        record = save_processed(self.db, self.keys, status, max_part_size=1000)
+        self.db.update_item(self.keys, record)
+        shards = [r for r in self.db.query_items() if is_shard(r)]
+        self.assertEqual(record['processed_shards'], len(shards))
+        self.assertTrue(len(shards) > 1)
+        self.assertEqual('ts.2.processed.1', self.db.get_item({'api_version': 'ts.2.processed.1'})['api_version'])
+        self.assertFalse(is_shard(self.db.get_item(self.keys)))
+
+        self.assertEqual(self.processed, load_processed(self.db, self.keys, self.db.get_item(self.keys)))
+
+        # shrinking leaves the unused shards behind but they are ignored
+        status['processed'] = {'en_ulb_gen': []}
+        self.db.update_item(self.keys, save_processed(self.db, self.keys, status, max_part_size=1000))
+        self.assertEqual({'en_ulb_gen': []}, load_processed(self.db, self.keys, self.db.get_item(self.keys)))
+
+    def test_load_legacy(self):
+        self.assertEqual({'en_ulb_gen': []}, load_processed(self.db, self.keys, {'processed': {'en_ulb_gen': []}}))
+
+    def test_load_missing_shard(self):
+        status = {'api_version': 'ts.2', 'state': 'in-progress', 'processed': self.processed}
+        record = save_processed(self.db, self.keys, status, max_part_size=1000)
+        self.db.delete_item({'api_version': 'ts.2.processed.1'})
+        self.assertEqual({}, load_processed(self.db, self.keys, record))
@@ -0,0 +1,123 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from libraries.tools.file_utils import download_rc, write_file, read_file
+from libraries.tools.legacy_utils import index_obs
+from libraries.tools.mocks import MockAPI
+from libraries.tools.rc_cache import RCCache
+
+
+class TestRCCache(TestCase):
+    resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_rc_cache_')
+        self.downloads = []
+        self.mock_api = MockAPI(self.resources_dir, 'https://example.com')
+
+    def tearDown(self):
+        # clean up local temp files
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _download(self, url, dest):
+        self.downloads.append(url)
+        self.mock_api.download_file(url, dest)
+
+    def _dir(self, name):
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(path)
+        return path
+
+    def _make_rc(self, name, size):
+        rc_dir = os.path.join(self.temp_dir, 'src', name)
+        write_file(os.path.join(rc_dir, name, 'content.txt'), 'x' * size)
+        return rc_dir
+
+    def test_download_rc_once(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'))
+        url = 'https://example.com/en_obs.zip'
+
+        first_dir = download_rc('en', 'obs', url, self._dir('a'), self._download, '2017-12-01', cache)
+        second_dir = download_rc('en', 'obs', url, self._dir('b'), self._download, '2017-12-01', cache)
+
+        self.assertEqual([url], self.downloads)
+        self.assertEqual(1, cache.hits)
+        self.assertNotEqual(first_dir, second_dir)
+        self.assertEqual(read_file(os.path.join(first_dir, 'manifest.yaml')),
+                         read_file(os.path.join(second_dir, 'manifest.yaml')))
+
+    def test_caller_changes_do_not_leak(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'))
+        url = 'https://example.com/en_obs.zip'
+
+        first_dir = download_rc('en', 'obs', url, self._dir('a'), self._download, '2017-12-01', cache)
+        write_file(os.path.join(first_dir, 'manifest.yaml'), 'changed')
+        shutil.rmtree(os.path.join(first_dir, 'content'))
+
+        second_dir = download_rc('en', 'obs', url, self._dir('b'), self._download, '2017-12-01', cache)
+        self.assertNotEqual('changed', read_file(os.path.join(second_dir, 'manifest.yaml')))
+        self.assertTrue(os.path.isdir(os.path.join(second_dir, 'content')))
+
+    def test_new_version_is_downloaded(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'))
+        url = 'https://example.com/en_obs.zip'
+
+        download_rc('en', 'obs', url, self._dir('a'), self._download, '2017-12-01', cache)
+        download_rc('en', 'obs', url, self._dir('b'), self._download, '2018-01-01', cache)
+        self.assertEqual([url, url], self.downloads)
+
+    def test_no_version_is_not_cached(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'))
+        format = {
+            'format': 'type=book',
+            'url': 'https://example.com/en_obs.zip'
+        }
+
+        index_obs('en', 'obs', format, self._dir('a'), self._download, cache)
+        index_obs('en', 'obs', format, self._dir('b'), self._download, cache)
+        self.assertEqual(2, len(self.downloads))
+        self.assertEqual(0, cache.size)
+
+    def test_index_obs_from_cache(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'))
+        format = {
+            'format': 'type=book',
+            'url': 'https://example.com/en_obs.zip',
+            'modified': '2017-12-01'
+        }
+
+        first = index_obs('en', 'obs', format, self._dir('a'), self._download, cache)
+        second = index_obs('en', 'obs', format, self._dir('b'), self._download, cache)
+        self.assertEqual(1, len(self.downloads))
+        self.assertEqual(first, second)
+
+    def test_lru_eviction(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'), max_bytes=250)
+        cache.store('https://example.com/a.zip', '1', self._make_rc('a', 100))
+        cache.store('https://example.com/b.zip', '1', self._make_rc('b', 100))
+
+        # touch a so that b is the least recently used
+        self.assertTrue(cache.checkout('https://example.com/a.zip', '1', os.path.join(self.temp_dir, 'out_a')))
+        cache.store('https://example.com/c.zip', '1', self._make_rc('c', 100))
+
+        self.assertEqual(200, cache.size)
+        self.assertFalse(cache.checkout('https://example.com/b.zip', '1', os.path.join(self.temp_dir, 'out_b')))
+        self.assertTrue(cache.checkout('https://example.com/a.zip', '1', os.path.join(self.temp_dir, 'out_a')))
+        self.assertTrue(cache.checkout('https://example.com/c.zip', '1', os.path.join(self.temp_dir, 'out_c')))
+
+    def test_skip_oversized_entries(self):
+        cache = RCCache(os.path.join(self.temp_dir, 'cache'), max_bytes=50)
+        self.assertFalse(cache.store('https://example.com/a.zip', '1', self._make_rc('a', 100)))
+        self.assertEqual(0, cache.size)
+
+    def test_reuse_existing_entries(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        RCCache(cache_dir).store('https://example.com/a.zip', '1', self._make_rc('a', 100))
+
+        cache = RCCache(cache_dir)
+        self.assertEqual(100, cache.size)
+        self.assertTrue(cache.checkout('https://example.com/a.zip', '1', os.path.join(self.temp_dir, 'out')))
+        self.assertEqual('x' * 100, read_file(os.path.join(self.temp_dir, 'out', 'a', 'content.txt')))
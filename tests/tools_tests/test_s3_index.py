@@ -0,0 +1,170 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from libraries.tools.consistency_checker import ConsistencyChecker
+from libraries.tools.file_utils import write_file
+from libraries.tools.mocks import MockS3Handler
+from libraries.tools.s3_index import S3Index
+
+
+def _list_mock(s3_handler, prefix=''):
+    return s3_handler.list_objects(prefix)
+
+
+class FakeURLChecker(object):
+
+    def __init__(self):
+        self.urls = []
+
+    def check(self, urls):
+        self.urls.extend(urls)
+        return dict((url, True) for url in urls)
+
+
+class TestS3Index(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_s3_index_')
+        self.s3 = MockS3Handler()
+        for key in ['en/ulb/v7/gen.usfm', 'en/ulb/v7/gen.usfm.sig', 'en/obs/v4/obs.zip', 'fr/ulb/v1/gen.usfm']:
+            path = os.path.join(self.temp_dir, 'upload')
+            write_file(path, key)
+            self.s3.upload_file(path, key)
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_lists_each_prefix_once(self):
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=_list_mock)
+        self.assertTrue(index.exists('en/ulb/v7/gen.usfm'))
+        self.assertTrue(index.exists('en/ulb/v7/gen.usfm.sig'))
+        self.assertFalse(index.exists('en/ulb/v7/exo.usfm'))
+        self.assertEqual(1, index.listings)
+
+        self.assertTrue(index.exists('en/obs/v4/obs.zip'))
+        self.assertEqual(2, index.listings)
+        self.assertEqual(len('en/ulb/v7/gen.usfm'), index.get('en/ulb/v7/gen.usfm')['size'])
+
+    def test_refresh_whole_bucket(self):
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=_list_mock)
+        index.refresh()
+        self.assertTrue(index.exists('fr/ulb/v1/gen.usfm'))
+        self.assertTrue(index.exists('en/obs/v4/obs.zip'))
+        self.assertEqual(1, index.listings)
+
+    def test_url_exists(self):
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=_list_mock)
+        self.assertTrue(index.url_exists('https://cdn.door43.org/en/ulb/v7/gen.usfm'))
+        self.assertFalse(index.url_exists('https://cdn.door43.org/en/ulb/v7/exo.usfm'))
+        self.assertIsNone(index.url_exists('https://example.com/en/ulb/v7/gen.usfm'))
+
+    def test_url_is_unquoted(self):
+        path = os.path.join(self.temp_dir, 'upload')
+        self.s3.upload_file(path, 'en/ulb/v7/my file.usfm')
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=_list_mock)
+        url = 'https://cdn.door43.org/en/ulb/v7/my%20file.usfm'
+        self.assertEqual('en/ulb/v7/my file.usfm', index.key_from_url(url))
+        self.assertTrue(index.url_exists(url))
+
+    def test_lookups_are_not_blocked_by_listing(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_list(s3_handler, prefix=''):
+            if prefix == 'fr/ulb/':
+                started.set()
+                release.wait()
+            return _list_mock(s3_handler, prefix)
+
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=slow_list)
+        index.refresh('en/ulb/')
+        results = {}
+
+        def lookup(key):
+            results[key] = index.exists(key)
+
+        threads = [threading.Thread(target=lookup, args=('fr/ulb/v1/gen.usfm',)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        try:
+            # answered while fr/ulb/ is still being listed
+            self.assertTrue(index.exists('en/ulb/v7/gen.usfm'))
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual({'fr/ulb/v1/gen.usfm': True}, results)
+        # the waiting threads used the listing of the first one
+        self.assertEqual(2, index.listings)
+
+    def test_failed_listing_is_retried(self):
+        calls = []
+
+        def flaky_list(s3_handler, prefix=''):
+            calls.append(prefix)
+            if len(calls) == 1:
+                raise Exception('listing failed')
+            return _list_mock(s3_handler, prefix)
+
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=flaky_list)
+        with self.assertRaises(Exception):
+            index.exists('en/ulb/v7/gen.usfm')
+        self.assertTrue(index.exists('en/ulb/v7/gen.usfm'))
+        self.assertEqual(['en/ulb/', 'en/ulb/'], calls)
+
+    def test_expired_prefixes_are_listed_again(self):
+        index = S3Index(self.s3, ['cdn.door43.org'], max_age=0, list_handler=_list_mock)
+        index.exists('en/ulb/v7/gen.usfm')
+        index.exists('en/ulb/v7/gen.usfm')
+        self.assertEqual(2, index.listings)
+
+    def test_add(self):
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=_list_mock)
+        self.assertFalse(index.exists('en/ulb/v7/exo.usfm'))
+        index.add('en/ulb/v7/exo.usfm', 10)
+        self.assertTrue(index.exists('en/ulb/v7/exo.usfm'))
+        self.assertEqual(1, index.listings)
+
+    def test_saved_between_runs(self):
+        path = os.path.join(self.temp_dir, 'index.json')
+        index = S3Index(self.s3, ['cdn.door43.org'], path=path, list_handler=_list_mock)
+        index.exists('en/obs/v4/obs.zip')
+        index.exists('en/ulb/v7/gen.usfm')
+        # nothing is written until the end of the run
+        self.assertFalse(os.path.isfile(path))
+        index.save()
+        self.assertTrue(os.path.isfile(path))
+
+        index = S3Index(self.s3, ['cdn.door43.org'], path=path, list_handler=_list_mock)
+        self.assertTrue(index.exists('en/ulb/v7/gen.usfm'))
+        self.assertEqual(0, index.listings)
+
+    def test_consistency_checker_uses_index(self):
+        url_checker = FakeURLChecker()
+        index = S3Index(self.s3, ['cdn.door43.org'], list_handler=_list_mock)
+        checker = ConsistencyChecker('cdn.door43.org', 'api.door43.org', quiet=True, url_checker=url_checker,
+                                     s3_index=index)
+        errors = checker.check_format({
+            'format': '',
+            'modified': '',
+            'size': '',
+            'url': 'https://cdn.door43.org/en/ulb/v7/gen.usfm',
+            'signature': 'https://cdn.door43.org/en/ulb/v7/gen.usfm.sig',
+            'chapters': [{
+                'size': 0,
+                'length': 0,
+                'modified': '',
+                'identifier': '',
+                'url': 'https://api.door43.org/en/ulb/v7/gen.html',
+                'signature': 'https://cdn.door43.org/en/ulb/v7/gen.html.sig'
+            }]
+        }, {'repo_name': 'en_ulb'})
+
+        self.assertEqual(["Consistency Check Failed: en_ulb: url 'https://api.door43.org/en/ulb/v7/gen.html' "
+                          "has not been signed yet"], errors)
+        self.assertEqual(['https://api.door43.org/en/ulb/v7/gen.html'], url_checker.urls)
@@ -0,0 +1,151 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from libraries.tools.mocks import MockDynamodbHandler
+from libraries.tools.processed_set import unpack_processed, load_processed
+from libraries.tools.status_checkpoint import StatusCheckpoint
+from libraries.tools.upload_queue import UploadQueue
+
+
+class CountingDynamodbHandler(MockDynamodbHandler):
+
+    def __init__(self):
+        super(CountingDynamodbHandler, self).__init__()
+        self.updates = []
+
+    def update_item(self, record_keys, row):
+        self.updates.append(dict(row, processed=unpack_processed(row['processed'])))
+        return super(CountingDynamodbHandler, self).update_item(record_keys, dict(row))
+
+
+class TestStatusCheckpoint(TestCase):
+
+    def setUp(self):
+        self.db = CountingDynamodbHandler()
+        self.keys = {'api_version': 'ts.2'}
+        self.status = {
+            'api_version': 'ts.2',
+            'source_timestamp': '2018-01-01',
+            'state': 'in-progress',
+            'processed': {}
+        }
+        self.now = [0]
+
+    def _checkpoint(self, **kwargs):
+        return StatusCheckpoint(self.db, self.keys, self.status, clock=lambda: self.now[0], **kwargs)
+
+    def test_writes_are_coalesced(self):
+        checkpoint = self._checkpoint(max_pending=10)
+        for i in range(25):
+            checkpoint.mark_processed({'en_ulb_{}'.format(i): []})
+        self.assertEqual(2, len(self.db.updates))
+        self.assertEqual(20, len(self.db.updates[-1]['processed']))
+        self.assertTrue(checkpoint.is_processed('en_ulb_24'))
+
+        checkpoint.flush()
+        self.assertEqual(3, len(self.db.updates))
+        self.assertEqual(25, len(load_processed(self.db, self.keys, self.db.get_item(self.keys))))
+
+        # nothing is pending
+        checkpoint.flush()
+        self.assertEqual(3, checkpoint.writes)
+
+    def test_writes_when_old(self):
+        checkpoint = self._checkpoint(max_age=60)
+        checkpoint.mark_processed({'en_ulb_gen': ['en_*_gen_ulb']})
+        self.assertEqual(0, len(self.db.updates))
+        self.now[0] = 61
+        checkpoint.mark_processed({'en_ulb_exo': []})
+        self.assertEqual(1, len(self.db.updates))
+        self.assertEqual(['en_*_gen_ulb'], checkpoint.get_processed('en_ulb_gen'))
+
+    def test_writes_every_process_when_lambda_is_ending(self):
+        remaining = [300]
+        checkpoint = self._checkpoint(min_sec_remaining=60, sec_remaining=lambda: remaining[0])
+        checkpoint.mark_processed({'en_ulb_gen': []})
+        self.assertEqual(0, len(self.db.updates))
+        remaining[0] = 30
+        checkpoint.mark_processed({'en_ulb_exo': []})
+        checkpoint.mark_processed({'en_ulb_lev': []})
+        self.assertEqual(2, len(self.db.updates))
+
+    def test_no_time_limit(self):
+        checkpoint = self._checkpoint(sec_remaining=lambda: None)
+        checkpoint.mark_processed({'en_ulb_gen': []})
+        self.assertEqual(0, len(self.db.updates))
+
+    def test_before_write(self):
+        flushed = []
+        checkpoint = self._checkpoint(max_pending=2, before_write=lambda: flushed.append(len(self.db.updates)))
+        checkpoint.mark_processed({'en_ulb_gen': []})
+        self.assertEqual([], flushed)
+        checkpoint.mark_processed({'en_ulb_exo': []})
+        self.assertEqual([0], flushed)
+
+    def test_failed_before_write_forgets_unsaved(self):
+        def fail():
+            raise IOError('s3 down')
+
+        checkpoint = self._checkpoint(max_pending=5)
+        checkpoint.mark_processed({'en_ulb_gen': []})
+        checkpoint.save()
+        checkpoint.before_write = fail
+        checkpoint.mark_processed({'en_ulb_exo': []})
+        with self.assertRaises(IOError):
+            checkpoint.save()
+        self.assertFalse(checkpoint.is_processed('en_ulb_exo'))
+        self.assertTrue(checkpoint.is_processed('en_ulb_gen'))
+
+        # nothing is left to be written by the error handling
+        checkpoint.before_write = None
+        checkpoint.flush()
+        self.assertEqual(1, len(self.db.updates))
+
+    def test_failed_upload_is_not_recorded(self):
+        temp_dir = tempfile.mkdtemp(prefix='test_status_checkpoint_')
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        path = os.path.join(temp_dir, 'gen.json')
+        with open(path, 'w') as f:
+            f.write('{}')
+
+        class FailingS3Handler(object):
+            def upload_file(self, path, key):
+                raise IOError('s3 down')
+
+        uploads = UploadQueue(FailingS3Handler())
+        checkpoint = self._checkpoint(max_pending=5, before_write=uploads.wait_all)
+        uploads.put(path, 'en_ulb_gen.json')
+        checkpoint.mark_processed({'en_ulb_gen': []})
+        # the thread that queued the upload sees the error first
+        with self.assertRaises(IOError):
+            uploads.flush()
+        # the error handling then tries to save the progress
+        with self.assertRaises(IOError):
+            checkpoint.flush()
+        checkpoint.flush()
+        self.assertEqual(0, len(self.db.updates))
+        self.assertFalse(checkpoint.is_processed('en_ulb_gen'))
+
+    def test_aborted(self):
+        self.db.insert_item(dict(self.status, state='aborted', processed={}))
+        checkpoint = self._checkpoint(max_pending=1, check_abort=True)
+        with self.assertRaises(Exception) as context:
+            checkpoint.mark_processed({'en_ulb_gen': []})
+        self.assertIn('aborted', str(context.exception))
+        self.assertEqual(0, len(self.db.updates))
+        self.assertEqual(1, checkpoint.reads)
+
+    def test_aborted_earlier_build(self):
+        self.db.insert_item(dict(self.status, state='aborted', source_timestamp='2017-01-01', processed={}))
+        checkpoint = self._checkpoint(check_abort=True)
+        checkpoint.save()
+        self.assertEqual('in-progress', self.db.get_item(self.keys)['state'])
+
+    def test_abort_is_not_checked_by_default(self):
+        self.db.insert_item(dict(self.status, state='aborted', processed={}))
+        checkpoint = self._checkpoint(max_pending=1)
+        checkpoint.mark_processed({'en_ulb_gen': []})
+        self.assertEqual(0, checkpoint.reads)
+        self.assertEqual(1, checkpoint.writes)
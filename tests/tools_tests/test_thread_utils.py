@@ -0,0 +1,61 @@
+# coding=utf-8
+import threading
+import time
+from unittest import TestCase
+from libraries.tools.thread_utils import map_concurrent
+
+
+class TestThreadUtils(TestCase):
+
+    def test_results_keep_input_order(self):
+        def slow_square(n):
+            # finish later items first
+            time.sleep((10 - n) * 0.005)
+            return n * n
+
+        results = map_concurrent(slow_square, range(10), max_workers=4)
+        self.assertEqual([n * n for n in range(10)], results)
+
+    def test_workers_are_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def track(n):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            return n
+
+        map_concurrent(track, range(12), max_workers=3)
+        self.assertTrue(1 < state['peak'] <= 3)
+
+    def test_serial(self):
+        threads = set()
+
+        def record(n):
+            threads.add(threading.current_thread().ident)
+            return n
+
+        self.assertEqual([0, 1, 2], map_concurrent(record, range(3), max_workers=1))
+        self.assertEqual({threading.current_thread().ident}, threads)
+
+    def test_empty(self):
+        self.assertEqual([], map_concurrent(lambda n: n, [], max_workers=4))
+
+    def test_error_is_raised(self):
+        started = []
+
+        def fail_on_first(n):
+            started.append(n)
+            if n == 0:
+                raise ValueError('bad item')
+            time.sleep(0.01)
+            return n
+
+        with self.assertRaises(ValueError):
+            map_concurrent(fail_on_first, range(50), max_workers=2)
+        # no new items should be started once an item fails
+        self.assertTrue(len(started) < 50)
@@ -0,0 +1,194 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from libraries.tools.file_utils import write_file, read_file
+from libraries.tools.mocks import MockS3Handler
+from libraries.tools.upload_queue import UploadQueue, file_md5
+
+
+class SlowS3Handler(MockS3Handler):
+    """
+    Simulates network latency and records the peak number of concurrent uploads
+    """
+
+    def __init__(self, latency=0.02):
+        MockS3Handler.__init__(self)
+        self.latency = latency
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def upload_file(self, path, key, cache_time=600):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.latency)
+        MockS3Handler.upload_file(self, path, key, cache_time)
+        with self.lock:
+            self.running -= 1
+
+
+class FailingS3Handler(MockS3Handler):
+
+    def upload_file(self, path, key, cache_time=600):
+        if key.endswith('bad.json'):
+            raise IOError('upload failed')
+        MockS3Handler.upload_file(self, path, key, cache_time)
+
+
+class TestUploadQueue(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_upload_queue_')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _make_files(self, count):
+        files = []
+        for i in range(count):
+            path = os.path.join(self.temp_dir, '{}.json'.format(i))
+            write_file(path, '{{"id": {}}}'.format(i))
+            files.append(path)
+        return files
+
+    def test_flush_uploads_everything(self):
+        s3 = SlowS3Handler()
+        uploads = UploadQueue(s3, max_workers=4)
+        for path in self._make_files(20):
+            uploads.put(path, 'v2/ts/{}'.format(os.path.basename(path)))
+        stats = uploads.flush()
+
+        self.assertEqual(20, len(s3._recent_uploads))
+        self.assertEqual('{"id": 7}', read_file(s3._recent_uploads['v2/ts/7.json']))
+        self.assertEqual(20, stats['files'])
+        self.assertEqual(0, stats['skipped'])
+        self.assertTrue(stats['bytes'] > 0)
+        self.assertTrue(stats['files_per_second'] > 0)
+        self.assertEqual([stats], uploads.batches)
+
+    def test_uploads_are_concurrent(self):
+        s3 = SlowS3Handler()
+        uploads = UploadQueue(s3, max_workers=4)
+        for path in self._make_files(20):
+            uploads.put(path, os.path.basename(path))
+        uploads.flush()
+        self.assertTrue(1 < s3.peak <= 4)
+
+    def test_skip_unchanged(self):
+        files = self._make_files(3)
+        etags = {
+            '0.json': '"{}"'.format(file_md5(files[0])),
+            '1.json': 'out-of-date'
+        }
+        s3 = MockS3Handler()
+        uploads = UploadQueue(s3, etags=etags)
+        for path in files:
+            uploads.put(path, os.path.basename(path))
+        stats = uploads.flush()
+
+        self.assertEqual(['1.json', '2.json'], sorted(s3._recent_uploads.keys()))
+        self.assertEqual(1, stats['skipped'])
+        self.assertEqual(file_md5(files[2]), etags['2.json'])
+
+        # the manifest is updated so the same content will not be uploaded twice
+        for path in files:
+            uploads.put(path, os.path.basename(path))
+        stats = uploads.flush()
+        self.assertEqual(0, stats['files'])
+        self.assertEqual(3, stats['skipped'])
+
+    def test_flush_raises_upload_errors(self):
+        s3 = FailingS3Handler()
+        uploads = UploadQueue(s3)
+        good, bad = self._make_files(2)
+        uploads.put(good, 'good.json')
+        uploads.put(bad, 'bad.json')
+        with self.assertRaises(IOError):
+            uploads.flush()
+        self.assertIn('good.json', s3._recent_uploads)
+
+        # errors are only reported once
+        self.assertEqual(0, uploads.flush()['files'])
+
+    def test_idle_workers_exit(self):
+        uploads = UploadQueue(MockS3Handler())
+        for path in self._make_files(4):
+            uploads.put(path, os.path.basename(path))
+        uploads.flush()
+        time.sleep(0.1)
+        self.assertEqual(0, uploads._workers)
+
+        # new workers are started for new uploads
+        path = self._make_files(1)[0]
+        uploads.put(path, 'again.json')
+        self.assertEqual(1, uploads.flush()['files'])
+
+    def test_flush_is_per_thread(self):
+        s3 = FailingS3Handler()
+        uploads = UploadQueue(s3, max_workers=2)
+        good, bad = self._make_files(2)
+        results = {}
+
+        def fail():
+            uploads.put(bad, 'bad.json')
+            try:
+                uploads.flush()
+            except IOError as e:
+                results['error'] = e
+
+        uploads.put(good, 'good.json')
+        thread = threading.Thread(target=fail)
+        thread.start()
+        thread.join()
+        self.assertIn('error', results)
+
+        # the failure of the other thread is not reported to this thread
+        stats = uploads.flush()
+        self.assertEqual(1, stats['files'])
+
+        # but it is never forgotten by wait_all
+        with self.assertRaises(IOError):
+            uploads.wait_all()
+        with self.assertRaises(IOError):
+            uploads.wait_all()
+
+    def test_errors_are_not_cleared_by_other_threads(self):
+        s3 = FailingS3Handler()
+        uploads = UploadQueue(s3, max_workers=2)
+        good, bad = self._make_files(2)
+        uploads.put(bad, 'bad.json')
+        flushed = []
+
+        def other():
+            uploads.put(good, 'good.json')
+            flushed.append(uploads.flush())
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        self.assertEqual(1, flushed[0]['files'])
+        with self.assertRaises(IOError):
+            uploads.flush()
+
+    def test_wait_all(self):
+        s3 = SlowS3Handler()
+        uploads = UploadQueue(s3, max_workers=2)
+        paths = self._make_files(6)
+
+        def queue_files(files):
+            for path in files:
+                uploads.put(path, os.path.basename(path))
+
+        threads = [threading.Thread(target=queue_files, args=(paths[i::2],)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        uploads.wait_all()
+        self.assertEqual(6, len(s3._recent_uploads))
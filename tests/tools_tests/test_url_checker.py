@@ -0,0 +1,185 @@
+# coding=utf-8
+import threading
+import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from unittest import TestCase
+from libraries.tools import url_utils
+from libraries.tools.consistency_checker import ConsistencyChecker
+from libraries.tools.http_client import HttpClient
+from libraries.tools.url_checker import URLChecker
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/moved'):
+            self.send_response(301)
+            self.send_header('Location', '/file.txt')
+        elif self.path.startswith('/missing'):
+            self.send_response(404)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.requests = []
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+
+class FakeURLChecker(object):
+
+    def __init__(self, missing=None):
+        self.missing = missing or []
+        self.batches = []
+
+    def exists(self, url):
+        return self.check([url])[url]
+
+    def check(self, urls):
+        self.batches.append(urls)
+        return dict((url, url not in self.missing) for url in urls)
+
+
+class TestURLChecker(TestCase):
+
+    def setUp(self):
+        self.server = _Server()
+        self.host = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = HttpClient()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_check(self):
+        checker = URLChecker(client=self.client)
+        urls = [self.host + path for path in ['/file.txt', '/missing.txt', '/moved.txt', '/file.txt']]
+        self.assertEqual({
+            urls[0]: True,
+            urls[1]: False,
+            urls[2]: True
+        }, checker.check(urls))
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_connections_are_reused(self):
+        checker = URLChecker(max_workers=4, client=self.client)
+        urls = ['{}/{}.txt'.format(self.host, i) for i in range(40)]
+        self.assertTrue(all(checker.check(urls).values()))
+        self.assertEqual(40, len(self.server.requests))
+        self.assertTrue(self.server.connections <= 4)
+
+    def test_results_are_cached(self):
+        checker = URLChecker(ttl=60, client=self.client)
+        url = self.host + '/file.txt'
+        self.assertTrue(checker.exists(url))
+        self.assertTrue(checker.exists(url))
+        self.assertEqual(1, len(self.server.requests))
+
+        checker.clear()
+        self.assertTrue(checker.exists(url))
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_cache_expires(self):
+        checker = URLChecker(ttl=0.05, client=self.client)
+        url = self.host + '/file.txt'
+        checker.exists(url)
+        time.sleep(0.1)
+        checker.exists(url)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_uses_the_client(self):
+        checker = URLChecker(max_workers=1, client=self.client)
+        self.assertTrue(checker.exists(self.host + '/a.txt'))
+        self.assertTrue(checker.exists(self.host + '/b.txt'))
+        self.assertEqual(2, self.client.requests)
+        self.assertEqual(1, self.client.connects)
+
+    def test_query_is_sent(self):
+        checker = URLChecker(client=self.client)
+        self.assertTrue(checker.exists(self.host + '/file.txt?v=1'))
+        self.assertEqual(['/file.txt?v=1'], self.server.requests)
+
+    def test_matches_url_exists(self):
+        checker = URLChecker(ttl=0, client=self.client)
+        for path in ['/file.txt', '/missing.txt', '/moved.txt']:
+            url = self.host + path
+            self.assertEqual(url_utils.url_exists(url, self.client), checker.exists(url))
+
+
+class TestBatchedConsistencyChecks(TestCase):
+
+    def setUp(self):
+        self.format = {
+            'format': '',
+            'modified': '',
+            'size': '',
+            'url': 'https://api.door43.org/file.txt',
+            'signature': 'https://api.door43.org/file.sig',
+            'chapters': [
+                {
+                    'size': 0,
+                    'length': 0,
+                    'modified': '',
+                    'url': 'https://api.door43.org/01.mp3',
+                    'signature': 'https://api.door43.org/01.sig'
+                },
+                {
+                    'size': 0,
+                    'length': 0,
+                    'modified': '',
+                    'identifier': '',
+                    'url': 'https://api.door43.org/02.mp3'
+                }
+            ]
+        }
+        self.row = {'repo_name': 'en_obs'}
+
+    def test_urls_are_checked_in_one_batch(self):
+        url_checker = FakeURLChecker(missing=['https://api.door43.org/file.txt'])
+        checker = ConsistencyChecker('cdn.door43.org', 'api.door43.org', quiet=True, url_checker=url_checker)
+        errors = checker.check_format(self.format, self.row)
+
+        self.assertEqual(1, len(url_checker.batches))
+        self.assertEqual([
+            "Consistency Check Failed: en_obs: url 'https://api.door43.org/file.txt' does not exist",
+            "Consistency Check Failed: Format chapter container for 'en_obs' doesn't have 'identifier'",
+            "Consistency Check Failed: Format chapter container for 'en_obs' doesn't have 'signature'",
+            "Consistency Check Failed: en_obs: url 'https://api.door43.org/02.mp3' has not been signed yet"
+        ], errors)
+
+    def test_prefetch(self):
+        url_checker = FakeURLChecker()
+        checker = ConsistencyChecker('cdn.door43.org', 'api.door43.org', quiet=True, url_checker=url_checker)
+        checker.prefetch({
+            'formats': [self.format],
+            'projects': [{'formats': [{'url': 'https://cdn.door43.org/project.zip'}]},
+                         {'formats': [{'url': 'https://example.com/remote.zip'}]}]
+        })
+        self.assertEqual([[
+            'https://api.door43.org/file.txt',
+            'https://api.door43.org/file.sig',
+            'https://cdn.door43.org/project.zip',
+            'https://api.door43.org/01.mp3',
+            'https://api.door43.org/01.sig',
+            'https://api.door43.org/02.mp3'
+        ]], url_checker.batches)
@@ -0,0 +1,63 @@
+# coding=utf-8
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from libraries.tools.process_utils import imap_processes
+from libraries.tools.ts_v2_utils import build_usx, build_json_source_from_usx, build_json_source_from_usfm, \
+    build_book_source, ChunkIndexRegistry
+
+
+class TestUsfmSource(TestCase):
+    resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_usfm_source_')
+        self.usfm_dir = os.path.join(self.resources_dir, 'usfm')
+        self.registry = ChunkIndexRegistry()
+        self.registry.add('psa', [{'chp': str(c).zfill(3), 'firstvs': '001'} for c in range(1, 151)])
+        self.registry.add('tit', [{'chp': str(c).zfill(3), 'firstvs': '001'} for c in range(1, 4)])
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _book(self, pid, usfm_file):
+        return {
+            'process_id': 'en_ulb_{}'.format(pid),
+            'lid': 'en',
+            'pid': pid,
+            'modified': '2018-01-02',
+            'usfm_file': os.path.join(self.usfm_dir, usfm_file),
+            'usx_dir': os.path.join(self.temp_dir, 'book_usx'),
+            'chunks': self.registry.get(pid)
+        }
+
+    def test_build_json_source_from_usfm(self):
+        usx_dir = os.path.join(self.temp_dir, 'usx')
+        build_usx(self.usfm_dir, usx_dir)
+        expected = build_json_source_from_usx(os.path.join(usx_dir, 'PSA.usx'), 'en', 'psa', '2018-01-02',
+                                              registry=self.registry)
+
+        book_usx_dir = os.path.join(self.temp_dir, 'book_usx')
+        os.makedirs(book_usx_dir)
+        source = build_json_source_from_usfm(os.path.join(self.usfm_dir, '19-PSA.usfm'), book_usx_dir, 'en', 'psa',
+                                             '2018-01-02', self.registry.get('psa'))
+        self.assertEqual(expected, source)
+        self.assertEqual(['PSA.usx'], os.listdir(book_usx_dir))
+
+    def test_build_book_source_in_processes(self):
+        os.makedirs(os.path.join(self.temp_dir, 'book_usx'))
+        books = [self._book('psa', '19-PSA.usfm'), self._book('tit', '57-TIT.usfm')]
+        expected = dict((book['pid'], build_book_source(book)) for book in books)
+
+        results = dict((book['pid'], source) for book, source in imap_processes(build_book_source, books, 2))
+        self.assertEqual(expected, results)
+
+    def test_build_book_source_error(self):
+        book = self._book('psa', '19-PSA.usfm')
+        book['usfm_file'] = os.path.join(self.usfm_dir, 'missing.usfm')
+        with self.assertRaises(Exception) as context:
+            build_book_source(book)
+        self.assertIn('Failed to generate usx for en_ulb_psa', str(context.exception))
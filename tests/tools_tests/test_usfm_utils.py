@@ -6,7 +6,7 @@ import tempfile
 from unittest import TestCase
 from libraries.tools.file_utils import read_file
 from libraries.tools.usfm_utils import usfm3_to_usfm2, simplify_strong, get_usfm3_word_strongs, parse_book_id, \
-    strip_word_data, convert_chunk_markers, tWPhrase, strip_tw_links, USFMWordReader
+    strip_word_data, convert_chunk_markers, tWPhrase, strip_tw_links, USFMWordReader, strip_milestones
 
 
 class TestUsfmUtils(TestCase):
@@ -214,4 +214,28 @@ class TestUsfmUtils(TestCase):
         expected_usfm2 = read_file(os.path.join(self.resources_dir, 'complex_tit.usfm2'))
 
         usfm2 = usfm3_to_usfm2(usfm3)
-        self.assertEqual(expected_usfm2, usfm2)
\ No newline at end of file
+        self.assertEqual(expected_usfm2, usfm2)
+
+    def test_usfm3_to_usfm2_matches_chained_conversion(self):
+        """
+        The single pass conversion must produce the same output as stripping
+        the milestones and word data one pattern at a time.
+        """
+        tests_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        samples = [
+            u'\\v 1 \\zaln-s | x-content="Παῦλος"\\*\\w I|x-occurrence="1"\\w*,\n\\w Paul|x-occurrence="1"\\w*\\zaln-e\\*.',
+            u'\\w a|x="1"\\w*\\zaln-e\\*\n\n\\zaln-s | x-content="b"\\*\n\\zaln-e\\*\n\\w b|x="1"\\w*',
+            u'\\p\n\n\\zaln-s | x-content="b"\\*\n\\zaln-e\\*\\k-e\\*\n\n\\ts\\*\n\\v 2 text',
+            u'\\v 1 \\k-s | x-tw="rc://*/tw/dict/bible/kt/god"\n\\zaln-e\\*\\zaln-s | x-content="c"\\*\n\n+ \\w c|x="1"\\w*',
+            u'\\w \\w*\\w a|x="1"\\w*, \\w|x="1"\\w*\\wj Jesus\\wj*\n  \n\t\\w b\\w* \\w c',
+            u'\\s5\n\\v 1 \\w a|x\\w*  \\s5 \\w b|x\\w*\n\n\\s5\n'
+        ]
+        for root, dirs, files in os.walk(tests_dir):
+            for name in files:
+                if name.endswith('.usfm') or name.endswith('.usfm3'):
+                    samples.append(read_file(os.path.join(root, name)))
+
+        for usfm3 in samples:
+            expected = convert_chunk_markers(strip_word_data(strip_milestones(usfm3)))
+            self.assertEqual(expected, usfm3_to_usfm2(usfm3))
+
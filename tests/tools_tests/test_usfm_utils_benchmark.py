@@ -0,0 +1,51 @@
+# coding=utf-8
+from __future__ import unicode_literals, print_function
+
+import os
+import time
+import unittest
+from unittest import TestCase
+
+from libraries.tools.file_utils import read_file
+from libraries.tools.usfm_utils import usfm3_to_usfm2, convert_chunk_markers, strip_word_data, strip_milestones
+
+
+@unittest.skipUnless(os.environ.get('BENCHMARK'), 'Set BENCHMARK=1 to run the benchmarks')
+class TestUsfmUtilsBenchmark(TestCase):
+    """
+    Converts large aligned books from USFM 3 to USFM 2. Run with:
+    BENCHMARK=1 python -m unittest tests.tools_tests.test_usfm_utils_benchmark
+    """
+    resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+    # the number of chapters in the books
+    books = [('PSA', 150), ('ISA', 66)]
+
+    def make_book(self, book, chapters):
+        """
+        Builds an aligned book by repeating the aligned chapter of Titus
+        """
+        usfm = read_file(os.path.join(self.resources_dir, 'usfm/57-TIT.usfm'))
+        header, chapter = usfm.split('\\c 1', 1)
+        # roughly the length of an aligned chapter of Psalms or Isaiah
+        chapter = chapter.replace('\\v 1', '\\s5\n\\v 1') * 4
+        header = header.replace('TIT', book)
+        return header + ''.join('\\c {}{}'.format(c, chapter) for c in range(1, chapters + 1))
+
+    def convert(self, converter, usfm3, runs=3):
+        best = None
+        for i in range(runs):
+            start = time.time()
+            converter(usfm3)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return len(usfm3.encode('utf-8')) / 1000000.0 / best
+
+    def test_usfm3_to_usfm2(self):
+        for book, chapters in self.books:
+            usfm3 = self.make_book(book, chapters)
+            chained = lambda usfm: convert_chunk_markers(strip_word_data(strip_milestones(usfm)))
+            self.assertEqual(chained(usfm3), usfm3_to_usfm2(usfm3))
+
+            print('\n{}: {:.1f} MB'.format(book, len(usfm3.encode('utf-8')) / 1000000.0))
+            print('chained patterns: {:.1f} MB/s'.format(self.convert(chained, usfm3)))
+            print('single pass: {:.1f} MB/s'.format(self.convert(usfm3_to_usfm2, usfm3)))
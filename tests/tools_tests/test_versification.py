@@ -1,5 +1,5 @@
 from libraries.tools.ts_v2_utils import build_json_source_from_usx, build_usx
-from libraries.tools.versification import  hebrew_to_ufw
+from libraries.tools.versification import  hebrew_to_ufw, map_verse, _hebrew_to_ufw_rules, ORIGINAL_VERSE_COUNTS
 from unittest import TestCase
 import tempfile
 import os
@@ -292,6 +292,27 @@ class TestVersification(TestCase):
         expected = {'book': book, 'chapter': 4, 'verse': 1}
         self.assertEqual(expected, ref.to_dict())
 
+    def test_lookup_matches_rules(self):
+        # every verse of the original canon plus the longer and extra chapters of the ufw versification
+        for book, counts in ORIGINAL_VERSE_COUNTS.items():
+            for chapter in range(0, len(counts) + 3):
+                max_verse = max(counts[max(chapter - 2, 0):chapter + 1] or [0]) + 25
+                for verse in range(0, max_verse):
+                    for from_original in [True, False]:
+                        expected = _hebrew_to_ufw_rules(book, chapter, verse, from_original)
+                        ref = hebrew_to_ufw(book, chapter, verse, from_original)
+                        self.assertEqual(expected.to_dict(), ref.to_dict())
+                        self.assertEqual((expected.c, expected.v), map_verse(book, chapter, verse, from_original))
+
+    def test_lookup_is_not_rebuilt(self):
+        first = map_verse('gen', 32, 1)
+        self.assertEqual((31, 55), first)
+        self.assertIs(first, map_verse('gen', 32, 1))
+
+    def test_books_outside_the_canon_use_the_rules(self):
+        self.assertEqual((1, 1), map_verse('mat', 1, 1))
+        self.assertEqual((1, 15), map_verse('nah', 2, 1))
+
     def test_processing_hbo(self):
         """
         Test downloading and processing some hebrew
@@ -0,0 +1,134 @@
+# coding=utf-8
+import json
+import threading
+import time
+from unittest import TestCase
+from libraries.tools.mocks import MockLogger
+from libraries.tools.webhook_dispatcher import TokenBucket, WebhookDispatcher, is_throttle_error
+
+
+class ThrottleError(Exception):
+
+    def __init__(self, code='TooManyRequestsException'):
+        Exception.__init__(self, code)
+        self.response = {'Error': {'Code': code}}
+
+
+class StubLambdaClient(object):
+    """
+    Records invocations and throttles the configured number of calls for each payload
+    """
+
+    def __init__(self, throttles=None, errors=None, latency=0):
+        self.throttles = dict(throttles or {})
+        self.errors = errors or []
+        self.latency = latency
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        name = json.loads(Payload)['name']
+        with self.lock:
+            self.calls.append((FunctionName, InvocationType, name))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.latency)
+            with self.lock:
+                if self.throttles.get(name):
+                    self.throttles[name] -= 1
+                    raise ThrottleError()
+            if name in self.errors:
+                raise ValueError('bad payload')
+            return {'StatusCode': 202}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(TestCase):
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(4, clock=clock.time, sleep=clock.sleep)
+        for _ in range(4):
+            self.assertEqual(0, bucket.acquire())
+        self.assertEqual([], clock.sleeps)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(1.0, clock.now)
+
+    def test_refill_is_capped(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, clock=clock.time, sleep=clock.sleep)
+        clock.now = 100
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual([0.5], clock.sleeps)
+
+
+class TestWebhookDispatcher(TestCase):
+
+    @staticmethod
+    def jobs(count):
+        return [('repo{}'.format(i), {'name': 'repo{}'.format(i)}) for i in range(count)]
+
+    def test_is_throttle_error(self):
+        self.assertTrue(is_throttle_error(ThrottleError()))
+        self.assertTrue(is_throttle_error(ThrottleError('ThrottlingException')))
+        self.assertFalse(is_throttle_error(ThrottleError('ResourceNotFoundException')))
+        self.assertFalse(is_throttle_error(ValueError()))
+
+    def test_dispatch_concurrently(self):
+        client = StubLambdaClient(latency=0.02)
+        dispatcher = WebhookDispatcher(client, 'webhook', rate=1000, max_workers=4)
+        self.assertEqual([True] * 12, dispatcher.dispatch(self.jobs(12)))
+        self.assertEqual({'dispatched': 12, 'failed': 0, 'throttled': 0}, dispatcher.stats)
+        self.assertEqual(4, client.peak)
+        self.assertEqual(('webhook', 'Event'), client.calls[0][:2])
+        self.assertEqual(sorted('repo{}'.format(i) for i in range(12)), sorted(call[2] for call in client.calls))
+
+    def test_rate_is_limited(self):
+        clock = FakeClock()
+        client = StubLambdaClient()
+        dispatcher = WebhookDispatcher(client, 'webhook', rate=5, max_workers=1,
+                                       clock=clock.time, sleep=clock.sleep)
+        dispatcher.dispatch(self.jobs(15))
+        self.assertEqual(15, len(client.calls))
+        # the first five use the saved up tokens
+        self.assertAlmostEqual(2.0, clock.now)
+
+    def test_throttled_are_retried(self):
+        sleeps = []
+        client = StubLambdaClient(throttles={'repo1': 2})
+        dispatcher = WebhookDispatcher(client, 'webhook', rate=1000, max_workers=1, backoff=0.5,
+                                       sleep=sleeps.append, rand=lambda: 0.5)
+        self.assertEqual([True, True, True], dispatcher.dispatch(self.jobs(3)))
+        self.assertEqual({'dispatched': 3, 'failed': 0, 'throttled': 2}, dispatcher.stats)
+        self.assertEqual([0.25, 0.5], sleeps)
+        self.assertEqual(['repo0', 'repo1', 'repo1', 'repo1', 'repo2'], [call[2] for call in client.calls])
+
+    def test_failures_are_reported(self):
+        logger = MockLogger()
+        client = StubLambdaClient(throttles={'repo0': 10}, errors=['repo2'])
+        dispatcher = WebhookDispatcher(client, 'webhook', rate=1000, max_workers=2, retries=2, logger=logger,
+                                       sleep=lambda s: None)
+        self.assertEqual([False, True, False], dispatcher.dispatch(self.jobs(3)))
+        self.assertEqual({'dispatched': 1, 'failed': 2, 'throttled': 3}, dispatcher.stats)
+        self.assertIn('Failed to trigger webhook repo2: bad payload', logger._messages)
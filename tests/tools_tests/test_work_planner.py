@@ -0,0 +1,102 @@
+# coding=utf-8
+from unittest import TestCase
+from libraries.tools.mocks import MockDynamodbHandler
+from libraries.tools.work_planner import WorkPlanner, TimeBudgetExceeded
+
+
+class TestWorkPlanner(TestCase):
+
+    def setUp(self):
+        self.db = MockDynamodbHandler()
+        self.keys = {'api_version': 'ts.2'}
+        self.now = [0]
+        self.remaining = [None]
+
+    def _planner(self, **kwargs):
+        return WorkPlanner(self.db, self.keys, sec_remaining=lambda: self.remaining[0], clock=lambda: self.now[0],
+                           **kwargs)
+
+    def _time(self, planner, unit, seconds):
+        planner.begin(unit)
+        self.now[0] += seconds
+        planner.end(unit)
+
+    def test_timings_are_saved(self):
+        planner = self._planner(weight=0.5)
+        self._time(planner, 'en', 100)
+        self._time(planner, 'fr', 10)
+        planner.save()
+        record = self.db.get_item({'api_version': 'ts.2.timings'})
+        self.assertEqual(self.keys, record['timings_of'])
+        self.assertEqual(2, record['metrics']['units'])
+        self.assertEqual(110000, record['metrics']['actual_ms'])
+        # fr is predicted from the timing of en
+        self.assertEqual(130000, record['metrics']['predicted_ms'])
+        self.assertEqual(55000, record['metrics']['actual_per_unit_ms'])
+
+        planner = self._planner(weight=0.5)
+        planner.load()
+        self.assertEqual(100, planner.estimate('en'))
+        self.assertEqual(10, planner.estimate('fr'))
+        # unknown units are given the average
+        self.assertEqual(55, planner.estimate('de'))
+
+        # timings are merged with the earlier timings
+        self._time(planner, 'en', 50)
+        self.assertEqual(75, planner.estimate('en'))
+
+    def test_no_time_limit(self):
+        planner = self._planner()
+        planner.timings = {'en': 100, 'fr': 10, 'de': 50}
+        self.assertEqual(['en', 'de', 'fr'], planner.plan(['fr', 'en', 'de']))
+        planner.begin('en')
+        self.assertEqual([], planner.deferred)
+
+    def test_plan_fits_budget(self):
+        self.remaining[0] = 220
+        planner = self._planner(reserve=20)
+        planner.timings = {'a': 150, 'b': 120, 'c': 60, 'd': 40, 'e': 30}
+        # two workers: a then d, b then c, e would finish after 200 seconds
+        self.assertEqual(['a', 'b', 'c', 'd'], planner.plan(['e', 'd', 'c', 'b', 'a'], workers=2))
+        self.assertEqual(['e'], planner.deferred)
+
+        planner = self._planner(reserve=20)
+        planner.timings = {'a': 150, 'b': 120, 'c': 60, 'd': 40, 'e': 30}
+        self.assertEqual(['a', 'd'], planner.plan(['e', 'd', 'c', 'b', 'a']))
+
+    def test_begin_stops_when_out_of_time(self):
+        self.remaining[0] = 200
+        planner = self._planner(reserve=60)
+        planner.timings = {'en': 100, 'fr': 200}
+        planner.begin('en')
+        with self.assertRaises(TimeBudgetExceeded):
+            planner.begin('fr')
+        self.assertEqual(['fr'], planner.deferred)
+        planner.save()
+        self.assertEqual(1, self.db.get_item({'api_version': 'ts.2.timings'})['metrics']['deferred'])
+
+    def test_cancel(self):
+        planner = self._planner()
+        planner.begin('en')
+        self.now[0] += 5
+        planner.cancel('en')
+        planner.end('en')
+        self.assertNotIn('en', planner.timings)
+        self.assertEqual(0, planner.metrics()['units'])
+
+    def test_load_missing(self):
+        planner = self._planner(default_cost=30)
+        planner.load()
+        self.assertEqual(30, planner.estimate('en'))
+
+    def test_finished_units_are_free(self):
+        self.remaining[0] = 220
+        planner = self._planner(reserve=20)
+        planner.timings = {'a': 150, 'b': 120, 'c': 60}
+        # a was finished by an earlier run so b and c fit
+        self.assertEqual(['b', 'c', 'a'], planner.plan(['a', 'b', 'c'], finished=['a']))
+        self.assertEqual([], planner.deferred)
+        self.remaining[0] = 100
+        planner.begin('a')
+        with self.assertRaises(TimeBudgetExceeded):
+            planner.begin('b')
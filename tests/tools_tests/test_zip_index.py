@@ -0,0 +1,85 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase
+from libraries.tools.thread_utils import map_concurrent
+from libraries.tools.zip_index import ZipIndex
+
+
+class TestZipIndex(TestCase):
+    resources_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'webhook', 'resources')
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_zip_index_')
+        self.zip_file = os.path.join(self.temp_dir, 'repo.zip')
+        with zipfile.ZipFile(self.zip_file, 'w') as zf:
+            zf.writestr('En_Obs/', b'')
+            zf.writestr('En_Obs/manifest.yaml', b'\xef\xbb\xbfdublin_core: {}\r\n')
+            zf.writestr('En_Obs/content/01/01.md', b'one')
+            zf.writestr('En_Obs/content/02/01.md', b'two')
+            zf.writestr('En_Obs/content/front/title.md', b'title')
+            zf.writestr('other/manifest.yaml', b'other')
+        self.index = ZipIndex(self.zip_file, 'en_obs', os.path.join(self.temp_dir, 'en_obs'))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_queries(self):
+        self.assertTrue(self.index.isdir('.'))
+        self.assertTrue(self.index.isfile('manifest.yaml'))
+        self.assertTrue(self.index.isfile('./manifest.yaml'))
+        self.assertFalse(self.index.isfile('media.yaml'))
+        self.assertFalse(self.index.isfile('content'))
+        # directories without entries of their own are inferred from the files
+        self.assertTrue(self.index.isdir('./content'))
+        self.assertTrue(self.index.isdir('content/01/'))
+        self.assertEqual(['content', 'manifest.yaml'], self.index.listdir('.'))
+        self.assertEqual(['01', '02', 'front'], self.index.listdir('./content'))
+        self.assertEqual(3, self.index.getsize('content/02/01.md'))
+        self.assertEqual(b'two', self.index.read('content/02/01.md'))
+        with self.assertRaises(IOError):
+            self.index.read('other/manifest.yaml')
+        with self.assertRaises(OSError):
+            self.index.listdir('missing')
+
+    def test_missing_root(self):
+        index = ZipIndex(self.zip_file, 'en_ulb', self.temp_dir)
+        self.assertFalse(index.isdir('.'))
+        index.close()
+
+    def test_extract_is_lazy(self):
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'en_obs')))
+        path = self.index.extract('./content/01/01.md')
+        self.assertEqual(os.path.join(self.temp_dir, 'en_obs', 'content', '01', '01.md'), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(b'one', f.read())
+        self.assertEqual(path, self.index.extract('content/01/01.md'))
+        self.assertEqual(['content'], os.listdir(os.path.join(self.temp_dir, 'en_obs')))
+
+    def test_repository_archive(self):
+        temp_dir = os.path.join(self.temp_dir, 'en_ulb')
+        index = ZipIndex(os.path.join(self.resources_dir, 'en_ulb.zip'), 'en_ulb', temp_dir)
+        self.assertTrue(index.isfile('manifest.yaml'))
+        self.assertEqual(204032, index.getsize('01-GEN.usfm'))
+        self.assertIn('01-GEN.usfm', index.listdir('.'))
+        self.assertFalse(os.path.exists(temp_dir))
+        index.close()
+
+    def test_concurrent_extract(self):
+        zip_file = os.path.join(self.temp_dir, 'bundle.zip')
+        names = ['{:02d}-book.usfm'.format(i) for i in range(40)]
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name in names:
+                zf.writestr('bundle/' + name, (name + '\n') * 5000)
+        index = ZipIndex(zip_file, 'bundle', os.path.join(self.temp_dir, 'bundle'))
+        paths = map_concurrent(index.extract, names, 8)
+        self.assertEqual([os.path.join(self.temp_dir, 'bundle', name) for name in names], paths)
+        for name, path in zip(names, paths):
+            with open(path, 'rb') as f:
+                self.assertEqual((name + '\n') * 5000, f.read())
+        self.assertLessEqual(len(index._handles), 9)
+        index.close()
+        self.assertEqual([], index._handles)
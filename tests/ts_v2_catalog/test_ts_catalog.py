@@ -6,6 +6,7 @@ from unittest import TestCase
 from libraries.tools.file_utils import load_json_object, read_file
 from libraries.tools.mocks import MockS3Handler, MockAPI, MockDynamodbHandler, MockLogger
 from libraries.lambda_handlers.ts_v2_catalog_handler import TsV2CatalogHandler
+from libraries.tools.work_planner import WorkPlanner
 from libraries.tools.test_utils import assert_s3_equals_api_json, assert_json_files_equal
 from libraries.tools.ts_v2_utils import build_usx, index_chunks, convert_rc_links
 import tempfile
@@ -129,6 +130,72 @@ some more text
                     #     self.assertIn(terms_map_path, mockS3._uploads, url_err_msg.format(terms_map_path))
 
 
+    @patch('libraries.lambda_handlers.ts_v2_catalog_handler.context_sec_remaining')
+    def test_out_of_time(self, mock_sec_remaining, mock_reporter):
+        mock_sec_remaining.return_value = 60
+        mockV3Api = MockAPI(os.path.join(self.resources_dir, 'v3_api'), 'https://api.door43.org/')
+        mockV3Api.add_host(os.path.join(self.resources_dir, 'v3_cdn'), 'https://test-cdn.door43.org/')
+
+        mockS3 = MockS3Handler('ts_bucket')
+        mockDb = MockDynamodbHandler()
+        mockDb._load_db(os.path.join(TestTsV2Catalog.resources_dir, 'ready_inprogress_db.json'))
+
+        mockLog = MockLogger()
+        converter = TsV2CatalogHandler(event=self.make_event(),
+                                       context=None,
+                                       logger=mockLog,
+                                       s3_handler=mockS3,
+                                       dynamodb_handler=mockDb,
+                                       url_handler=mockV3Api.get_url,
+                                       download_handler=mockV3Api.download_file,
+                                       url_exists_handler=lambda url: True)
+        result = converter.run()
+
+        self.assertFalse(result)
+        self.assertNotIn('v2/ts/catalog.json', mockS3._recent_uploads)
+        status = mockDb.get_item({'api_version': TsV2CatalogHandler.api_version})
+        self.assertEqual('in-progress', status['state'])
+        timings = mockDb.get_item({'api_version': '{}.timings'.format(TsV2CatalogHandler.api_version)})
+        self.assertEqual(0, timings['metrics']['units'])
+        self.assertTrue(timings['metrics']['deferred'] > 0)
+
+    @patch('libraries.lambda_handlers.ts_v2_catalog_handler.context_sec_remaining')
+    def test_resume_after_out_of_time(self, mock_sec_remaining, mock_reporter):
+        # there is only time for one of the languages in each run
+        mock_sec_remaining.return_value = 230
+        mockV3Api = MockAPI(os.path.join(self.resources_dir, 'v3_api'), 'https://api.door43.org/')
+        mockV3Api.add_host(os.path.join(self.resources_dir, 'v3_cdn'), 'https://test-cdn.door43.org/')
+        mockV3Api.add_host(os.path.join(self.resources_dir, 'v3_cdn'), 'https://cdn.door43.org/')
+
+        mockS3 = MockS3Handler('ts_bucket')
+        mockDb = MockDynamodbHandler()
+        mockDb._load_db(os.path.join(TestTsV2Catalog.resources_dir, 'ready_new_db.json'))
+        planner = WorkPlanner(mockDb, {'api_version': TsV2CatalogHandler.api_version})
+        planner.timings = {'en': 100, 'en2': 90}
+        planner.save()
+
+        def run():
+            converter = TsV2CatalogHandler(event=self.make_event(),
+                                           context=None,
+                                           logger=MockLogger(),
+                                           s3_handler=mockS3,
+                                           dynamodb_handler=mockDb,
+                                           url_handler=mockV3Api.get_url,
+                                           download_handler=mockV3Api.download_file,
+                                           url_exists_handler=lambda url: True,
+                                           max_workers=1)
+            return converter.run()
+
+        self.assertFalse(run())
+        status = mockDb.get_item({'api_version': TsV2CatalogHandler.api_version})
+        self.assertEqual('in-progress', status['state'])
+
+        # the finished language does not use up the time of the next run
+        run()
+        status = mockDb.get_item({'api_version': TsV2CatalogHandler.api_version})
+        self.assertEqual('complete', status['state'])
+        self.assertIn('v2/ts/catalog.json', mockS3._recent_uploads)
+
     def test_convert_catalog(self, mock_reporter):
         mockV3Api = MockAPI(os.path.join(self.resources_dir, 'v3_api'), 'https://api.door43.org/')
         mockV3Api.add_host(os.path.join(self.resources_dir, 'v3_cdn'), 'https://test-cdn.door43.org/')
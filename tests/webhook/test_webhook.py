@@ -1,6 +1,7 @@
 import codecs
 import json
 import os
+import zipfile
 from mock import patch, mock, MagicMock
 
 from unittest import TestCase
@@ -24,6 +25,10 @@ class TestWebhook(TestCase):
         def insert_item(data):
             TestWebhook.MockDynamodbHandler.data = data
 
+        @staticmethod
+        def get_item(keys):
+            return None
+
     class MockS3Handler:
         uploads = []
 
@@ -293,6 +298,9 @@ class TestWebhook(TestCase):
         self.assertEqual(False, entry['signed'])
         self.assertEqual('en_ulb', entry['repo_name'])
         self.assertIn('temp/en_ulb/{}/en/ulb/v7/ulb.zip'.format(entry['commit_id']), self.MockS3Handler.uploads[0]['key'])
+        # only the books are extracted from the archive
+        self.assertEqual(os.path.join(handler.repo_dir, '01-GEN.usfm'), self.MockS3Handler.uploads[1]['path'])
+        self.assertEqual(3, len(handler.repo_index.extracted))
 
         assert_object_equals_file(self, json.loads(entry['package']), os.path.join(self.resources_dir, 'expected_ulb_package.json'))
 
@@ -348,4 +356,89 @@ class TestWebhook(TestCase):
                                  logger=mockLogger,
                                  s3_handler=self.MockS3Handler,
                                  dynamodb_handler=self.MockDynamodbHandler)
-        handler.run()
\ No newline at end of file
+        handler.run()
+
+    def test_webhook_localization_from_archive(self, mock_reporter, mock_url_exists):
+        request_file = os.path.join(self.resources_dir, 'localization-request.json')
+        with codecs.open(request_file, 'r', encoding='utf-8') as in_file:
+            request_json = json.loads(in_file.read())
+
+        def mock_download(url, dest):
+            with zipfile.ZipFile(dest, 'w') as zf:
+                zf.writestr('localization/README.md', b'readme')
+                zf.writestr('localization/en.json', b'\xef\xbb\xbf{"language": "English"}\r\n')
+                zf.writestr('localization/fr.json', b'{"language": "Fran\xc3\xa7ais"}')
+
+        mockLogger = MockLogger()
+        self.MockDynamodbHandler.data = None
+        self.MockS3Handler.reset()
+        handler = WebhookHandler(event=request_json,
+                                 context=None,
+                                 logger=mockLogger,
+                                 s3_handler=self.MockS3Handler,
+                                 dynamodb_handler=self.MockDynamodbHandler,
+                                 download_handler=mock_download)
+        handler.run()
+
+        entry = self.MockDynamodbHandler.data
+        self.assertEqual('localization', entry['repo_name'])
+        self.assertEqual({
+            'en': {'language': 'English'},
+            'fr': {'language': u'Fran\xe7ais'}
+        }, json.loads(entry['package']))
+        self.assertEqual({}, handler.repo_index.extracted)
+        self.assertFalse(os.path.exists(handler.temp_dir))
+
+    def test_webhook_redelivery_is_skipped(self, mock_reporter, mock_url_exists):
+        request_file = os.path.join(self.resources_dir, 'ulb-request.json')
+        with codecs.open(request_file, 'r', encoding='utf-8') as in_file:
+            request_json = json.loads(in_file.read())
+
+        mockDCS = MockAPI(self.resources_dir, 'https://git.door43.org/')
+        downloads = []
+
+        def mock_download(url, dest):
+            downloads.append(url)
+            mockDCS.download_file('en_ulb.zip', dest)
+
+        mock_db = MockDynamodbHandler()
+        mock_s3 = MockS3Handler()
+        uploads = []
+        upload_file = mock_s3.upload_file
+        mock_s3.upload_file = lambda path, key, cache_time=600: uploads.append(upload_file(path, key, cache_time))
+
+        def run_webhook():
+            handler = WebhookHandler(event=request_json,
+                                     context=None,
+                                     logger=MockLogger(),
+                                     s3_handler=mock_s3,
+                                     dynamodb_handler=mock_db,
+                                     download_handler=mock_download)
+            return handler.run()
+
+        run_webhook()
+        row = mock_db.get_item({'repo_name': 'en_ulb'})
+        self.assertEqual(4, len(uploads))
+        self.assertEqual(32, len(row['archive_md5']))
+
+        # the same commit and archive are not built again
+        result = run_webhook()
+        self.assertIn('Skipped en_ulb (2fbfd081f4)', result['message'])
+        result = run_webhook()
+        self.assertIn('Skipped en_ulb (2fbfd081f4)', result['message'])
+        self.assertEqual(4, len(uploads))
+        self.assertEqual(1, len(mock_db._db))
+        self.assertEqual(2, row['skipped_builds'])
+        self.assertEqual(3, len(downloads))
+
+        # a different archive is rebuilt
+        row['archive_md5'] = 'changed'
+        run_webhook()
+        self.assertEqual(8, len(uploads))
+
+        # dirty rows are rebuilt without downloading the archive twice
+        row['archive_md5'] = mock_db._last_inserted_item['archive_md5']
+        row['dirty'] = True
+        run_webhook()
+        self.assertEqual(12, len(uploads))
+        self.assertEqual(5, len(downloads))